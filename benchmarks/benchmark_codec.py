@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Compare the size and speed of shipping snapshots as status.xml documents,
+a codec block per snapshot, or one codec block for all of them, over a
+simulated cook of several controllers polled every 5 seconds.
+
+Usage: python benchmarks/benchmark_codec.py [-H HOSTS] [-r ROUNDS]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from lxml import objectify
+from cyberqinterface.codec import encodeSnapshots, decodeSnapshots
+from cyberqinterface.simulator import STATUS_XML
+from cyberqinterface.snapshot import decodeSnapshot
+
+def cook(hosts, rounds):
+    rng = random.Random(0)
+    base = decodeSnapshot(objectify.fromstring(STATUS_XML), None, 0)
+    snapshots = []
+    for i in range(rounds):
+        for number in range(hosts):
+            snapshots.append(base._replace(
+                host="10.0.%d.%d" % (number // 250, number % 250),
+                timestamp=1350000000 + i * 5 + number * 0.01,
+                COOK_TEMP=2250 + rng.randint(-15, 15),
+                FOOD1_TEMP=700 + i // 4,
+                OUTPUT_PERCENT=rng.choice((0, 0, 20, 40, 100))))
+    return snapshots
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-H", "--hosts", type=int, default=20)
+    parser.add_argument("-r", "--rounds", type=int, default=720)
+    args = parser.parse_args()
+
+    snapshots = cook(args.hosts, args.rounds)
+    count = len(snapshots)
+    single = [encodeSnapshots([snapshot]) for snapshot in snapshots]
+    block = encodeSnapshots(snapshots)
+
+    print "%d snapshots of %d hosts" % (count, args.hosts)
+    print "%-12s %12s %10s %12s %12s" % ("format", "bytes", "bytes/snap",
+                                         "encode k/s", "decode k/s")
+    print "%-12s %12d %10.1f %12s %12s" % (
+        "status.xml", len(STATUS_XML) * count, len(STATUS_XML), "-", "-")
+    encode = min(timeit.repeat(
+        lambda: [encodeSnapshots([s]) for s in snapshots], number=1,
+        repeat=3))
+    decode = min(timeit.repeat(lambda: [decodeSnapshots(b) for b in single],
+                               number=1, repeat=3))
+    total = sum(len(b) for b in single)
+    print "%-12s %12d %10.1f %12.1f %12.1f" % (
+        "codec/snap", total, total / float(count), count / encode / 1000,
+        count / decode / 1000)
+    encode = min(timeit.repeat(lambda: encodeSnapshots(snapshots),
+                               number=1, repeat=3))
+    decode = min(timeit.repeat(lambda: decodeSnapshots(block),
+                               number=1, repeat=3))
+    print "%-12s %12d %10.1f %12.1f %12.1f" % (
+        "codec", len(block), len(block) / float(count),
+        count / encode / 1000, count / decode / 1000)
+
+if __name__ == "__main__":
+    main()
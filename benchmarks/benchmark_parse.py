@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Compare the original parse path (decoded text, default parser) with the
+reused per-thread parser fed the raw response bytes, using the XML samples
+in docs/.
+
+Usage: python benchmarks/benchmark_parse.py [-n ITERATIONS]
+"""
+import argparse
+import io
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from lxml import objectify
+from cyberqinterface.cyberqinterface import CyberQInterface
+
+FIXTURES = ("cyberq_status.xml", "cyberq_all.xml", "cyberq_config.xml")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    cqi = CyberQInterface("localhost")
+    print "%-20s %12s %12s %8s" % ("document", "text us", "bytes us",
+                                   "speedup")
+    for name in FIXTURES:
+        with open(os.path.join(ROOT, "docs", name), "rb") as f:
+            data = f.read()
+        text = io.open(os.path.join(ROOT, "docs", name),
+                       encoding="utf-8").read()
+        old = min(timeit.repeat(lambda: objectify.fromstring(text),
+                                number=args.iterations, repeat=3))
+        new = min(timeit.repeat(lambda: cqi._getResponseObject(data),
+                                number=args.iterations, repeat=3))
+        print "%-20s %12.2f %12.2f %7.2fx" % (
+            name, old / args.iterations * 1e6, new / args.iterations * 1e6,
+            old / new)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Compare encoding fleet sweeps to JSON and msgpack from objectify trees,
+from Snapshot dictionaries and with the serialize module's direct encoders.
+
+Usage: python benchmarks/benchmark_serialize.py [-H HOSTS] [-s SWEEPS]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from lxml import objectify
+from cyberqinterface.serialize import snapshotsToJSON, snapshotsToMsgpack
+from cyberqinterface.simulator import STATUS_XML
+from cyberqinterface.snapshot import decodeSnapshot
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def treeToDict(tree):
+    return dict((child.tag, child.text) for child in tree.iterchildren())
+
+def sweep(hosts):
+    trees = [objectify.fromstring(STATUS_XML) for number in range(hosts)]
+    snapshots = [decodeSnapshot(tree, "10.0.%d.%d" % (n // 250, n % 250),
+                                1350000000 + n * 0.01)
+                 for n, tree in enumerate(trees)]
+    return trees, snapshots
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-H", "--hosts", type=int, default=200)
+    parser.add_argument("-s", "--sweeps", type=int, default=50)
+    args = parser.parse_args()
+
+    trees, snapshots = sweep(args.hosts)
+    cases = [
+        ("tree json", lambda: json.dumps([treeToDict(t) for t in trees])),
+        ("dict json", lambda: json.dumps([s._asdict() for s in snapshots])),
+        ("direct json", lambda: snapshotsToJSON(snapshots)),
+    ]
+    if msgpack is not None:
+        cases.extend([
+            ("tree msgpack",
+             lambda: msgpack.packb([treeToDict(t) for t in trees],
+                                   use_bin_type=True)),
+            ("dict msgpack",
+             lambda: msgpack.packb([s._asdict() for s in snapshots],
+                                   use_bin_type=True)),
+        ])
+    cases.append(("direct msgpack", lambda: snapshotsToMsgpack(snapshots)))
+
+    print "%d sweeps of %d hosts" % (args.sweeps, args.hosts)
+    print "%-16s %10s %12s %12s" % ("encoder", "bytes", "ms/sweep",
+                                    "k snaps/s")
+    for name, encode in cases:
+        seconds = min(timeit.repeat(encode, number=args.sweeps,
+                                    repeat=3)) / args.sweeps
+        print "%-16s %10d %12.2f %12.1f" % (name, len(encode()),
+                                            seconds * 1000,
+                                            args.hosts / seconds / 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Compare the per-poll latency of the transports against a local
+SimulatedCyberQ. Each poll is a getStatus() call: request, parse and all.
+
+Usage: python benchmarks/benchmark_transport.py [-n POLLS]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from cyberqinterface.cyberqinterface import CyberQInterface
+from cyberqinterface.simulator import SimulatedCyberQ, DOCUMENTS
+from cyberqinterface.transport import (RequestsTransport, SocketTransport,
+                                       FakeTransport)
+
+def measure(cqi, polls):
+    latencies = []
+    for i in range(polls):
+        started = time.time()
+        cqi.getStatus()
+        latencies.append(time.time() - started)
+    latencies.sort()
+    return (sum(latencies) / len(latencies) * 1e3,
+            latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--polls", type=int, default=2000)
+    args = parser.parse_args()
+
+    simulator = SimulatedCyberQ().start()
+    transports = [("requests", RequestsTransport()),
+                  ("requests pooled", RequestsTransport(pooled=True)),
+                  ("socket", SocketTransport()),
+                  ("fake", FakeTransport(DOCUMENTS))]
+    print "%-16s %10s %10s %10s" % ("transport", "mean ms", "p50 ms",
+                                    "p99 ms")
+    try:
+        for name, transport in transports:
+            cqi = CyberQInterface(simulator.host, transport=transport)
+            print "%-16s %10.3f %10.3f %10.3f" % ((name,) +
+                                                  measure(cqi, args.polls))
+            transport.close()
+    finally:
+        simulator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Streaming detection of failing probes.
+
+AnomalyDetector is a Poller listener. It keeps a fixed amount of state per
+probe: an EWMA mean and variance, a short window for a median filter, and
+the last reading. Each new reading can raise:
+
+* open - a probe that had a valid reading started reporting OPEN. Probes
+  that are OPEN from the start, such as unused food probes, are not
+  reported.
+* spike - the reading is far from the median of the recent readings, in
+  units of the EWMA standard deviation
+* rate - the temperature moved faster than any pit or food can
+* flatline - the reading has not changed at all for a long time, which a
+  working probe in a live cook never does
+
+Thresholds can be set per controller. evaluate() runs the same detection
+over a recorded history.
+"""
+import math
+from collections import namedtuple, deque
+
+from snapshot import PROBES
+
+# Detection settings, temperatures in degrees. alpha weighs new readings in
+# the EWMA, window is the median filter length, a spike must be spikeSigma
+# standard deviations and at least minDeviation degrees from the median,
+# maxRate is in degrees per second and flatlineSeconds is how long an
+# unchanged reading is accepted.
+Thresholds = namedtuple("Thresholds", ["alpha", "window", "spikeSigma",
+                                       "minDeviation", "maxRate",
+                                       "flatlineSeconds"])
+Thresholds.__new__.__defaults__ = (0.2, 5, 6.0, 15.0, 10.0, 900.0)
+
+# One finding. value is the reading in tenths of a degree, None for open.
+Anomaly = namedtuple("Anomaly", ["host", "probe", "kind", "timestamp",
+                                 "value"])
+
+
+class _ProbeState:
+    """Running statistics of one probe"""
+
+    def __init__(self, size):
+        self.mean = None
+        self.variance = 0.0
+        self.window = deque(maxlen=size)
+        self.last = None
+        self.lastTime = None
+        self.flatSince = None
+        self.flatReported = False
+        self.open = False
+
+
+class AnomalyDetector:
+    """
+    Flag OPEN, spiking, racing and flatlined probes as snapshots arrive.
+    """
+
+    def __init__(self, thresholds=None, sink=None, probes=PROBES):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<Thresholds>** Settings for controllers without their
+          own
+        * (optional) **<callable>** Called with each Anomaly as it is found
+        * (optional) **<tuple>** Probes to watch
+
+        **Example Usage:**
+        .. code-block:: python
+        detector = AnomalyDetector(sink=alert)
+        detector.configure("10.0.1.5", Thresholds(maxRate=20.0))
+        poller.addListener(detector.update)
+        """
+        self.thresholds = thresholds or Thresholds()
+        self.sink = sink
+        self.probes = probes
+        self.hostThresholds = {}
+        self._states = {}
+
+    def configure(self, host, thresholds):
+        """Use thresholds for one controller, None restores the default"""
+        if thresholds is None:
+            self.hostThresholds.pop(host, None)
+        else:
+            self.hostThresholds[host] = thresholds
+        for probe in self.probes:
+            self._states.pop((host, probe), None)
+
+    def removeHost(self, host):
+        """Forget the state of a controller"""
+        for probe in self.probes:
+            self._states.pop((host, probe), None)
+
+    def _check(self, host, probe, value, timestamp, settings):
+        key = (host, probe)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _ProbeState(settings.window)
+        if value is None:
+            if state.open:
+                return None
+            hadReading = state.last is not None
+            # Statistics start again when the probe is reconnected
+            state = self._states[key] = _ProbeState(settings.window)
+            state.open = True
+            return "open" if hadReading else None
+        state.open = False
+        kind = None
+        if state.last is not None:
+            elapsed = timestamp - state.lastTime
+            if (elapsed > 0 and
+                    abs(value - state.last) > settings.maxRate * 10 *
+                    elapsed):
+                kind = "rate"
+            if value == state.last:
+                if (not state.flatReported and
+                        timestamp - state.flatSince >=
+                        settings.flatlineSeconds):
+                    state.flatReported = True
+                    kind = "flatline"
+            else:
+                state.flatSince = timestamp
+                state.flatReported = False
+        else:
+            state.flatSince = timestamp
+        window = state.window
+        if kind is None and len(window) == window.maxlen:
+            median = sorted(window)[len(window) // 2]
+            deviation = abs(value - median)
+            limit = max(settings.spikeSigma * math.sqrt(state.variance),
+                        settings.minDeviation * 10)
+            if deviation > limit:
+                kind = "spike"
+        window.append(value)
+        if state.mean is None:
+            state.mean = float(value)
+        else:
+            difference = value - state.mean
+            state.mean += settings.alpha * difference
+            state.variance = ((1 - settings.alpha) *
+                              (state.variance +
+                               settings.alpha * difference * difference))
+        state.last = value
+        state.lastTime = timestamp
+        return kind
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: check every probe of a snapshot
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - ignored
+
+        Returns:
+        <list> Anomaly tuples found in this snapshot
+        """
+        settings = self.hostThresholds.get(snapshot.host, self.thresholds)
+        found = []
+        for probe in self.probes:
+            value = getattr(snapshot, probe + "_TEMP")
+            kind = self._check(snapshot.host, probe, value,
+                               snapshot.timestamp, settings)
+            if kind is not None:
+                anomaly = Anomaly(snapshot.host, probe, kind,
+                                  snapshot.timestamp, value)
+                found.append(anomaly)
+                if self.sink is not None:
+                    self.sink(anomaly)
+        return found
+
+    def evaluate(self, snapshots):
+        """
+        Run detection over a recorded history with fresh state. Snapshots of
+        each host must be oldest first. Thresholds set with configure() are
+        kept.
+
+        Keyword arguments:
+        <iterable> snapshots - recorded Snapshot tuples
+
+        Returns:
+        <list> every Anomaly found
+
+        Example Usage:
+        anomalies = AnomalyDetector().evaluate(recorded)
+        """
+        detector = AnomalyDetector(self.thresholds, probes=self.probes)
+        detector.hostThresholds = dict(self.hostThresholds)
+        found = []
+        for snapshot in snapshots:
+            found.extend(detector.update(snapshot))
+        return found
@@ -0,0 +1,249 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Column codec for runs of snapshots.
+
+Consecutive snapshots of a CyberQ differ by a few tenths of a degree, so a
+block of them is stored column by column:
+
+* temperatures, TIMER_CURR and the timestamp (in milliseconds) as the
+  difference from the previous snapshot of the same host
+* setpoints, status codes, OUTPUT_PERCENT, TIMER_STATUS and DEG_UNITS as
+  runs of equal values
+* the host and probe names as runs of indexes into a string table
+
+Every number is written as a zigzag varint. encodeSnapshots() and
+decodeSnapshots() handle one block. writeBlock() and readBlocks() frame
+blocks in a file for recordings. ShardedPoller uses the same blocks to ship
+each round of snapshots from its workers.
+"""
+import struct
+
+from snapshot import (Snapshot, SNAPSHOT_FIELDS, TEMPERATURE_FIELDS,
+                      SETPOINT_FIELDS, STATUS_FIELDS, NAME_FIELDS)
+
+MAGIC = "CQS1"
+
+_DELTA_FIELDS = TEMPERATURE_FIELDS + ("TIMER_CURR",)
+_RUN_FIELDS = (SETPOINT_FIELDS + STATUS_FIELDS +
+               ("OUTPUT_PERCENT", "TIMER_STATUS", "DEG_UNITS"))
+_FRAME = struct.Struct("<I")
+
+
+def _writeVarint(out, value):
+    """Append an unsigned int as LEB128"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _readVarint(data, offset):
+    """Return (value, next offset) of a LEB128 int in a bytearray"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _token(value):
+    """0 for None, zigzag + 1 otherwise"""
+    return 0 if value is None else _zigzag(value) + 1
+
+
+def _untoken(token):
+    return None if token == 0 else _unzigzag(token - 1)
+
+
+def _writeRuns(out, tokens):
+    run = 0
+    current = None
+    for token in tokens:
+        if token == current:
+            run += 1
+            continue
+        if run:
+            _writeVarint(out, current)
+            _writeVarint(out, run)
+        current = token
+        run = 1
+    if run:
+        _writeVarint(out, current)
+        _writeVarint(out, run)
+
+
+def _readRuns(data, offset, count):
+    tokens = []
+    while len(tokens) < count:
+        token, offset = _readVarint(data, offset)
+        run, offset = _readVarint(data, offset)
+        tokens.extend([token] * run)
+    return tokens, offset
+
+
+def encodeSnapshots(snapshots):
+    """
+    Encode a run of snapshots into one block
+
+    Keyword arguments:
+    <list> snapshots - Snapshot tuples of any number of hosts, in order
+
+    Returns:
+    <String> bytes that decodeSnapshots() turns back into the snapshots.
+    Timestamps are kept to the millisecond.
+
+    Example Usage:
+    block = encodeSnapshots(poller.pollOnce())
+    """
+    out = bytearray(MAGIC)
+    _writeVarint(out, len(snapshots))
+
+    table = {None: 0}
+    texts = []
+    textColumns = {}
+    for field in ("host",) + NAME_FIELDS:
+        column = textColumns[field] = []
+        for snapshot in snapshots:
+            text = getattr(snapshot, field)
+            index = table.get(text)
+            if index is None:
+                index = table[text] = len(texts) + 1
+                texts.append(text)
+            column.append(index)
+    _writeVarint(out, len(texts))
+    for text in texts:
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        _writeVarint(out, len(text))
+        out.extend(text)
+    for field in ("host",) + NAME_FIELDS:
+        _writeRuns(out, textColumns[field])
+
+    hosts = textColumns["host"]
+    previous = {}
+    for snapshot, host in zip(snapshots, hosts):
+        milliseconds = int(round(snapshot.timestamp * 1000))
+        _writeVarint(out, _zigzag(milliseconds - previous.get(host, 0)))
+        previous[host] = milliseconds
+
+    for field in _DELTA_FIELDS:
+        values = [getattr(snapshot, field) for snapshot in snapshots]
+        _writeRuns(out, [int(value is not None) for value in values])
+        previous = {}
+        for value, host in zip(values, hosts):
+            if value is not None:
+                _writeVarint(out, _zigzag(value - previous.get(host, 0)))
+                previous[host] = value
+
+    for field in _RUN_FIELDS:
+        _writeRuns(out, [_token(getattr(snapshot, field))
+                         for snapshot in snapshots])
+    return str(out)
+
+
+def decodeSnapshots(data):
+    """
+    Decode a block made by encodeSnapshots()
+
+    Keyword arguments:
+    <String> data - block bytes
+
+    Returns:
+    <list> Snapshot tuples in their original order
+
+    Raises: ValueError if data is not a block
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a snapshot block")
+    data = bytearray(data)
+    offset = len(MAGIC)
+    count, offset = _readVarint(data, offset)
+
+    size, offset = _readVarint(data, offset)
+    texts = [None]
+    for i in range(size):
+        length, offset = _readVarint(data, offset)
+        texts.append(str(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+    columns = {}
+    for field in ("host",) + NAME_FIELDS:
+        indexes, offset = _readRuns(data, offset, count)
+        columns[field] = [texts[index] for index in indexes]
+
+    hosts = columns["host"]
+    previous = {}
+    timestamps = []
+    for host in hosts:
+        delta, offset = _readVarint(data, offset)
+        milliseconds = previous.get(host, 0) + _unzigzag(delta)
+        previous[host] = milliseconds
+        timestamps.append(milliseconds / 1000.0)
+    columns["timestamp"] = timestamps
+
+    for field in _DELTA_FIELDS:
+        present, offset = _readRuns(data, offset, count)
+        previous = {}
+        values = []
+        for flag, host in zip(present, hosts):
+            if not flag:
+                values.append(None)
+                continue
+            delta, offset = _readVarint(data, offset)
+            value = previous[host] = previous.get(host, 0) + _unzigzag(delta)
+            values.append(value)
+        columns[field] = values
+
+    for field in _RUN_FIELDS:
+        tokens, offset = _readRuns(data, offset, count)
+        columns[field] = [_untoken(token) for token in tokens]
+
+    ordered = [columns[field] for field in SNAPSHOT_FIELDS]
+    return [Snapshot._make(row) for row in zip(*ordered)]
+
+
+def writeBlock(stream, snapshots):
+    """
+    Append a length framed block to a file
+
+    Keyword arguments:
+    <file> stream - opened in binary mode
+    <list> snapshots
+
+    Example Usage:
+    with open("pit1.cqs", "ab") as f:
+        writeBlock(f, batch)
+    """
+    block = encodeSnapshots(snapshots)
+    stream.write(_FRAME.pack(len(block)))
+    stream.write(block)
+
+
+def readBlocks(stream):
+    """
+    Yield the snapshots of every block in a file written by writeBlock()
+
+    Keyword arguments:
+    <file> stream - opened in binary mode
+    """
+    while True:
+        header = stream.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return
+        (length,) = _FRAME.unpack(header)
+        for snapshot in decodeSnapshots(stream.read(length)):
+            yield snapshot
@@ -0,0 +1,282 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Multi-stage cook programs run from the client.
+
+A CookProgram is a list of stages for one CyberQ, for example smoke at 225
+until FOOD1 passes 160, then 275 until it reaches 203, then hold. A
+ProgramRunner is a Poller listener: each snapshot advances the program of
+its host, and only settings that differ from what was last sent are queued
+for sendUpdate. Writes to one host are merged while they wait, and are sent
+by flush() or by worker threads so the polling loop never waits on a
+controller. One host never has two writes in flight, so they arrive in the
+order they were made.
+"""
+import threading
+from collections import namedtuple
+from Queue import Queue
+
+from cyberqinterface import CyberQInterface
+from cyberqinterface_exceptions import *
+
+STAGE_PROBES = ("FOOD1", "FOOD2", "FOOD3")
+
+# One step of a CookProgram. cookSet is the pit setpoint, cookHold and ramp
+# the optional COOKHOLD and COOK_RAMP values, all in sendUpdate units. The
+# stage ends when probe (FOOD1-3) reaches target or after duration seconds,
+# whichever comes first. The last stage never ends.
+Stage = namedtuple("Stage", ["cookSet", "probe", "target", "duration",
+                             "cookHold", "ramp"])
+Stage.__new__.__defaults__ = (None,) * 5
+
+
+class CookProgram:
+    """
+    The stages of one controller and how far it has progressed.
+    """
+
+    def __init__(self, host, stages):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * **<String>** Hostname or IP of the CyberQ, as in its snapshots
+        * **<list>** Stage tuples, run in order
+
+        **Raises:** ParameterValidationException for an invalid stage
+
+        **Example Usage:**
+        .. code-block:: python
+        program = CookProgram("10.0.1.5", [
+            Stage(225, probe="FOOD1", target=160),
+            Stage(275, probe="FOOD1", target=203),
+            Stage(275, cookHold=170)])
+        """
+        if not stages:
+            raise ParameterValidationException("Program has no stages",
+                                               stages)
+        for stage in stages:
+            if stage.probe is not None and stage.probe not in STAGE_PROBES:
+                raise ParameterValidationException("Unknown stage probe",
+                                                   stage.probe)
+            if (stage.probe is None) != (stage.target is None):
+                raise ParameterValidationException(
+                    "Stage needs both probe and target", stage)
+        self.host = host
+        self.stages = list(stages)
+        self.index = 0
+        self.started = None
+        # parameter: value last queued for the controller
+        self.sent = {}
+
+    @property
+    def stage(self):
+        return self.stages[self.index]
+
+    def _complete(self, stage, snapshot):
+        if stage.probe is not None:
+            value = getattr(snapshot, stage.probe + "_TEMP")
+            if value is not None and value >= stage.target * 10:
+                return True
+        if stage.duration is not None:
+            return snapshot.timestamp - self.started >= stage.duration
+        return False
+
+    def _parameters(self, stage):
+        parameters = {"COOK_SET": str(stage.cookSet)}
+        if stage.cookHold is not None:
+            parameters["COOKHOLD"] = str(stage.cookHold)
+        if stage.ramp is not None:
+            parameters["COOK_RAMP"] = str(stage.ramp)
+        return parameters
+
+    def evaluate(self, snapshot):
+        """
+        Advance past completed stages and work out the settings to change
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of the controller
+
+        Returns:
+        <Dictionary> sendUpdate parameters that differ from what was last
+        sent, empty if nothing needs writing
+        """
+        if self.started is None:
+            self.started = snapshot.timestamp
+        while (self.index < len(self.stages) - 1 and
+               self._complete(self.stage, snapshot)):
+            self.index += 1
+            self.started = snapshot.timestamp
+        changes = {}
+        for key, value in self._parameters(self.stage).items():
+            if self.sent.get(key) == value:
+                continue
+            if (key == "COOK_SET" and snapshot.COOK_SET is not None and
+                    snapshot.COOK_SET == int(round(float(value) * 10))):
+                # The controller already runs at this setpoint
+                self.sent[key] = value
+                continue
+            changes[key] = value
+        self.sent.update(changes)
+        return changes
+
+    def forget(self, parameters):
+        """Mark parameters as unsent so the next evaluation retries them"""
+        for key, value in parameters.items():
+            if self.sent.get(key) == value:
+                del self.sent[key]
+
+
+class ProgramRunner:
+    """
+    Evaluate the cook programs of many controllers from one listener.
+    """
+
+    def __init__(self, interfaces=None, headers=None):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<Dictionary>** host: CyberQInterface to write through,
+          such as poller.interfaces. Missing hosts get their own interface.
+        * (optional) **<Dictionary>** Headers for interfaces created here
+
+        **Example Usage:**
+        .. code-block:: python
+        runner = ProgramRunner(poller.interfaces)
+        runner.addProgram(program)
+        poller.addListener(runner.update)
+        runner.start()
+        poller.run()
+        """
+        self.interfaces = interfaces if interfaces is not None else {}
+        self.headers = headers
+        self.programs = {}
+        self.pending = {}
+        self.errors = {}
+        self.writes = 0
+        # Guards pending, writes, _sending and the sent values of programs
+        self._lock = threading.Lock()
+        # Hosts with a write in flight
+        self._sending = set()
+        self._queue = Queue()
+        self._workers = []
+
+    def addProgram(self, program):
+        """Run a program, replacing any other program of its host"""
+        self.programs[program.host] = program
+
+    def removeProgram(self, host):
+        """Stop running the program of a host, dropping unsent writes"""
+        with self._lock:
+            self.programs.pop(host, None)
+            self.pending.pop(host, None)
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: advance the program of the snapshot's host and
+        queue the settings it needs
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - ignored
+        """
+        program = self.programs.get(snapshot.host)
+        if program is None:
+            return
+        with self._lock:
+            changes = program.evaluate(snapshot)
+            if not changes:
+                return
+            waiting = self.pending.get(snapshot.host)
+            if waiting is not None:
+                waiting.update(changes)
+                return
+            self.pending[snapshot.host] = changes
+            if snapshot.host in self._sending:
+                # Queued again when the write in flight finishes
+                return
+        if self._workers:
+            self._queue.put(snapshot.host)
+
+    def _interface(self, host):
+        cqi = self.interfaces.get(host)
+        if cqi is None:
+            cqi = self.interfaces[host] = CyberQInterface(host, self.headers)
+        return cqi
+
+    def sendPending(self, host):
+        """
+        Send the queued settings of one host
+
+        Returns:
+        <Boolean> True if sent. False if nothing was queued or a write to
+        the host is already in flight. On failure the exception is kept in
+        self.errors[host] and the settings are retried on the next snapshot.
+        """
+        with self._lock:
+            if host in self._sending:
+                return False
+            parameters = self.pending.pop(host, None)
+            if not parameters:
+                return False
+            self._sending.add(host)
+        sent = False
+        try:
+            self._interface(host).sendUpdate(parameters)
+            sent = True
+        except Exception as e:
+            self.errors[host] = e
+        with self._lock:
+            self._sending.discard(host)
+            if sent:
+                self.writes += 1
+            else:
+                program = self.programs.get(host)
+                if program is not None:
+                    program.forget(parameters)
+            requeue = self._workers and host in self.pending
+        if sent:
+            self.errors.pop(host, None)
+        if requeue:
+            self._queue.put(host)
+        return sent
+
+    def flush(self):
+        """Send every queued write from the calling thread"""
+        for host in list(self.pending.keys()):
+            self.sendPending(host)
+
+    def start(self, workers=4):
+        """
+        Send queued writes from background threads
+
+        Keyword arguments:
+        (optional) <int> workers - writes in flight at once
+        """
+        for host in list(self.pending.keys()):
+            self._queue.put(host)
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def _work(self):
+        while True:
+            host = self._queue.get()
+            if host is None:
+                return
+            self.sendPending(host)
+
+    def stop(self):
+        """Stop the worker threads after the writes in flight"""
+        workers, self._workers = self._workers, []
+        for thread in workers:
+            self._queue.put(None)
+        for thread in workers:
+            thread.join()
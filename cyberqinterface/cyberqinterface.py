@@ -44,17 +44,69 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
-import requests
+import copy
+import hashlib
+import threading
+import time
+
 from lxml import objectify
 
 from cyberqinterface_exceptions import *
+from transport import RequestsTransport
+from snapshot import decodeSnapshot
+from state import decodeState
+from timer import TIMER_PARAMETERS
+
+# Text values of the integer codes in the API, see _lookup()
+LOOKUP_TABLES = {
+    "status" : ["OK", "HIGH", "LOW", "DONE", "ERROR", "HOLD", "ALARM",
+                "SHUTDOWN"],
+    "temperature" : ["CELSIUS", "FAHRENHEIT"],
+    "ramp" : ["OFF", "FOOD1", "FOOD2", "FOOD3"]
+    }
+
+# Parameters status.xml and all.xml report, so an update of only these can
+# be confirmed from the lighter document. status.xml names CYCTIME and
+# PROPBAND COOK_CYCTIME and COOK_PROPBAND.
+STATUS_PARAMETERS = frozenset(["DEG_UNITS", "COOK_RAMP", "CYCTIME",
+                               "PROPBAND"])
+ALL_PARAMETERS = STATUS_PARAMETERS | frozenset(
+    [probe + suffix for probe in ("COOK", "FOOD1", "FOOD2", "FOOD3")
+     for suffix in ("_NAME", "_SET")])
+_DOCUMENT_ALIASES = {"CYCTIME": "COOK_CYCTIME", "PROPBAND": "COOK_PROPBAND"}
+# status.xml name: name of the same value in config.xml
+_STATUS_ALIASES = dict((status, name)
+                       for name, status in _DOCUMENT_ALIASES.items())
+
+# Seconds the document read by sendUpdate(confirm=True) answers the next
+# read of that document without a request
+CONFIRMED_REUSE = 2.0
+
+_parsers = threading.local()
+
+def _getParser():
+    """
+    Return this thread's objectify parser. lxml parsers are not thread safe
+    but are cheap to reuse, so each thread builds one on first use. Comments
+    and indentation are dropped and nothing is fetched from the network.
+    """
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = objectify.makeparser(remove_comments=True,
+                                      remove_blank_text=True,
+                                      resolve_entities=False,
+                                      no_network=True,
+                                      load_dtd=False)
+        _parsers.parser = parser
+    return parser
 
 class CyberQInterface:
     """
     Web Interface to BBQ Guru's CyberQ Temperature Controller System.
     """
 
-    def __init__(self, host=None, headers=None):
+    def __init__(self, host=None, headers=None, slowRefresh=None,
+                 transport=None, history=None, profiler=None):
         """
         **Description:**
         Initialiazer
@@ -62,6 +114,18 @@ class CyberQInterface:
         ** Keyword arguments:**
         * **<String>**  The hostname or IP of the CyberQ
         * (optional) **<Dictionary>** Header Name: Header Value
+        * (optional) **<float>** Seconds to reuse the slow changing parts of
+          all.xml and config.xml (names, setpoints, SYSTEM, CONTROL, WIFI,
+          SMTP). Within that window getAll() and getConfig() only download
+          status.xml and merge it into the cached document. None disables
+          this and always downloads the full document.
+        * (optional) **<Transport>** HTTP client to use, see transport.py.
+          Defaults to RequestsTransport.
+        * (optional) **<SnapshotHistory>** Records a decoded snapshot of
+          every getStatus(), getAll() and getConfig() read, see history.py.
+          None keeps no history.
+        * (optional) **<Profiler>** Times the poll, request, parse and
+          lookup phases of every call, see profiling.py. None times nothing.
 
         Returns:
         <object> CyberQInterface
@@ -80,6 +144,9 @@ class CyberQInterface:
                                 "CYCTIME", "PROPBAND", "MENU_SCROLLING",
                                 "LCD_BACKLIGHT", "LCD_CONTRAST", "DEG_UNITS",
                                 "ALARM_BEEPS", "KEY_BEEPS"]
+        self.temperatureParameters = ["COOK_SET", "FOOD1_SET", "FOOD2_SET",
+                                      "FOOD3_SET", "COOKHOLD", "ALARMDEV",
+                                      "PROPBAND"]
 
         if headers == None:
             self.headers = {"Content-type": "application/x-www-form-urlencoded",
@@ -89,11 +156,32 @@ class CyberQInterface:
             
         self.host = host
         self.url = "http://"+host+"/"
-
-    def sendUpdate(self, parameters):
+        self.slowRefresh = slowRefresh
+        if transport is None:
+            transport = RequestsTransport()
+        self.transport = transport
+        self.history = history
+        self.profiler = profiler
+        self.metrics = {"requests": 0, "bytesReceived": 0, "bytesSaved": 0,
+                        "parsesSkipped": 0}
+        # objectURI: (digest, object, length, time fetched). The cached
+        # objects are never handed out, callers get copies.
+        self._documents = {}
+        # Latest ControllerState, dropped by a successful update
+        self._state = None
+        self._stateVersion = 0
+        # (objectURI, object, time) of the read that confirmed an update
+        self._confirmed = None
+        # Confirming object already in the history, skipped when it answers
+        # the next read
+        self._recorded = None
+
+    def sendUpdate(self, parameters, confirm=False, timeout=10.0):
         """
         **Description:** 
-        sendUpdate validates new parameters and sends update to CyberQ
+        sendUpdate validates new parameters and sends update to CyberQ.
+        The return type depends on confirm: a Boolean without it, the
+        Snapshot of the confirming read with it.
 
         **Possible parameters:**
     
@@ -108,8 +196,8 @@ class CyberQInterface:
         FOOD2_SET       Food probe 2 target temp in current units
         FOOD3_NAME      Food 3 name in plain text
         FOOD3_SET       Food probe 3 target temp in current units
-        _COOK_TIMER     Set the countdown timer HH:MM:SS (must use urlencoded
-                        colons - \%3A
+        _COOK_TIMER     Set the countdown timer, plain HH:MM:SS. The form body
+                        is urlencoded when sent, so do not encode the colons
         COOK_TIMER      Same as above - looks like you need to set both to keep
                         changes across refresh?
         COOKHOLD        Cook and hold target temp in current units if timer is
@@ -130,12 +218,29 @@ class CyberQInterface:
         ALARM_BEEPS     Alarm beeps (0-5)
         KEY_BEEPS       Enable/Disable key beeps (0: Off, 1:On)
         ==============  ========================================================
+
+        timer.timerParameters(seconds) builds both timer keys from a
+        duration in the right format.
+
+        With confirm the CyberQ is read back, with growing pauses, until it
+        reports the new values. The lightest document holding every key is
+        used: status.xml, then all.xml, then config.xml. Temperatures are
+        compared in tenths of a degree F, within half a degree C when the
+        CyberQ runs in Celsius. The timers cannot be confirmed. The
+        confirming read answers the next read of the same document.
         
         **Keyword arguments:**
         *<dictionary>* Dictionary of values to be updated. Note: will be validated against list of known values
+        *<Boolean>* (optional) Wait until the CyberQ reports the new values
+        *<float>* (optional) Seconds to wait for confirmation
 
         **Returns:**
-        *<Boolean>* True if successful / False if not successful
+        *<Boolean>* Without confirm, True if successful / False if not
+        successful
+        *<Snapshot>* With confirm, snapshot of the confirming read
+
+        **Raises:** ResponseValidationException with {key: (expected,
+        reported)} if the update is not confirmed within timeout
 
         **Example Usage:**
 
@@ -148,9 +253,100 @@ class CyberQInterface:
         results = self._validateParameters(parameters)
         if results != {}:
             raise ParameterValidationException("Bad parameters passed", results)
-        response = requests.post(self.url, data=parameters,
-                                 headers=self.headers)
+        sent = self._postUpdate(parameters)
+        if not confirm:
+            return sent
+        return self._confirmUpdate(parameters, timeout)
+
+    def _confirmUpdate(self, parameters, timeout):
+        """
+        Read the CyberQ back until it reports sent parameters
+
+        Keyword arguments:
+        <dictionary> parameters - Key/Value pairs passed to sendUpdate
+        <float> timeout - seconds to keep trying
+
+        Returns:
+        <Snapshot> of the confirming read
+
+        Raises: ResponseValidationException
+
+        Example Usage:
+        private
+        """
+        objectURI, tree, mismatches = self._readBack(parameters, timeout)
+        if mismatches:
+            raise ResponseValidationException(
+                "Update not confirmed by CyberQ", mismatches)
+        now = time.time()
+        self._confirmed = (objectURI, tree, now)
+        if objectURI == "config.xml":
+            self._stateVersion += 1
+            self._state = decodeState(tree, self.host, self._stateVersion,
+                                      now)
+            snapshot = self._state.snapshot
+        else:
+            snapshot = decodeSnapshot(tree, self.host, now)
+        self._record(tree, snapshot)
+        self._recorded = tree
+        return snapshot
+
+    def _readBack(self, parameters, timeout, beforeRead=None):
+        """
+        Read the lightest document holding the sent parameters, with
+        growing pauses, until it reports them or timeout seconds have passed
+
+        Keyword arguments:
+        <dictionary> parameters - Key/Value pairs passed to sendUpdate
+        <float> timeout - seconds to keep trying
+        (optional) <callable> beforeRead - called before each read, such as
+        a pause between requests to the host
+
+        Returns:
+        (objectURI, object, mismatches) of the last read, mismatches as
+        returned by _unconfirmedParameters()
+
+        Example Usage:
+        private
+        """
+        keys = set(parameters) - set(TIMER_PARAMETERS)
+        if keys <= STATUS_PARAMETERS:
+            objectURI = "status.xml"
+        elif keys <= ALL_PARAMETERS:
+            objectURI = "all.xml"
+        else:
+            objectURI = "config.xml"
+        deadline = time.time() + timeout
+        delay = 0.1
+        while True:
+            if beforeRead is not None:
+                beforeRead()
+            tree = self._getDocumentObject(objectURI)
+            mismatches = self._unconfirmedParameters(parameters, tree)
+            remaining = deadline - time.time()
+            if not mismatches or remaining <= 0:
+                return objectURI, tree, mismatches
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 2.0)
+
+    def _postUpdate(self, parameters):
+        """
+        Send already validated parameters to the CyberQ
+
+        Keyword arguments:
+        <dictionary> parameters - Key/Value pairs for CyberQ settings
+
+        Returns:
+        <Boolean> True if successful
+
+        Example Usage:
+        private
+        """
+        response = self.transport.post(self.url, parameters, self.headers)
         if response.status_code == 200:
+            self._documents.clear()
+            self._state = None
+            self._confirmed = None
             return True
         else:
             raise ResponseHTTPException("%s Error: %s %s" %
@@ -178,12 +374,81 @@ class CyberQInterface:
                 badParameters[key] = "Not a valid parameter"
         return badParameters
 
+    def _documentValue(self, key, value):
+        """
+        Convert a sendUpdate value to the text config.xml reports for it.
+        Temperatures are sent in degrees F and reported in tenths of a degree
+        F. The timers cannot be compared because TIMER_CURR counts down.
+
+        Keyword arguments:
+        <String> key - parameter name
+        <String> value - value passed to sendUpdate
+
+        Returns:
+        <String> expected text or None if the key cannot be verified
+
+        Example Usage:
+        private
+        """
+        if key in ("_COOK_TIMER", "COOK_TIMER"):
+            return None
+        if key in self.temperatureParameters:
+            return str(int(round(float(value) * 10)))
+        if key.endswith("_NAME"):
+            return unicode(value)
+        try:
+            return str(int(round(float(value))))
+        except ValueError:
+            return unicode(value)
+
+    def _unconfirmedParameters(self, parameters, tree):
+        """
+        Compare sent parameters against a config or all object
+
+        Keyword arguments:
+        <dictionary> parameters - Key/Value pairs passed to sendUpdate
+        <object> tree - object from getConfig() or getAll()
+
+        Returns:
+        <dictionary> {key: (expected, reported)} for every parameter the
+        document does not reflect yet. Parameters the document does not
+        contain are left out.
+
+        Example Usage:
+        private
+        """
+        reported = {}
+        for element in tree.iter():
+            if isinstance(element.tag, basestring):
+                reported[element.tag] = element.text
+        # A CyberQ in Celsius stores whole degrees C
+        tolerance = 9 if reported.get("DEG_UNITS") == "0" else 0
+        mismatches = {}
+        for key, value in parameters.items():
+            expected = self._documentValue(key, value)
+            tag = key
+            if tag not in reported:
+                tag = _DOCUMENT_ALIASES.get(key)
+            if expected is None or tag not in reported:
+                continue
+            actual = reported[tag]
+            if actual is None:
+                actual = ""
+            if actual == expected:
+                continue
+            if (tolerance and key in self.temperatureParameters and
+                    actual.isdigit() and
+                    abs(int(actual) - int(expected)) <= tolerance):
+                continue
+            mismatches[key] = (expected, actual)
+        return mismatches
+
     def _getResponseObject(self, xml):
         """
         get data from CyberQ and return as an object
 
         Keyword arguments:
-        <string> objectType
+        <string> xml - raw bytes of the document, text is encoded as UTF-8
 
         Returns:
         Object of specifiedtype
@@ -191,8 +456,11 @@ class CyberQInterface:
         Example Usage:
         private
         """
+        if isinstance(xml, unicode):
+            xml = xml.encode("utf-8")
         try:
-            return objectify.fromstring(xml)
+            return self._profiled("parse", objectify.fromstring, xml,
+                                  _getParser())
         except(Exception):
             raise ResponseValidationException("Invalid XML from CyberQ",
                                               xml)
@@ -210,14 +478,167 @@ class CyberQInterface:
         Example Usage:
         private
         """
-        response = requests.get(self.url+objectURI)
+        return self._profiled("poll", self._getResponse, objectURI).text
+
+    def _getResponseBytes(self, objectURI):
+        """
+        get data from CyberQ and return the undecoded XML
+
+        Keyword arguments:
+        <string> objectURI
+
+        Returns:
+        XML bytes
+
+        Example Usage:
+        private
+        """
+        return self._getResponse(objectURI).content
+
+    def _getResponse(self, objectURI):
+        """
+        get data from CyberQ and return the HTTP response
+
+        Keyword arguments:
+        <string> objectURI
+
+        Returns:
+        Response from the transport
+
+        Example Usage:
+        private
+        """
+        response = self._profiled("request", self.transport.get,
+                                  self.url+objectURI)
+        self.metrics["requests"] += 1
         if response.status_code == 200:
-            return response.text
+            self.metrics["bytesReceived"] += len(response.content)
+            return response
         else:
             raise ResponseHTTPException("%s Error: %s %s" %
                                         (response.status_code, response.url,
                                          response.reason),response)
 
+    def _getDocumentObject(self, objectURI):
+        """
+        get data from CyberQ and return as an object, reusing the previous
+        object when the document has not changed since the last read
+
+        Keyword arguments:
+        <string> objectURI
+
+        Returns:
+        Object of specified type, the caller's own copy
+
+        Example Usage:
+        private
+        """
+        confirmed = self._confirmed
+        if confirmed is not None and confirmed[0] == objectURI:
+            self._confirmed = None
+            if time.time() - confirmed[2] <= CONFIRMED_REUSE:
+                return confirmed[1]
+        xml = self._getResponseBytes(objectURI)
+        digest = hashlib.md5(xml).digest()
+        cached = self._documents.get(objectURI)
+        if cached is not None and cached[0] == digest:
+            self.metrics["parsesSkipped"] += 1
+            obj = cached[1]
+        else:
+            obj = self._getResponseObject(xml)
+        self._documents[objectURI] = (digest, obj, len(xml), time.time())
+        return copy.deepcopy(obj)
+
+    def _getMergedObject(self, objectURI):
+        """
+        Return the object for all.xml or config.xml, downloading only
+        status.xml while the cached copy is younger than slowRefresh.
+        COOK_CYCTIME and COOK_PROPBAND of status.xml refresh CYCTIME and
+        PROPBAND.
+
+        Keyword arguments:
+        <string> objectURI
+
+        Returns:
+        Object of specified type
+
+        Example Usage:
+        private
+        """
+        cached = self._documents.get(objectURI)
+        if (self.slowRefresh is None or cached is None or
+                time.time() - cached[3] > self.slowRefresh):
+            return self._getDocumentObject(objectURI)
+
+        status = self._getDocumentObject("status.xml")
+        merged = copy.deepcopy(cached[1])
+        elements = {}
+        for element in merged.iter():
+            if (isinstance(element.tag, basestring) and
+                    element.countchildren() == 0):
+                elements[element.tag] = element
+        for element in list(status.iterchildren()):
+            target = elements.get(_STATUS_ALIASES.get(element.tag,
+                                                      element.tag))
+            if target is not None:
+                element.tag = target.tag
+                target.getparent().replace(target, element)
+        self.metrics["bytesSaved"] += (cached[2] -
+                                       self._documents["status.xml"][2])
+        return merged
+
+    def _profiled(self, phase, function, *args):
+        """
+        Call function, timing it as a phase if a profiler is set
+
+        Keyword arguments:
+        <String> phase - poll, request, parse or lookup
+        <callable> function
+        arguments of function
+
+        Returns:
+        What function returned
+
+        Example Usage:
+        private
+        """
+        if self.profiler is None:
+            return function(*args)
+        with self.profiler.phase(phase, self.host):
+            return function(*args)
+
+    def _record(self, obj, snapshot=None):
+        """
+        Add a snapshot of a read to the history, if one is kept. The object
+        that confirmed an update is recorded once, not again when it answers
+        the next read. A snapshot older than the newest recorded one is
+        dropped, so the read itself never fails here.
+
+        Keyword arguments:
+        <object> obj - object from a status, all or config read
+        (optional) <Snapshot> snapshot - already decoded from obj
+
+        Returns:
+        obj unchanged
+
+        Example Usage:
+        private
+        """
+        if self.history is None:
+            return obj
+        if obj is self._recorded:
+            self._recorded = None
+            return obj
+        if snapshot is None:
+            snapshot = decodeSnapshot(obj, self.host)
+        try:
+            self.history.add(snapshot)
+        except ValueError:
+            # The clock stepped back, or another thread recorded a later
+            # read first
+            pass
+        return obj
+
     def getConfig(self):
         """
         Get Configuration from CyberQ
@@ -231,7 +652,8 @@ class CyberQInterface:
         Example Usage:
         print cqi.getConfig().FOOD1_TEMP
         """
-        return self._getResponseObject(self.getConfigXML())
+        return self._record(self._profiled("poll", self._getMergedObject,
+                                           "config.xml"))
 
     def getStatus(self):
         """
@@ -246,7 +668,8 @@ class CyberQInterface:
         Example Usage:
         print cqi.getStatus().FOOD1_TEMP
         """
-        return self._getResponseObject(self.getStatusXML())
+        return self._record(self._profiled("poll", self._getDocumentObject,
+                                           "status.xml"))
 
     def getAll(self):
         """
@@ -261,7 +684,42 @@ class CyberQInterface:
         Example Usage:
         cqi.getAll()
         """
-        return self._getResponseObject(self.getAllXML())
+        return self._record(self._profiled("poll", self._getMergedObject,
+                                           "all.xml"))
+
+    def getState(self, maxAge=0):
+        """
+        **Description:**
+        Get temperatures, setpoints, CONTROL and SYSTEM settings from one
+        config.xml read, so they all describe the same moment. The state is
+        immutable and versioned, see state.py. A state younger than maxAge
+        seconds is returned again instead of reading the CyberQ, unless
+        sendUpdate() has succeeded since it was read.
+
+        **Keyword arguments:**
+        * (optional) **<float>** Seconds a previous state may be reused
+
+        **Returns:**
+        *<ControllerState>*
+
+        **Example Usage:**
+
+    .. code-block:: python
+
+            state = cqi.getState()
+            if state.snapshot.COOK_TEMP > state.snapshot.COOK_SET:
+                print state.control.PROPBAND
+        """
+        state = self._state
+        if (state is not None and maxAge > 0 and
+                time.time() - state.snapshot.timestamp < maxAge):
+            return state
+        tree = self._profiled("poll", self._getDocumentObject, "config.xml")
+        self._stateVersion += 1
+        state = decodeState(tree, self.host, self._stateVersion)
+        self._state = state
+        self._record(tree, state.snapshot)
+        return state
 
     def getConfigXML(self):
         """
@@ -325,19 +783,17 @@ class CyberQInterface:
         Example Usage:
         private
         """
-        codes = {
-        "status" : ["OK", "HIGH", "LOW", "DONE", "ERROR", "HOLD", "ALARM",
-                      "SHUTDOWN"],
-        "temperature" : ["CELSIUS", "FAHRENHEIT"],
-        "ramp" : ["OFF", "FOOD1", "FOOD2", "FOOD3"]
-            }
+        codes = LOOKUP_TABLES
         if isinstance(code, objectify.IntElement):
             code = int(code)
         
         if not codes.has_key(table):
             raise LookupException("No lookup table for: %s", table)
         try:
-            return codes[table][code]
+            if self.profiler is None:
+                return codes[table][code]
+            with self.profiler.phase("lookup", self.host):
+                return codes[table][code]
         except IndexError as e:
             raise LookupException("No value for code %s in lookup table %s" %
                                   (code, table), e)
@@ -0,0 +1,157 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Columnar export of recorded snapshots to Parquet or Arrow IPC files.
+
+SnapshotWriter collects snapshots column by column and writes a row group
+every rowGroupSize rows, so a whole season streams to disk with a bounded
+buffer. The files load straight into pandas with pandas.read_parquet() or
+pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_pandas().
+
+Host and probe names are dictionary encoded in Parquet files. Arrow IPC
+files store them as plain strings because older pyarrow releases cannot
+change a dictionary between record batches of one file.
+
+Requires pyarrow, which is not installed with CyberQInterface:
+
+    pip install pyarrow
+"""
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from snapshot import (TEMPERATURE_FIELDS, SETPOINT_FIELDS, STATUS_FIELDS,
+                      NAME_FIELDS)
+
+FORMATS = ("parquet", "arrow")
+
+
+def _schema(dictionaries):
+    if dictionaries:
+        names = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    else:
+        names = pyarrow.string()
+    fields = [pyarrow.field("timestamp", pyarrow.timestamp("ms")),
+              pyarrow.field("host", names)]
+    # Temperatures and setpoints in degrees F, null for an OPEN probe
+    for name in TEMPERATURE_FIELDS + SETPOINT_FIELDS:
+        fields.append(pyarrow.field(name, pyarrow.float32()))
+    for name in STATUS_FIELDS:
+        fields.append(pyarrow.field(name, pyarrow.int8()))
+    fields.append(pyarrow.field("OUTPUT_PERCENT", pyarrow.int8()))
+    # Remaining countdown in seconds
+    fields.append(pyarrow.field("TIMER_CURR", pyarrow.int32()))
+    fields.append(pyarrow.field("TIMER_STATUS", pyarrow.int8()))
+    fields.append(pyarrow.field("DEG_UNITS", pyarrow.int8()))
+    for name in NAME_FIELDS:
+        fields.append(pyarrow.field(name, names))
+    return pyarrow.schema(fields)
+
+
+class SnapshotWriter:
+    """
+    Stream snapshots into a Parquet or Arrow IPC file.
+    """
+
+    def __init__(self, path, format="parquet", rowGroupSize=65536,
+                 compression="snappy"):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * **<String>** Path of the file to create
+        * (optional) **<String>** parquet or arrow (Arrow IPC file)
+        * (optional) **<int>** Rows buffered before a row group is written
+        * (optional) **<String>** Parquet compression codec
+
+        **Raises:** ImportError if pyarrow is not installed
+
+        **Example Usage:**
+        .. code-block:: python
+        writer = SnapshotWriter("season.parquet")
+        poller.addListener(writer.add)
+        ...
+        writer.close()
+        """
+        if pyarrow is None:
+            raise ImportError("SnapshotWriter requires pyarrow: "
+                              "pip install pyarrow")
+        if format not in FORMATS:
+            raise ValueError("Unknown format: %s" % format)
+        self.path = path
+        self.format = format
+        self.rowGroupSize = rowGroupSize
+        self.rows = 0
+        self.schema = _schema(format == "parquet")
+        if format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(
+                path, self.schema, compression=compression)
+        else:
+            self._sink = pyarrow.OSFile(path, "wb")
+            self._writer = pyarrow.RecordBatchFileWriter(self._sink,
+                                                         self.schema)
+        self._columns = dict((name, []) for name in self.schema.names)
+
+    def add(self, snapshot, previous=None):
+        """
+        Buffer one snapshot, writing a row group when the buffer is full.
+        Accepts the Poller listener arguments.
+
+        Keyword arguments:
+        <Snapshot> snapshot
+        (optional) <Snapshot> previous - ignored
+        """
+        columns = self._columns
+        columns["timestamp"].append(int(snapshot.timestamp * 1000))
+        for name in TEMPERATURE_FIELDS + SETPOINT_FIELDS:
+            value = getattr(snapshot, name)
+            columns[name].append(None if value is None else value / 10.0)
+        for name in self.schema.names[2 + len(TEMPERATURE_FIELDS) * 2:]:
+            columns[name].append(getattr(snapshot, name))
+        columns["host"].append(snapshot.host)
+        if len(columns["timestamp"]) >= self.rowGroupSize:
+            self.flush()
+
+    def extend(self, snapshots):
+        """Buffer many snapshots"""
+        for snapshot in snapshots:
+            self.add(snapshot)
+
+    def flush(self):
+        """Write the buffered rows as one row group"""
+        count = len(self._columns["timestamp"])
+        if count == 0:
+            return
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            if isinstance(field.type, pyarrow.DictionaryType):
+                arrays.append(pyarrow.array(
+                    values, pyarrow.string()).dictionary_encode())
+            else:
+                arrays.append(pyarrow.array(values, field.type))
+            self._columns[field.name] = []
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.format == "parquet":
+            self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += count
+
+    def close(self):
+        """Write the remaining rows and finish the file"""
+        self.flush()
+        self._writer.close()
+        if self.format == "arrow":
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
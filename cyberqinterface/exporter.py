@@ -0,0 +1,205 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Prometheus exporter serving the latest poller snapshots.
+
+The exporter is a Poller listener. Each snapshot compares the values of its
+own host with the last ones and formats only the sample lines whose value
+changed. The lines of each family are kept in sorted order as they are
+added and removed, so the response body is one join of the cached lines,
+done once per change. A scrape never waits on a CyberQ and costs the same
+no matter how slow the fleet is.
+"""
+import bisect
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from snapshot import PROBES
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# name, type, help
+FAMILIES = (
+    ("cyberq_cook_temp", "gauge", "Pit temperature in degrees F"),
+    ("cyberq_food_temp", "gauge", "Food probe temperature in degrees F"),
+    ("cyberq_output_percent", "gauge", "Fan output in percent"),
+    ("cyberq_status", "gauge", "Probe status code, see statusLookup()"),
+)
+
+
+def _escape(value):
+    return (unicode(value).replace("\\", "\\\\").replace("\"", "\\\"")
+            .replace("\n", "\\n"))
+
+
+def _temperature(tenths):
+    return "%.1f" % (tenths / 10.0)
+
+
+def _line(family, key, value):
+    """Format the sample line of a value, key being (host, probe)"""
+    host, probe = key
+    labels = 'host="%s"' % _escape(host)
+    if probe is not None:
+        labels += ',probe="%s"' % probe
+    if family in ("cyberq_cook_temp", "cyberq_food_temp"):
+        text = _temperature(value)
+    else:
+        text = "%d" % value
+    return "%s{%s} %s\n" % (family, labels, text)
+
+
+class MetricsExporter:
+    """
+    Cache of pre-rendered Prometheus samples for a fleet.
+    """
+
+    def __init__(self):
+        """
+        **Description:**
+        Initializer
+
+        **Example Usage:**
+        .. code-block:: python
+        exporter = MetricsExporter()
+        poller.addListener(exporter.update)
+        exporter.start(9410)
+        poller.run()
+        """
+        # family name: {(host, probe): (value, sample line)}
+        self._samples = dict((family[0], {}) for family in FAMILIES)
+        # family name: sorted list of the (host, probe) keys in _samples
+        self._order = dict((family[0], []) for family in FAMILIES)
+        # host: set of (family name, key) currently rendered
+        self._hostKeys = {}
+        self._body = None
+        self._lock = threading.Lock()
+        self.server = None
+
+    def _values(self, snapshot):
+        """Yield (family, key, value) for every value in a snapshot"""
+        if snapshot.COOK_TEMP is not None:
+            yield ("cyberq_cook_temp", (snapshot.host, None),
+                   snapshot.COOK_TEMP)
+        for probe in PROBES[1:]:
+            value = getattr(snapshot, probe + "_TEMP")
+            if value is not None:
+                yield "cyberq_food_temp", (snapshot.host, probe), value
+        if snapshot.OUTPUT_PERCENT is not None:
+            yield ("cyberq_output_percent", (snapshot.host, None),
+                   snapshot.OUTPUT_PERCENT)
+        for probe in PROBES:
+            value = getattr(snapshot, probe + "_STATUS")
+            if value is not None:
+                yield "cyberq_status", (snapshot.host, probe), value
+
+    def _forget(self, family, key):
+        """Drop one sample, the lock held"""
+        del self._samples[family][key]
+        order = self._order[family]
+        del order[bisect.bisect_left(order, key)]
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: refresh the samples of one host
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - ignored, accepted for addListener()
+        """
+        seen = set()
+        changed = False
+        with self._lock:
+            for family, key, value in self._values(snapshot):
+                seen.add((family, key))
+                samples = self._samples[family]
+                sample = samples.get(key)
+                if sample is None:
+                    bisect.insort(self._order[family], key)
+                elif sample[0] == value:
+                    continue
+                samples[key] = (value, _line(family, key, value))
+                changed = True
+            # Probes that went OPEN disappear from the output
+            stale = self._hostKeys.get(snapshot.host, set()) - seen
+            for family, key in stale:
+                self._forget(family, key)
+                changed = True
+            self._hostKeys[snapshot.host] = seen
+            if changed:
+                self._body = None
+
+    def removeHost(self, host):
+        """Drop every sample of a host"""
+        with self._lock:
+            for family, key in self._hostKeys.pop(host, ()):
+                self._forget(family, key)
+            self._body = None
+
+    def render(self):
+        """
+        Return the exposition text for the whole fleet
+
+        Returns:
+        <String> UTF-8 encoded metrics, joined again only after a change
+        """
+        with self._lock:
+            if self._body is None:
+                parts = []
+                for name, kind, text in FAMILIES:
+                    parts.append("# HELP %s %s\n# TYPE %s %s\n" %
+                                 (name, text, name, kind))
+                    samples = self._samples[name]
+                    parts.extend(samples[key][1]
+                                 for key in self._order[name])
+                self._body = u"".join(parts).encode("utf-8")
+            return self._body
+
+    def start(self, port=9410, address=""):
+        """
+        Serve /metrics from a background thread
+
+        Keyword arguments:
+        (optional) <int> port
+        (optional) <String> address - interface to bind, all if empty
+
+        Returns:
+        <HTTPServer> the running server
+        """
+        self.server = _ExporterServer((address, port), _ExporterHandler)
+        self.server.exporter = self
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server
+
+    def stop(self):
+        """Stop the server started by start()"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class _ExporterServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,126 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Operations that act on many CyberQs at once.
+"""
+import threading
+import time
+from collections import namedtuple
+from Queue import Queue, Empty
+
+from cyberqinterface import CyberQInterface
+from cyberqinterface_exceptions import *
+
+# Outcome of pushConfig() for one host. mismatches holds
+# {key: (expected, reported)} for values config.xml did not reflect, error
+# holds the exception that stopped the push, if any.
+PushResult = namedtuple("PushResult", ["host", "sent", "confirmed",
+                                       "mismatches", "error", "elapsed"])
+
+
+class _HostSpacing:
+    """Keep consecutive requests to one host at least interval apart"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def wait(self, host):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _pushOne(cqi, parameters, spacing, verify, verifyTimeout):
+    """Send and optionally verify one host, never raising"""
+    started = time.time()
+    sent = False
+    mismatches = {}
+    try:
+        spacing.wait(cqi.host)
+        sent = cqi._postUpdate(parameters)
+        if verify:
+            mismatches = cqi._readBack(parameters, verifyTimeout,
+                                       lambda: spacing.wait(cqi.host))[2]
+    except Exception as e:
+        return PushResult(cqi.host, sent, False, mismatches, e,
+                          time.time() - started)
+    confirmed = verify and not mismatches
+    return PushResult(cqi.host, sent, confirmed, mismatches, None,
+                      time.time() - started)
+
+
+def pushConfig(hosts, parameters, concurrency=32, hostInterval=0.5,
+               verify=True, headers=None, verifyTimeout=10.0,
+               transport=None):
+    """
+    **Description:**
+    Send the same update to many CyberQs concurrently
+
+    The parameters are validated once for the whole fleet. Up to concurrency
+    hosts are updated at a time, requests to the same host are spaced at
+    least hostInterval seconds apart, and each host is read back, with
+    growing pauses, until it reports the new values or verifyTimeout
+    seconds have passed.
+
+    **Keyword arguments:**
+    * **<list>** Hostnames or IPs of the CyberQs
+    * **<Dictionary>** Parameters as accepted by CyberQInterface.sendUpdate
+    * (optional) **<int>** Most hosts with a request in flight
+    * (optional) **<float>** Least seconds between requests to one host
+    * (optional) **<Boolean>** Read the CyberQ back to confirm the update
+    * (optional) **<Dictionary>** Headers passed to each CyberQInterface
+    * (optional) **<float>** Seconds to wait for a host to report the new
+      values before it is reported with mismatches
+    * (optional) **<Transport>** Shared by every CyberQInterface, see
+      transport.py. It must be safe to use from several threads.
+
+    **Returns:**
+    *<list>* PushResult for each host, in the order of hosts
+
+    **Raises:** ParameterValidationException before anything is sent
+
+    **Example Usage:**
+
+    .. code-block:: python
+
+            results = pushConfig(pits, {'PROPBAND': '40', 'CYCTIME': '6'})
+            failed = [r.host for r in results if not r.confirmed]
+    """
+    interfaces = [CyberQInterface(host, headers, transport=transport)
+                  for host in hosts]
+    if not interfaces:
+        return []
+    problems = interfaces[0]._validateParameters(parameters)
+    if problems != {}:
+        raise ParameterValidationException("Bad parameters passed", problems)
+
+    spacing = _HostSpacing(hostInterval)
+    work = Queue()
+    for index in range(len(interfaces)):
+        work.put(index)
+    results = [None] * len(interfaces)
+
+    def worker():
+        while True:
+            try:
+                index = work.get_nowait()
+            except Empty:
+                return
+            results[index] = _pushOne(interfaces[index], parameters,
+                                      spacing, verify, verifyTimeout)
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(concurrency, len(interfaces)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,361 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Caching gateway between many clients and a few CyberQs.
+
+The gateway is the only thing talking to each controller. It refreshes
+status.xml every interval and all.xml/config.xml every slowInterval, and
+serves the cached documents to any number of clients byte for byte as the
+controller sent them. Updates posted by clients are forwarded one at a time
+per controller, after which every cached document is fetched again.
+
+all.xml and config.xml can be up to slowInterval old, as their Age header
+shows. With splice=True the values of the latest status.xml, temperatures
+among them, are spliced into them instead, so they are never older than
+status.xml, at the cost of no longer being the controller's bytes.
+
+Controllers are refreshed concurrently, each request with a timeout, so a
+controller that hangs does not hold up the others. Every response carries
+an Age header. A document whose last refresh failed is still served, with
+a Warning: 110 header, until it is expireIntervals intervals old. After that
+the gateway answers 502.
+
+A controller named "pit1" is reachable at http://gateway:port/pit1/, so an
+unmodified CyberQInterface("gateway:port/pit1") works through the gateway.
+When the gateway fronts a single controller it is also served at the root.
+"""
+import re
+import threading
+import time
+from Queue import Queue, Empty
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from cyberqinterface import CyberQInterface, _STATUS_ALIASES
+from cyberqinterface_exceptions import *
+from transport import RequestsTransport
+
+DOCUMENTS = ("status.xml", "all.xml", "config.xml")
+
+# Elements holding a value, as the CyberQ writes them
+_LEAF = re.compile(r"<([A-Za-z0-9_]+)>([^<]*)</\1>")
+
+
+def spliceStatus(document, status):
+    """
+    Replace the values of a cached all.xml or config.xml with those of a
+    newer status.xml, leaving every other byte unchanged
+
+    Keyword arguments:
+    <String> document - all.xml or config.xml bytes
+    <String> status - status.xml bytes
+
+    Returns:
+    <String> document bytes
+    """
+    values = {}
+    for match in _LEAF.finditer(status):
+        values[match.group(1)] = match.group(2)
+        alias = _STATUS_ALIASES.get(match.group(1))
+        if alias is not None:
+            values[alias] = match.group(2)
+
+    def replace(match):
+        value = values.get(match.group(1))
+        if value is None or value == match.group(2):
+            return match.group(0)
+        return "<%s>%s</%s>" % (match.group(1), value, match.group(1))
+    return _LEAF.sub(replace, document)
+
+
+class _Upstream:
+    """One controller with its cached documents"""
+
+    def __init__(self, name, host, headers, timeout, splice):
+        self.name = name
+        self.splice = splice
+        self.cqi = CyberQInterface(host, headers,
+                                   transport=RequestsTransport(
+                                       timeout=timeout))
+        self.lock = threading.Lock()
+        # objectURI: (bytes as fetched, time fetched)
+        self.documents = {}
+        # objectURI: (bytes served, time of the newest values in them)
+        self.served = {}
+        self.errors = {}
+
+    def _fetch(self, objectURI):
+        try:
+            data = self.cqi._getResponseBytes(objectURI)
+        except Exception as e:
+            self.errors[objectURI] = e
+            return None
+        self.errors.pop(objectURI, None)
+        self.documents[objectURI] = (data, time.time())
+        if objectURI == "status.xml":
+            for other in DOCUMENTS[1:]:
+                if other in self.documents:
+                    self._splice(other)
+            self.served[objectURI] = self.documents[objectURI]
+        else:
+            self._splice(objectURI)
+        return self.served[objectURI][0]
+
+    def _splice(self, objectURI):
+        data, fetched = self.documents[objectURI]
+        status = self.documents.get("status.xml")
+        if self.splice and status is not None and status[1] >= fetched:
+            data, fetched = spliceStatus(data, status[0]), status[1]
+        self.served[objectURI] = (data, fetched)
+
+    def stale(self, objectURI):
+        """True if the latest refresh of the document's values failed"""
+        if objectURI in self.errors:
+            return True
+        return objectURI != "status.xml" and "status.xml" in self.errors
+
+    def refresh(self, objectURI):
+        """Fetch a document from the controller into the cache"""
+        with self.lock:
+            return self._fetch(objectURI)
+
+    def get(self, objectURI):
+        """
+        Return (bytes, time of their newest values) of a cached document,
+        fetching it once if missing. None if it was never fetched.
+        """
+        cached = self.served.get(objectURI)
+        if cached is not None:
+            return cached
+        with self.lock:
+            cached = self.served.get(objectURI)
+            if cached is None and self._fetch(objectURI) is not None:
+                cached = self.served[objectURI]
+            return cached
+
+    def update(self, body):
+        """
+        Forward a client's urlencoded update unchanged and drop the cached
+        documents, so the next read fetches them again
+        """
+        with self.lock:
+            self.cqi._postUpdate(body)
+            for objectURI in DOCUMENTS:
+                self.documents.pop(objectURI, None)
+                self.served.pop(objectURI, None)
+
+
+class Gateway:
+    """
+    Poll each CyberQ once and serve the cached documents to many clients.
+    """
+
+    def __init__(self, controllers, interval=1.0, slowInterval=30.0,
+                 headers=None, timeout=5.0, concurrency=16,
+                 expireIntervals=3, splice=False):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * **<Dictionary>** Name: hostname or IP of each CyberQ. A list of
+          hosts uses each host as its own name.
+        * (optional) **<float>** Seconds between status.xml refreshes
+        * (optional) **<float>** Seconds between all.xml and config.xml
+          refreshes. Every document is also fetched again after an update.
+        * (optional) **<Dictionary>** Headers used towards the controllers
+        * (optional) **<float>** Seconds before a request to a controller
+          times out
+        * (optional) **<int>** Most controllers refreshed at once
+        * (optional) **<float>** Intervals after its last successful
+          refresh that a document is no longer served
+        * (optional) **<Boolean>** Splice the latest status.xml values into
+          all.xml and config.xml, see spliceStatus()
+
+        **Example Usage:**
+        .. code-block:: python
+        gateway = Gateway({"pit1": "10.0.1.5", "pit2": "10.0.1.6"})
+        gateway.start(8080)
+        cqi = CyberQInterface("localhost:8080/pit1")
+        """
+        if not isinstance(controllers, dict):
+            controllers = dict((host, host) for host in controllers)
+        self.interval = interval
+        self.slowInterval = slowInterval
+        self.concurrency = concurrency
+        self.expireIntervals = expireIntervals
+        self.upstreams = dict((name, _Upstream(name, host, headers, timeout,
+                                               splice))
+                              for name, host in controllers.items())
+        self.server = None
+        self._running = False
+
+    def _interval(self, objectURI):
+        if objectURI == "status.xml":
+            return self.interval
+        return self.slowInterval
+
+    def getDocument(self, name, objectURI):
+        """
+        Return the cached bytes of a document, fetching it if missing
+
+        Keyword arguments:
+        <String> name - controller name
+        <String> objectURI - status.xml, all.xml or config.xml
+
+        Returns:
+        <String> document bytes or None if the controller never answered
+        or the document expired
+        """
+        cached = self.getCached(name, objectURI)
+        return cached[0] if cached is not None else None
+
+    def getCached(self, name, objectURI):
+        """
+        Like getDocument(), returning (bytes, age in seconds, stale). stale
+        is True when the latest refresh failed.
+        """
+        upstream = self.upstreams[name]
+        cached = upstream.get(objectURI)
+        if cached is None:
+            return None
+        fetched = upstream.documents.get(objectURI, cached)[1]
+        if (time.time() - fetched >
+                self.expireIntervals * self._interval(objectURI)):
+            return None
+        return (cached[0], max(0.0, time.time() - cached[1]),
+                upstream.stale(objectURI))
+
+    def _refreshUpstream(self, upstream, now):
+        for objectURI in DOCUMENTS:
+            cached = upstream.documents.get(objectURI)
+            if (cached is None or
+                    now - cached[1] >= self._interval(objectURI)):
+                upstream.refresh(objectURI)
+
+    def pollOnce(self):
+        """
+        Refresh every document that is older than its interval, up to
+        concurrency controllers at a time
+        """
+        now = time.time()
+        work = Queue()
+        for upstream in self.upstreams.values():
+            work.put(upstream)
+
+        def worker():
+            while True:
+                try:
+                    upstream = work.get_nowait()
+                except Empty:
+                    return
+                self._refreshUpstream(upstream, now)
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.concurrency,
+                                      len(self.upstreams)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run(self):
+        """Refresh the caches until stop() is called"""
+        self._running = True
+        while self._running:
+            started = time.time()
+            self.pollOnce()
+            remaining = self.interval - (time.time() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def start(self, port=8080, address=""):
+        """
+        Serve clients and refresh the caches from background threads
+
+        Keyword arguments:
+        (optional) <int> port
+        (optional) <String> address - interface to bind, all if empty
+
+        Returns:
+        <HTTPServer> the running server
+        """
+        self.server = _GatewayServer((address, port), _GatewayHandler)
+        self.server.gateway = self
+        for target in (self.server.serve_forever, self.run):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self.server
+
+    def stop(self):
+        """Stop serving and polling"""
+        self._running = False
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _route(self, path):
+        """Split a request path into (controller name, document)"""
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts and parts[0] in self.upstreams:
+            return parts[0], "/".join(parts[1:])
+        if len(self.upstreams) == 1:
+            return self.upstreams.keys()[0], "/".join(parts)
+        return None, None
+
+
+class _GatewayServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, body="", contentType="text/xml", age=None,
+               stale=False):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        if age is not None:
+            self.send_header("Age", str(int(age)))
+        if stale:
+            self.send_header("Warning", '110 - "Response is Stale"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        gateway = self.server.gateway
+        name, objectURI = gateway._route(self.path)
+        if name is None or objectURI not in DOCUMENTS:
+            self.send_error(404)
+            return
+        cached = gateway.getCached(name, objectURI)
+        if cached is None:
+            self.send_error(502)
+            return
+        data, age, stale = cached
+        self._reply(200, data, age=age, stale=stale)
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        name, objectURI = gateway._route(self.path)
+        if name is None or objectURI:
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            gateway.upstreams[name].update(body)
+        except ResponseHTTPException as e:
+            self.send_error(getattr(e.errors, "status_code", 502))
+            return
+        except Exception:
+            self.send_error(502)
+            return
+        self._reply(200, contentType="text/plain")
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,189 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+In-memory index of the current state of a fleet.
+
+HealthIndex is a Poller listener. Each host is filed under a set of keys
+describing its latest snapshot: probe status names, OPEN probes, the
+temperature scale and a temperature band per probe. When a snapshot arrives
+only the keys that changed are moved, and a query returns the hosts filed
+under a key without looking at any other host.
+
+Keys are tuples:
+
+* ("status", "ALARM") and ("status", "ALARM", "FOOD1") - statusLookup names
+* ("open",) and ("open", "FOOD2") - probes reporting OPEN
+* ("units", "FAHRENHEIT") - temperatureLookup name of DEG_UNITS
+* ("band", "COOK", 4) - temperature in [4 * bandWidth, 5 * bandWidth)
+"""
+import threading
+
+from cyberqinterface import LOOKUP_TABLES
+from snapshot import PROBES
+
+
+def _name(table, code):
+    """Lookup table text of a code, the code itself if it is unknown"""
+    names = LOOKUP_TABLES[table]
+    if code is not None and 0 <= code < len(names):
+        return names[code]
+    return code
+
+
+class HealthIndex:
+    """
+    Hosts grouped by status, OPEN probes, units and temperature bands.
+    """
+
+    def __init__(self, bandWidth=50):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<int>** Width of the temperature bands in degrees
+
+        **Example Usage:**
+        .. code-block:: python
+        health = HealthIndex()
+        poller.addListener(health.update)
+        ...
+        alarms = health.withStatus("ALARM")
+        """
+        self.bandWidth = bandWidth
+        self.latest = {}
+        self._index = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _band(self, value):
+        return value // (self.bandWidth * 10)
+
+    def _keysOf(self, snapshot):
+        keys = set()
+        for probe in PROBES:
+            status = getattr(snapshot, probe + "_STATUS")
+            if status is not None:
+                name = _name("status", status)
+                keys.add(("status", name))
+                keys.add(("status", name, probe))
+            temperature = getattr(snapshot, probe + "_TEMP")
+            if temperature is None:
+                keys.add(("open",))
+                keys.add(("open", probe))
+            else:
+                keys.add(("band", probe, self._band(temperature)))
+        if snapshot.DEG_UNITS is not None:
+            keys.add(("units", _name("temperature", snapshot.DEG_UNITS)))
+        return keys
+
+    def _move(self, host, old, new):
+        for key in old - new:
+            hosts = self._index[key]
+            hosts.discard(host)
+            if not hosts:
+                del self._index[key]
+        for key in new - old:
+            self._index.setdefault(key, set()).add(host)
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: refile a host under the keys of its new snapshot
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - ignored
+        """
+        keys = self._keysOf(snapshot)
+        with self._lock:
+            self.latest[snapshot.host] = snapshot
+            old = self._keys.get(snapshot.host, frozenset())
+            if keys != old:
+                self._move(snapshot.host, old, keys)
+                self._keys[snapshot.host] = keys
+
+    def removeHost(self, host):
+        """Drop a host from the index"""
+        with self._lock:
+            self.latest.pop(host, None)
+            old = self._keys.pop(host, None)
+            if old:
+                self._move(host, old, frozenset())
+
+    def hosts(self, key):
+        """
+        Return the hosts filed under a key
+
+        Keyword arguments:
+        <tuple> key - see the module documentation
+
+        Returns:
+        <set> hosts, empty if none
+        """
+        with self._lock:
+            return set(self._index.get(key, ()))
+
+    def withStatus(self, status, probe=None):
+        """
+        Hosts with a probe in a status
+
+        Keyword arguments:
+        <String> status - statusLookup name such as ALARM
+        (optional) <String> probe - COOK, FOOD1, FOOD2 or FOOD3, any if None
+
+        Example Usage:
+        health.withStatus("ALARM") | health.withOpenProbe()
+        """
+        if probe is None:
+            return self.hosts(("status", status))
+        return self.hosts(("status", status, probe))
+
+    def withOpenProbe(self, probe=None):
+        """Hosts with an OPEN probe, or with the given probe OPEN"""
+        if probe is None:
+            return self.hosts(("open",))
+        return self.hosts(("open", probe))
+
+    def withUnits(self, units):
+        """Hosts using a temperatureLookup scale, CELSIUS or FAHRENHEIT"""
+        return self.hosts(("units", units))
+
+    def inBand(self, low, high, probe="COOK"):
+        """
+        Hosts whose probe reads between two temperatures
+
+        Keyword arguments:
+        <float> low - lowest temperature in degrees, inclusive
+        <float> high - highest temperature in degrees, inclusive
+        (optional) <String> probe
+
+        Returns:
+        <set> hosts
+        """
+        low = int(round(low * 10))
+        high = int(round(high * 10))
+        field = probe + "_TEMP"
+        found = set()
+        with self._lock:
+            first = self._band(low)
+            last = self._band(high)
+            for band in range(first, last + 1):
+                hosts = self._index.get(("band", probe, band), ())
+                if first < band < last:
+                    found.update(hosts)
+                    continue
+                # Edge bands also hold hosts outside the range
+                for host in hosts:
+                    if low <= getattr(self.latest[host], field) <= high:
+                        found.add(host)
+        return found
+
+    def counts(self):
+        """
+        Return {key: number of hosts} for every key in use, for dashboards
+        """
+        with self._lock:
+            return dict((key, len(hosts))
+                        for key, hosts in self._index.items())
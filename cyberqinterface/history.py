@@ -0,0 +1,192 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Bounded in-memory history of decoded snapshots.
+
+SnapshotHistory keeps the most recent snapshots of one controller, evicting
+the oldest once there are more than capacity of them or they are older
+than maxAge seconds. Pass one to CyberQInterface to record every
+getStatus(), getAll() and getConfig() read.
+
+Snapshots are kept in time order, so the ones of the last N seconds are
+found by bisection, and add() refuses a snapshot older than the newest
+one. add() evicts by the age of the snapshot it adds, so a recorded past
+cook keeps its last maxAge seconds. since(), minimum() and maximum() take
+the same now as expire(): pass the current time to a live history to
+evict what aged out since the last add(). The minimum and maximum of each tracked field are kept
+up to date in monotonic queues as snapshots are added and evicted, so
+minimum() and maximum() do not scan the history.
+"""
+import bisect
+import time
+from collections import deque
+
+from snapshot import TEMPERATURE_FIELDS
+
+TRACKED_FIELDS = TEMPERATURE_FIELDS + ("OUTPUT_PERCENT",)
+
+
+class SnapshotHistory:
+    """
+    The latest snapshots of one controller, bounded by count and age.
+    """
+
+    def __init__(self, capacity=720, maxAge=None, fields=TRACKED_FIELDS):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<int>** Most snapshots kept
+        * (optional) **<float>** Seconds a snapshot is kept, None for no limit
+        * (optional) **<tuple>** Fields with minimum() and maximum()
+
+        **Example Usage:**
+        .. code-block:: python
+        cqi = CyberQInterface("10.0.1.5",
+                              history=SnapshotHistory(720, maxAge=3600))
+        cqi.getStatus()
+        print cqi.history.maximum("COOK_TEMP")
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.maxAge = maxAge
+        self.fields = fields
+        # Live snapshots are _snapshots[_start:], sequence number of
+        # _snapshots[i] is _offset + i
+        self._snapshots = []
+        self._times = []
+        self._start = 0
+        self._offset = 0
+        # field: deques of (sequence, value), values rising for minimums
+        # and falling for maximums
+        self._minimums = dict((field, deque()) for field in fields)
+        self._maximums = dict((field, deque()) for field in fields)
+
+    def __len__(self):
+        return len(self._snapshots) - self._start
+
+    def add(self, snapshot):
+        """
+        Record a snapshot, evicting what no longer fits
+
+        Keyword arguments:
+        <Snapshot> snapshot - at least as new as every recorded one
+
+        Raises: ValueError if snapshot is older than the newest recorded
+        """
+        if len(self) and snapshot.timestamp < self._times[-1]:
+            raise ValueError("Snapshot at %s is older than the newest at %s"
+                             % (snapshot.timestamp, self._times[-1]))
+        sequence = self._offset + len(self._snapshots)
+        self._snapshots.append(snapshot)
+        self._times.append(snapshot.timestamp)
+        for field in self.fields:
+            value = getattr(snapshot, field)
+            if value is None:
+                continue
+            minimums = self._minimums[field]
+            while minimums and minimums[-1][1] >= value:
+                minimums.pop()
+            minimums.append((sequence, value))
+            maximums = self._maximums[field]
+            while maximums and maximums[-1][1] <= value:
+                maximums.pop()
+            maximums.append((sequence, value))
+        while len(self) > self.capacity:
+            self._evict()
+        if self.maxAge is not None:
+            self.expire(snapshot.timestamp)
+
+    def expire(self, now=None):
+        """Evict snapshots older than maxAge seconds before now"""
+        if self.maxAge is None:
+            return
+        if now is None:
+            now = time.time()
+        while len(self) and self._times[self._start] < now - self.maxAge:
+            self._evict()
+
+    def _evict(self):
+        sequence = self._offset + self._start
+        self._snapshots[self._start] = None
+        self._start += 1
+        for queues in (self._minimums, self._maximums):
+            for values in queues.values():
+                if values and values[0][0] == sequence:
+                    values.popleft()
+        if self._start > 64 and self._start * 2 > len(self._snapshots):
+            del self._snapshots[:self._start]
+            del self._times[:self._start]
+            self._offset += self._start
+            self._start = 0
+
+    def snapshots(self):
+        """Return every kept snapshot, oldest first"""
+        return self._snapshots[self._start:]
+
+    def latest(self):
+        """Return the newest snapshot, None if empty"""
+        if not len(self):
+            return None
+        return self._snapshots[-1]
+
+    def last(self, count):
+        """Return the newest count snapshots, oldest first"""
+        return self._snapshots[max(self._start,
+                                   len(self._snapshots) - count):]
+
+    def since(self, seconds, now=None):
+        """
+        Return the snapshots of the last seconds, oldest first
+
+        Keyword arguments:
+        <float> seconds
+        (optional) <float> now - end of the window, the newest snapshot if
+        None. Snapshots older than maxAge before now are evicted first.
+
+        Example Usage:
+        lastTenMinutes = cqi.history.since(600, time.time())
+        """
+        if now is not None:
+            self.expire(now)
+        if not len(self):
+            return []
+        if now is None:
+            now = self._times[-1]
+        first = bisect.bisect_left(self._times, now - seconds, self._start)
+        end = bisect.bisect_right(self._times, now, first)
+        return self._snapshots[first:end]
+
+    def minimum(self, field, now=None):
+        """
+        Lowest kept value of a tracked field, None if there is none. With
+        now, snapshots older than maxAge before it are evicted first.
+        """
+        if now is not None:
+            self.expire(now)
+        values = self._minimums[field]
+        return values[0][1] if values else None
+
+    def maximum(self, field, now=None):
+        """
+        Highest kept value of a tracked field, None if there is none. With
+        now, snapshots older than maxAge before it are evicted first.
+        """
+        if now is not None:
+            self.expire(now)
+        values = self._maximums[field]
+        return values[0][1] if values else None
+
+    def clear(self):
+        """Forget every snapshot"""
+        self._offset += len(self._snapshots)
+        self._snapshots = []
+        self._times = []
+        self._start = 0
+        for queues in (self._minimums, self._maximums):
+            for values in queues.values():
+                values.clear()
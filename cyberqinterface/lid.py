@@ -0,0 +1,145 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Lid-open episodes found in the pit temperature.
+
+Opening the lid makes COOK_TEMP fall far faster than the pit ever cools on
+its own, and the temperature climbs back once the lid is shut. LidDetector
+is a Poller listener that follows each controller through closed, dropping
+and open states with a few numbers of state per controller. It emits a
+LidEvent when the pit recovers, or when it has not recovered after
+maxDuration seconds.
+"""
+from collections import namedtuple
+
+# One lid-open episode. Times in seconds, temperatures in degrees. loss is
+# the drop from the temperature before the lid opened to the lowest one,
+# fanOutput the highest OUTPUT_PERCENT while open, recovered False if the
+# pit never came back within maxDuration.
+LidEvent = namedtuple("LidEvent", ["host", "start", "end", "duration",
+                                   "startTemp", "lowestTemp", "loss",
+                                   "fanOutput", "recovered"])
+
+CLOSED, DROPPING, OPEN = "closed", "dropping", "open"
+
+
+class _LidState:
+    """Where one controller is in a lid-open episode"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.last = None
+        self.lastTime = None
+        self.start = None
+        self.startTemp = None
+        self.lowest = None
+        self.fanOutput = None
+
+
+class LidDetector:
+    """
+    Detect lid-open episodes from COOK_TEMP and OUTPUT_PERCENT.
+    """
+
+    def __init__(self, dropRate=1.0, minDrop=15.0, recoveryMargin=5.0,
+                 maxDuration=1800, sink=None):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<float>** Degrees per second the pit must fall by to
+          start an episode
+        * (optional) **<float>** Degrees the pit must lose before the episode
+          counts as a lid opening
+        * (optional) **<float>** Degrees below the starting temperature the
+          pit must climb back to for the episode to end
+        * (optional) **<float>** Seconds after which an open episode is
+          reported as not recovered
+        * (optional) **<callable>** Called with each LidEvent
+
+        **Example Usage:**
+        .. code-block:: python
+        lids = LidDetector(sink=log.append)
+        poller.addListener(lids.update)
+        """
+        self.dropRate = dropRate
+        self.minDrop = minDrop
+        self.recoveryMargin = recoveryMargin
+        self.maxDuration = maxDuration
+        self.sink = sink
+        self._states = {}
+
+    def isOpen(self, host):
+        """True while a confirmed episode of host is in progress"""
+        state = self._states.get(host)
+        return state is not None and state.state == OPEN
+
+    def removeHost(self, host):
+        """Forget the state of a controller"""
+        self._states.pop(host, None)
+
+    def _event(self, host, state, end, recovered):
+        event = LidEvent(host, state.start, end, end - state.start,
+                         state.startTemp / 10.0, state.lowest / 10.0,
+                         (state.startTemp - state.lowest) / 10.0,
+                         state.fanOutput, recovered)
+        state.state = CLOSED
+        if self.sink is not None:
+            self.sink(event)
+        return event
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: follow the pit temperature of a controller
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - ignored
+
+        Returns:
+        <LidEvent> if an episode ended with this snapshot, otherwise None
+        """
+        host = snapshot.host
+        state = self._states.get(host)
+        if state is None:
+            state = self._states[host] = _LidState()
+        temperature = snapshot.COOK_TEMP
+        now = snapshot.timestamp
+        if temperature is None:
+            # An unplugged pit probe says nothing about the lid
+            state.state = CLOSED
+            state.last = None
+            return None
+        event = None
+        if state.state == CLOSED:
+            if state.last is not None and now > state.lastTime:
+                rate = (state.last - temperature) / (now - state.lastTime)
+                if rate >= self.dropRate * 10:
+                    state.state = DROPPING
+                    state.start = state.lastTime
+                    state.startTemp = state.last
+                    state.lowest = temperature
+                    state.fanOutput = snapshot.OUTPUT_PERCENT
+        else:
+            state.lowest = min(state.lowest, temperature)
+            if snapshot.OUTPUT_PERCENT is not None:
+                state.fanOutput = max(state.fanOutput,
+                                      snapshot.OUTPUT_PERCENT)
+            if state.state == DROPPING:
+                if state.startTemp - state.lowest >= self.minDrop * 10:
+                    state.state = OPEN
+                elif temperature >= state.last:
+                    # A short dip, not a lid
+                    state.state = CLOSED
+            if state.state == OPEN:
+                if (temperature >=
+                        state.startTemp - self.recoveryMargin * 10):
+                    event = self._event(host, state, now, True)
+                elif now - state.start >= self.maxDuration:
+                    event = self._event(host, state, now, False)
+        state.last = temperature
+        state.lastTime = now
+        return event
@@ -0,0 +1,347 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Load tests of the client against fleets of simulated CyberQs.
+
+SimulatedFleet starts SimulatedCyberQs in a separate process, so the
+process under test only spends CPU on the client side. runLoad() drives the
+fleet with one of these modes:
+
+    client  worker threads call getStatus() on every controller at a
+            steady rate, on a fixed schedule
+    poller  worker threads each run a Poller over their share of the
+            controllers, reading each once per round
+    push    pushConfig() sends and confirms an update on every controller
+            once per round, with as many hosts in flight as workers
+
+Every mode uses the chosen transport with a request timeout.
+
+Latency is measured from the moment a read was due. When the client falls
+behind, the lag shows up in the latency instead of the client quietly
+polling less often.
+
+Running this module prints a table for each combination of fleet size and
+rate, which shows how many controllers a host can poll before the tail
+latency grows:
+
+    python -m cyberqinterface.loadtest -c 10,100,500 -r 0.2,1 --latency 0.05
+"""
+import argparse
+import heapq
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from cyberqinterface import CyberQInterface
+from fleet import pushConfig
+from poller import Poller
+from simulator import SimulatedCyberQ
+from transport import RequestsTransport, SocketTransport
+
+MODES = ("client", "poller", "push")
+TRANSPORTS = {"requests": RequestsTransport, "socket": SocketTransport}
+
+# Update of push mode. Simulators do not apply updates, so it sends the
+# setpoint config.xml already reports to let the read back confirm it.
+PUSH_PARAMETERS = {"COOK_SET": "400"}
+
+# Outcome of one runLoad(). rate is the target reads per second of each
+# controller, throughput the reads per second achieved over the whole
+# fleet. Latencies are in seconds. cpu is the CPU seconds the process under
+# test used, cpuPerController the share of one CPU each controller needed.
+LoadResult = namedtuple("LoadResult", [
+    "mode", "controllers", "rate", "elapsed", "reads", "errors",
+    "throughput", "p50", "p95", "p99", "maximum", "cpu",
+    "cpuPerController"])
+
+
+def _serveFleet(count, options, hosts, stop):
+    """Run count simulators until stop is set"""
+    simulators = [SimulatedCyberQ(seed=number, **options).start()
+                  for number in range(count)]
+    hosts.put([simulator.host for simulator in simulators])
+    stop.wait()
+    for simulator in simulators:
+        simulator.stop()
+
+
+class SimulatedFleet:
+    """
+    SimulatedCyberQs served from a child process.
+    """
+
+    def __init__(self, count, latency=0.0, jitter=0.0, failureRate=0.0,
+                 dropRate=0.0):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * **<int>** Number of controllers
+        * (optional) **<float>** Seconds each response waits
+        * (optional) **<float>** Most extra seconds added at random
+        * (optional) **<float>** Fraction of requests answered with a 500
+        * (optional) **<float>** Fraction of connections dropped
+
+        **Example Usage:**
+        .. code-block:: python
+        with SimulatedFleet(100, latency=0.05) as fleet:
+            print runLoad("client", fleet.hosts, rate=1, duration=30)
+        """
+        self.count = count
+        self.options = {"latency": latency, "jitter": jitter,
+                        "failureRate": failureRate, "dropRate": dropRate}
+        self.hosts = []
+        self._stop = None
+        self._process = None
+
+    def start(self):
+        """Start the simulators and wait until they listen"""
+        hosts = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=_serveFleet,
+            args=(self.count, self.options, hosts, self._stop))
+        self._process.daemon = True
+        self._process.start()
+        self.hosts = hosts.get(timeout=60)
+        return self
+
+    def stop(self):
+        """Stop the simulators"""
+        if self._process is not None:
+            self._stop.set()
+            self._process.join(10)
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, kind, value, traceback):
+        self.stop()
+        return False
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _driveClients(hosts, rate, duration, workers, transport):
+    """Poll hosts on a schedule, returning [(latency, failed)]"""
+    interfaces = [CyberQInterface(host, transport=transport)
+                  for host in hosts]
+    started = time.time()
+    end = started + duration
+    period = 1.0 / rate
+    samples = []
+    lock = threading.Lock()
+
+    def worker(number):
+        # (due, read, index) of this worker's controllers, spread over a
+        # period. Dues are computed from the read count so they do not
+        # drift.
+        due = [(started + period * index / len(interfaces), 0, index)
+               for index in range(number, len(interfaces), workers)]
+        heapq.heapify(due)
+        local = []
+        while due and due[0][0] < end:
+            when, read, index = heapq.heappop(due)
+            wait = when - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            failed = False
+            try:
+                interfaces[index].getStatus()
+            except Exception:
+                failed = True
+            local.append((time.time() - when, failed))
+            read += 1
+            heapq.heappush(due, (started + period *
+                                 (read + float(index) / len(interfaces)),
+                                 read, index))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(min(workers, len(interfaces)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def _drivePoller(hosts, rate, duration, workers, transport):
+    """Run Poller rounds on worker threads, returning [(latency, failed)]"""
+    rounds = max(1, int(duration * rate))
+    samples = []
+    lock = threading.Lock()
+
+    def worker(number):
+        share = hosts[number::workers]
+        poller = Poller(share, interval=1.0 / rate, transport=transport)
+        local = []
+        for round in range(rounds):
+            # Every host of a round is due at its start, as in
+            # Poller.pollOnce()
+            started = time.time()
+            for host in share:
+                failed = poller.pollHost(host) is None
+                local.append((time.time() - started, failed))
+            remaining = 1.0 / rate - (time.time() - started)
+            if remaining > 0 and round < rounds - 1:
+                time.sleep(remaining)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(min(workers, len(hosts)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def _drivePush(hosts, rate, duration, workers, transport):
+    """Push an update each round, returning [(latency, failed)]"""
+    rounds = max(1, int(duration * rate))
+    samples = []
+    for round in range(rounds):
+        started = time.time()
+        results = pushConfig(hosts, PUSH_PARAMETERS,
+                             concurrency=workers, hostInterval=0,
+                             transport=transport)
+        samples.extend((result.elapsed, not result.confirmed)
+                       for result in results)
+        remaining = 1.0 / rate - (time.time() - started)
+        if remaining > 0 and round < rounds - 1:
+            time.sleep(remaining)
+    return samples
+
+
+def runLoad(mode, hosts, rate=1.0, duration=10.0, workers=32,
+            transport="socket", timeout=10.0):
+    """
+    Drive a fleet and measure how the client kept up
+
+    Keyword arguments:
+    <String> mode - client, poller or push
+    <list> hosts - host:port of each controller
+    (optional) <float> rate - reads per second of each controller, rounds
+    per second for poller and push
+    (optional) <float> duration - seconds to run
+    (optional) <int> workers - threads of client and poller mode,
+    concurrency of push
+    (optional) <String> transport - requests or socket
+    (optional) <float> timeout - seconds each request may take
+
+    Returns:
+    <LoadResult>
+
+    Example Usage:
+    result = runLoad("client", fleet.hosts, rate=2, duration=30)
+    print result.throughput, result.p99
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown mode: %s" % mode)
+    if transport not in TRANSPORTS:
+        raise ValueError("Unknown transport: %s" % transport)
+    cpu = _cpu()
+    started = time.time()
+    client = TRANSPORTS[transport](timeout=timeout)
+    try:
+        if mode == "client":
+            samples = _driveClients(hosts, rate, duration, workers, client)
+        elif mode == "poller":
+            samples = _drivePoller(hosts, rate, duration, workers, client)
+        else:
+            samples = _drivePush(hosts, rate, duration, workers, client)
+    finally:
+        client.close()
+    elapsed = time.time() - started
+    cpu = _cpu() - cpu
+    latencies = sorted(latency for latency, failed in samples)
+    return LoadResult(mode, len(hosts), rate, elapsed, len(samples),
+                      sum(1 for latency, failed in samples if failed),
+                      len(samples) / elapsed,
+                      _percentile(latencies, 0.5),
+                      _percentile(latencies, 0.95),
+                      _percentile(latencies, 0.99),
+                      latencies[-1] if latencies else None,
+                      cpu, cpu / elapsed / max(1, len(hosts)))
+
+
+def _milliseconds(seconds):
+    if seconds is None:
+        return "-"
+    return "%.1f" % (seconds * 1000)
+
+
+def report(results, stream=None):
+    """Print a table of LoadResults"""
+    if stream is None:
+        stream = sys.stdout
+    print >> stream, "%-7s %6s %7s %8s %7s %8s %8s %8s %8s %9s" % (
+        "mode", "ctrls", "rate/s", "reads/s", "errors", "p50 ms", "p95 ms",
+        "p99 ms", "max ms", "cpu%/ctrl")
+    for result in results:
+        print >> stream, "%-7s %6d %7.2f %8.1f %7d %8s %8s %8s %8s %9.3f" % (
+            result.mode, result.controllers, result.rate, result.throughput,
+            result.errors, _milliseconds(result.p50),
+            _milliseconds(result.p95), _milliseconds(result.p99),
+            _milliseconds(result.maximum), result.cpuPerController * 100)
+
+
+def _numbers(text, kind):
+    return [kind(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test the client against simulated CyberQs")
+    parser.add_argument("-m", "--mode", choices=MODES, default="client")
+    parser.add_argument("-c", "--controllers", default="10,50,100",
+                        help="comma separated fleet sizes")
+    parser.add_argument("-r", "--rates", default="1",
+                        help="comma separated reads per second of each "
+                        "controller")
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("-w", "--workers", type=int, default=32)
+    parser.add_argument("-t", "--transport", choices=sorted(TRANSPORTS),
+                        default="socket")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds each request may take")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds each simulated response waits")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    results = []
+    for count in _numbers(args.controllers, int):
+        with SimulatedFleet(count, args.latency, args.jitter,
+                            args.failure_rate, args.drop_rate) as fleet:
+            for rate in _numbers(args.rates, float):
+                results.append(runLoad(args.mode, fleet.hosts, rate,
+                                       args.duration, args.workers,
+                                       args.transport, args.timeout))
+    report(results)
+
+if __name__ == "__main__": # pragma: no cover
+    main()
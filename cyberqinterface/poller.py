@@ -0,0 +1,425 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Polling loops for fleets of CyberQs.
+
+Poller reads every host in turn with its own CyberQInterface, decodes the
+document into a Snapshot and hands it to the registered listeners. For fleets
+too large for one process, ShardedPoller spreads the hosts over a pool of
+worker processes with a consistent hash ring. Each worker runs an ordinary
+Poller and ships every round of snapshots back to the parent as one codec
+block. The parent exposes the same listener interface as Poller.
+
+A listener that raises does not stop the others or the polling. The
+failures are counted in metrics["listenerErrors"] and the latest exception
+is kept in listenerError.
+"""
+import bisect
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from Queue import Empty
+
+from cyberqinterface import CyberQInterface
+from snapshot import decodeSnapshot
+from codec import encodeSnapshots, decodeSnapshots
+import profiling
+
+DOCUMENTS = ("status", "all", "config")
+
+
+class Poller:
+    """
+    Poll a set of CyberQs and publish decoded snapshots.
+    """
+
+    def __init__(self, hosts=(), interval=1.0, document="status",
+                 headers=None, profiler=None, transport=None):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<list>** Hostnames or IPs of the CyberQs
+        * (optional) **<float>** Seconds between the start of each round
+        * (optional) **<String>** Document to read: status, all or config
+        * (optional) **<Dictionary>** Headers passed to each CyberQInterface
+        * (optional) **<Profiler>** Passed to each CyberQInterface to time
+          its reads, see profiling.py
+        * (optional) **<Transport>** Shared by each CyberQInterface, see
+          transport.py. Defaults to a RequestsTransport per host.
+
+        **Example Usage:**
+        .. code-block:: python
+        poller = Poller(["10.0.1.5", "10.0.1.6"], interval=5)
+        poller.addListener(rollup.add)
+        poller.run()
+        """
+        if document not in DOCUMENTS:
+            raise ValueError("Unknown document: %s" % document)
+        self.interval = interval
+        self.document = document
+        self.headers = headers
+        self.profiler = profiler
+        self.transport = transport
+        self.interfaces = {}
+        self.latest = {}
+        self.errors = {}
+        self.listeners = []
+        self.metrics = {"listenerErrors": 0}
+        self.listenerError = None
+        self._running = False
+        for host in hosts:
+            self.addHost(host)
+
+    def addHost(self, host):
+        """Start polling a host"""
+        if host not in self.interfaces:
+            self.interfaces[host] = CyberQInterface(
+                host, self.headers, transport=self.transport,
+                profiler=self.profiler)
+
+    def removeHost(self, host):
+        """Stop polling a host and forget its last snapshot"""
+        self.interfaces.pop(host, None)
+        self.latest.pop(host, None)
+        self.errors.pop(host, None)
+
+    def addListener(self, listener):
+        """
+        Register a callable invoked as listener(snapshot, previous) for every
+        new snapshot. previous is None for the first snapshot of a host.
+        """
+        self.listeners.append(listener)
+
+    def publish(self, snapshot):
+        """
+        Record a snapshot as the latest for its host and notify every
+        listener, even when one of them raises
+        """
+        _publish(self, snapshot)
+
+    def pollHost(self, host):
+        """
+        Read and publish one host
+
+        Returns:
+        <Snapshot> or None if the read or decode failed. The exception is
+        kept in self.errors[host].
+        """
+        cqi = self.interfaces[host]
+        try:
+            if self.document == "status":
+                tree = cqi.getStatus()
+            elif self.document == "all":
+                tree = cqi.getAll()
+            else:
+                tree = cqi.getConfig()
+            snapshot = decodeSnapshot(tree, host)
+        except Exception as e:
+            self.errors[host] = e
+            return None
+        self.errors.pop(host, None)
+        self.publish(snapshot)
+        return snapshot
+
+    def pollOnce(self):
+        """
+        Poll every host once
+
+        Returns:
+        <list> Snapshots read successfully this round
+        """
+        snapshots = []
+        for host in list(self.interfaces.keys()):
+            snapshot = self.pollHost(host)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def run(self, rounds=None):
+        """
+        Poll in a loop until stop() is called or rounds have completed
+
+        Keyword arguments:
+        (optional) <int> rounds - number of rounds, forever if None
+        """
+        self._running = True
+        count = 0
+        while self._running and (rounds is None or count < rounds):
+            started = time.time()
+            self.pollOnce()
+            count += 1
+            remaining = self.interval - (time.time() - started)
+            if remaining > 0 and (rounds is None or count < rounds):
+                time.sleep(remaining)
+        self._running = False
+
+    def stop(self):
+        """Ask run() to return after the current round"""
+        self._running = False
+
+
+def _publish(poller, snapshot):
+    """publish() of Poller and ShardedPoller"""
+    previous = poller.latest.get(snapshot.host)
+    poller.latest[snapshot.host] = snapshot
+    for listener in poller.listeners:
+        try:
+            listener(snapshot, previous)
+        except Exception as e:
+            poller.metrics["listenerErrors"] += 1
+            poller.listenerError = e
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping hosts to worker names.
+
+    Removing a worker only moves the hosts that were assigned to it.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.addNode(node)
+
+    def _hash(self, key):
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def addNode(self, node):
+        for i in range(self.replicas):
+            key = self._hash("%s#%d" % (node, i))
+            bisect.insort(self._keys, key)
+            self._nodes[key] = node
+
+    def removeNode(self, node):
+        for i in range(self.replicas):
+            key = self._hash("%s#%d" % (node, i))
+            if self._nodes.pop(key, None) is not None:
+                self._keys.remove(key)
+
+    def getNode(self, host):
+        """Return the worker responsible for host, None if the ring is empty"""
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(host)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+    def assign(self, hosts):
+        """Return {worker: [hosts]} for a list of hosts"""
+        assignment = {}
+        for host in hosts:
+            assignment.setdefault(self.getNode(host), []).append(host)
+        return assignment
+
+
+def _shardWorker(hosts, interval, document, headers, commands, results,
+                 sampleRate=0.0, dumpPath=None):
+    """
+    Body of a ShardedPoller worker process. With a dumpPath its reads are
+    profiled and the Profiler is dumped there when it is stopped.
+    """
+    profiler = None
+    if dumpPath is not None:
+        profiler = profiling.Profiler(sampleRate)
+    poller = Poller(hosts, interval, document, headers, profiler)
+    while True:
+        started = time.time()
+        try:
+            while True:
+                command, argument = commands.get_nowait()
+                if command == "add":
+                    for host in argument:
+                        poller.addHost(host)
+                elif command == "remove":
+                    for host in argument:
+                        poller.removeHost(host)
+                elif command == "stop":
+                    if profiler is not None:
+                        profiler.dump(dumpPath)
+                    return
+        except Empty:
+            pass
+        snapshots = poller.pollOnce()
+        if snapshots:
+            results.put(encodeSnapshots(snapshots))
+        remaining = interval - (time.time() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+class ShardedPoller:
+    """
+    Poll a large fleet from a pool of worker processes.
+
+    Each round of a worker arrives in the parent as one encodeSnapshots()
+    block, so parsing the XML happens in the workers and the parent only
+    pays for decoding. A worker that dies is started again with the same
+    hosts by rebalance().
+    """
+
+    def __init__(self, hosts=(), processes=None, interval=1.0,
+                 document="status", headers=None, profiler=None):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<list>** Hostnames or IPs of the CyberQs
+        * (optional) **<int>** Number of worker processes, one per CPU if None
+        * (optional) **<float>** Seconds between the rounds of each worker
+        * (optional) **<String>** Document to read: status, all or config
+        * (optional) **<Dictionary>** Headers passed to each CyberQInterface
+        * (optional) **<Profiler>** Each worker profiles its reads at the
+          sampleRate of this Profiler and dumps them when stopped. stop()
+          merges the dumps into it. Workers that died are not included.
+
+        **Example Usage:**
+        .. code-block:: python
+        poller = ShardedPoller(hosts, processes=8)
+        poller.addListener(exporter.update)
+        poller.start()
+        poller.run()
+        """
+        if document not in DOCUMENTS:
+            raise ValueError("Unknown document: %s" % document)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.hosts = list(hosts)
+        self.processes = processes
+        self.interval = interval
+        self.document = document
+        self.headers = headers
+        self.profiler = profiler
+        self.latest = {}
+        self.listeners = []
+        self.metrics = {"listenerErrors": 0, "respawns": 0}
+        self.listenerError = None
+        self.ring = HashRing()
+        self.workers = {}
+        self.assignment = {}
+        self._results = None
+        self._running = False
+        # Directory the workers dump their profilers in
+        self._profiles = None
+
+    def addListener(self, listener):
+        """Same as Poller.addListener()"""
+        self.listeners.append(listener)
+
+    def publish(self, snapshot):
+        """Same as Poller.publish()"""
+        _publish(self, snapshot)
+
+    def start(self):
+        """Start the worker processes"""
+        self._results = multiprocessing.Queue()
+        names = ["worker-%d" % i for i in range(self.processes)]
+        for name in names:
+            self.ring.addNode(name)
+        self.assignment = self.ring.assign(self.hosts)
+        if self.profiler is not None:
+            self._profiles = tempfile.mkdtemp(prefix="cyberq-profiles-")
+        for name in names:
+            self._spawn(name)
+
+    def _spawn(self, name):
+        """Start the worker process of a ring node with its hosts"""
+        commands = multiprocessing.Queue()
+        sampleRate = 0.0
+        dumpPath = None
+        if self._profiles is not None:
+            sampleRate = self.profiler.sampleRate
+            dumpPath = os.path.join(self._profiles, name + ".prof")
+        process = multiprocessing.Process(
+            target=_shardWorker, name=name,
+            args=(self.assignment.get(name, []), self.interval,
+                  self.document, self.headers, commands, self._results,
+                  sampleRate, dumpPath))
+        process.daemon = True
+        process.start()
+        self.workers[name] = (process, commands)
+
+    def rebalance(self):
+        """
+        Start dead workers again with the hosts they were polling, so no
+        host is left unpolled even when every worker died. Respawns are
+        counted in self.metrics["respawns"].
+
+        Returns:
+        <list> Names of the workers that were found dead
+        """
+        dead = [name for name, (process, commands) in self.workers.items()
+                if not process.is_alive()]
+        for name in dead:
+            self._spawn(name)
+            self.metrics["respawns"] += 1
+        return dead
+
+    def pollResults(self, timeout=0.5):
+        """
+        Publish every snapshot waiting from the workers
+
+        Keyword arguments:
+        (optional) <float> timeout - seconds to wait for the first block
+
+        Returns:
+        <int> Number of snapshots published
+        """
+        count = 0
+        try:
+            data = self._results.get(timeout=timeout)
+            while True:
+                for snapshot in decodeSnapshots(data):
+                    self.publish(snapshot)
+                    count += 1
+                data = self._results.get_nowait()
+        except Empty:
+            pass
+        return count
+
+    def run(self, duration=None):
+        """
+        Publish snapshots and watch the workers until stop() is called
+
+        Keyword arguments:
+        (optional) <float> duration - seconds to run, forever if None
+        """
+        if not self.workers:
+            self.start()
+        self._running = True
+        finish = None if duration is None else time.time() + duration
+        while self._running and (finish is None or time.time() < finish):
+            self.pollResults()
+            self.rebalance()
+        self._running = False
+
+    def stop(self):
+        """
+        Ask run() to return and shut the workers down, merging their
+        profiles into the profiler if one was passed
+        """
+        self._running = False
+        for process, commands in self.workers.values():
+            commands.put(("stop", None))
+        for process, commands in self.workers.values():
+            process.join(self.interval + 5)
+            if process.is_alive():
+                process.terminate()
+        self.workers = {}
+        self.ring = HashRing()
+        self.assignment = {}
+        if self._profiles is not None:
+            for name in sorted(os.listdir(self._profiles)):
+                self.profiler.merge(profiling.load(
+                    os.path.join(self._profiles, name)))
+            shutil.rmtree(self._profiles)
+            self._profiles = None
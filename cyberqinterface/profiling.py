@@ -0,0 +1,374 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Timing of the phases of CyberQ reads.
+
+Pass a Profiler to CyberQInterface, Poller or ShardedPoller and every call
+is timed in one of these phases:
+
+    poll     getStatus(), getAll(), getConfig(), getState() and the XML reads
+    request  the HTTP request made by the transport
+    parse    objectify.fromstring() of the response
+    lookup   statusLookup(), temperatureLookup() and rampLookup()
+
+A fraction of the polls, sampleRate, is run under cProfile. Other phases
+are only sampled as part of a sampled poll, so a lookup made on its own
+is timed but never profiled. During those sampled polls the memory each
+phase leaves allocated is measured as well: bytes from tracemalloc when it
+is tracing, otherwise the change in the number of objects tracked by the
+garbage collector, which Python 2 has in place of tracemalloc.
+
+dump() writes what was collected to a file. Running this module prints a
+report of one or more dumps, for example one per poller process of a fleet:
+
+    python -m cyberqinterface.profiling poller-1.prof poller-2.prof
+"""
+import argparse
+import cProfile
+import gc
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PHASES = ("poll", "request", "parse", "lookup")
+
+
+def _allocated(profile=None):
+    """
+    Return (memory in use, unit) in the best measure available, pausing a
+    running profile so the measurement is not profiled
+    """
+    if profile is not None:
+        profile.disable()
+        try:
+            return _allocated()
+        finally:
+            profile.enable()
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0], "bytes"
+    return len(gc.get_objects()), "objects"
+
+
+class PhaseStats:
+    """
+    Durations of one phase. The latest window durations are kept for
+    percentiles.
+    """
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.allocated = 0
+        self.allocationSamples = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds, allocated=None, error=False):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.recent.append(seconds)
+        if error:
+            self.errors += 1
+        if allocated is not None:
+            self.allocated += allocated
+            self.allocationSamples += 1
+
+    def percentile(self, fraction):
+        """Duration below which fraction of the recent calls fell"""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        self.allocated += other.allocated
+        self.allocationSamples += other.allocationSamples
+        self.recent.extend(other.recent)
+
+    def _dump(self):
+        return (self.count, self.errors, self.total, self.maximum,
+                self.allocated, self.allocationSamples, list(self.recent))
+
+    def _load(self, values):
+        (self.count, self.errors, self.total, self.maximum, self.allocated,
+         self.allocationSamples, recent) = values
+        self.recent.extend(recent)
+
+
+class _Phase:
+    """Context manager returned by Profiler.phase()"""
+
+    def __init__(self, profiler, name, host):
+        self.profiler = profiler
+        self.name = name
+        self.host = host
+
+    def __enter__(self):
+        local = self.profiler._local
+        depth = getattr(local, "depth", 0)
+        if depth == 0:
+            local.profile = None
+            if self.name == "poll" and self.profiler._sample():
+                local.profile = cProfile.Profile()
+        local.depth = depth + 1
+        self.before = None
+        if local.profile is not None:
+            if depth == 0:
+                self.before = _allocated()[0]
+                local.profile.enable()
+            else:
+                self.before = _allocated(local.profile)[0]
+        self.started = time.time()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        seconds = time.time() - self.started
+        local = self.profiler._local
+        local.depth -= 1
+        profile = local.profile
+        allocated = None
+        if profile is not None:
+            if local.depth == 0:
+                profile.disable()
+                local.profile = None
+                allocated, unit = _allocated()
+            else:
+                allocated, unit = _allocated(profile)
+            allocated -= self.before
+            self.profiler.unit = unit
+        self.profiler.record(self.name, self.host, seconds, allocated,
+                             kind is not None)
+        if profile is not None and local.depth == 0:
+            self.profiler._addProfile(profile)
+        return False
+
+
+class _LoadedStats:
+    """Lets pstats.Stats load a stats dictionary"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """
+    Per phase timings and sampled profiles of CyberQ reads.
+    """
+
+    def __init__(self, sampleRate=0.0, window=1000):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<float>** Fraction of polls run under cProfile, from
+          0 for none to 1 for all
+        * (optional) **<int>** Latest durations of each phase kept for
+          percentiles
+
+        **Example Usage:**
+        .. code-block:: python
+        profiler = Profiler(sampleRate=0.05)
+        poller = Poller(hosts, interval=5, profiler=profiler)
+        poller.run(rounds=100)
+        profiler.report()
+        """
+        self.sampleRate = sampleRate
+        self.window = window
+        self.unit = "objects"
+        self.sampled = 0
+        self.phases = {}
+        # (phase, host): [count, seconds]
+        self.hosts = {}
+        self._profile = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._random = random.Random()
+
+    def _sample(self):
+        return self.sampleRate > 0 and self._random.random() < self.sampleRate
+
+    def phase(self, name, host=None):
+        """
+        Return a context manager timing the calls in its block as a phase
+
+        Example Usage:
+        with profiler.phase("decode", host):
+            snapshot = decodeSnapshot(tree, host)
+        """
+        return _Phase(self, name, host)
+
+    def record(self, name, host, seconds, allocated=None, error=False):
+        """
+        Add one call of a phase timed elsewhere
+
+        Keyword arguments:
+        <String> name - the phase
+        <String> host - the CyberQ, or None
+        <float> seconds
+        (optional) <int> allocated - memory left allocated, see unit
+        (optional) <Boolean> error - the call raised
+        """
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats(self.window)
+            stats.add(seconds, allocated, error)
+            totals = self.hosts.get((name, host))
+            if totals is None:
+                totals = self.hosts[(name, host)] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def _addProfile(self, profile):
+        profile.create_stats()
+        with self._lock:
+            self.sampled += 1
+            if self._profile is None:
+                self._profile = pstats.Stats(profile)
+            else:
+                self._profile.add(profile)
+
+    def stats(self):
+        """Return the merged pstats.Stats of the sampled polls, or None"""
+        return self._profile
+
+    def merge(self, other):
+        """Add what another Profiler collected to this one"""
+        with self._lock:
+            if other.sampled:
+                self.sampled += other.sampled
+                self.unit = other.unit
+            for name, stats in other.phases.items():
+                if name not in self.phases:
+                    self.phases[name] = PhaseStats(self.window)
+                self.phases[name].merge(stats)
+            for key, (count, seconds) in other.hosts.items():
+                totals = self.hosts.setdefault(key, [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+            if other._profile is not None:
+                if self._profile is None:
+                    self._profile = pstats.Stats(
+                        _LoadedStats(dict(other._profile.stats)))
+                else:
+                    self._profile.add(
+                        _LoadedStats(dict(other._profile.stats)))
+
+    def dump(self, path):
+        """Write what was collected to path, read back by load()"""
+        with self._lock:
+            data = {"sampled": self.sampled, "unit": self.unit,
+                    "phases": dict((name, stats._dump()) for name, stats
+                                   in self.phases.items()),
+                    "hosts": dict((key, tuple(totals)) for key, totals
+                                  in self.hosts.items()),
+                    "profile": (self._profile.stats
+                                if self._profile is not None else {})}
+        with open(path, "wb") as output:
+            marshal.dump(data, output)
+
+    def report(self, stream=None, top=10):
+        """
+        Print where time and memory went
+
+        Keyword arguments:
+        (optional) <file> stream - defaults to stdout
+        (optional) <int> top - number of hosts and functions listed
+        """
+        if stream is None:
+            stream = sys.stdout
+        print >> stream, "%d sampled under cProfile, memory in %s" % (
+            self.sampled, self.unit)
+        print >> stream, "%-8s %8s %6s %10s %8s %8s %8s %8s %8s %10s" % (
+            "phase", "calls", "errors", "total s", "mean ms", "p50 ms",
+            "p95 ms", "p99 ms", "max ms", self.unit + "/call")
+        names = [name for name in PHASES if name in self.phases]
+        names.extend(sorted(set(self.phases) - set(PHASES)))
+        for name in names:
+            stats = self.phases[name]
+            allocated = "-"
+            if stats.allocationSamples:
+                allocated = "%.1f" % (stats.allocated /
+                                      float(stats.allocationSamples))
+            print >> stream, ("%-8s %8d %6d %10.3f %8.2f %8.2f %8.2f %8.2f "
+                              "%8.2f %10s") % (
+                name, stats.count, stats.errors, stats.total,
+                stats.total / stats.count * 1000,
+                stats.percentile(0.5) * 1000, stats.percentile(0.95) * 1000,
+                stats.percentile(0.99) * 1000, stats.maximum * 1000,
+                allocated)
+        polls = sorted(((totals[1], host) for (name, host), totals
+                        in self.hosts.items() if name == "poll"),
+                       reverse=True)[:top]
+        if polls:
+            print >> stream
+            print >> stream, "slowest hosts by poll time"
+            for seconds, host in polls:
+                print >> stream, "  %-30s %10.3f s" % (host, seconds)
+        if self._profile is not None:
+            print >> stream
+            self._profile.stream = stream
+            self._profile.sort_stats("cumulative").print_stats(top)
+
+
+def load(path):
+    """
+    Read a Profiler written by Profiler.dump()
+
+    Keyword arguments:
+    <String> path
+
+    Returns:
+    <Profiler>
+    """
+    with open(path, "rb") as source:
+        data = marshal.load(source)
+    profiler = Profiler()
+    profiler.sampled = data["sampled"]
+    profiler.unit = data["unit"]
+    for name, values in data["phases"].items():
+        stats = profiler.phases[name] = PhaseStats(profiler.window)
+        stats._load(values)
+    for key, totals in data["hosts"].items():
+        profiler.hosts[key] = list(totals)
+    if data["profile"]:
+        profiler._profile = pstats.Stats(_LoadedStats(data["profile"]))
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report the phases and profiles of Profiler dumps")
+    parser.add_argument("paths", nargs="+", metavar="DUMP")
+    parser.add_argument("-n", "--top", type=int, default=10,
+                        help="hosts and functions listed")
+    args = parser.parse_args(argv)
+    profiler = Profiler()
+    for path in args.paths:
+        profiler.merge(load(path))
+    profiler.report(top=args.top)
+
+if __name__ == "__main__": # pragma: no cover
+    main()
@@ -0,0 +1,179 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Streaming rollup of decoded snapshots into per-minute and per-hour rows.
+
+A Rollup keeps one open bucket per host and resolution. Each snapshot is
+folded into the open buckets and a bucket is emitted as a RollupRow as soon as
+a snapshot for a later period arrives, so memory is bounded by the number of
+hosts regardless of how long the rollup runs.
+"""
+from collections import namedtuple
+
+from snapshot import PROBES, TEMPERATURE_FIELDS, STATUS_FIELDS
+
+MINUTE = 60
+HOUR = 3600
+
+# Aggregate of one host over one period. minimums, maximums and means are
+# tuples ordered like snapshot.PROBES, in tenths of a degree F, None where the
+# probe was OPEN for the whole period. statusSeconds is a tuple of
+# {status code: seconds} dictionaries in the same order; use
+# CyberQInterface.statusLookup() for the names of the codes.
+RollupRow = namedtuple("RollupRow", ["host", "resolution", "start",
+                                     "samples", "minimums", "maximums",
+                                     "means", "outputPercent",
+                                     "statusSeconds"])
+
+
+class _Bucket:
+    """Running aggregate for one host over one period"""
+
+    def __init__(self, start):
+        self.start = start
+        self.samples = 0
+        self.minimums = [None] * len(PROBES)
+        self.maximums = [None] * len(PROBES)
+        self.sums = [0] * len(PROBES)
+        self.counts = [0] * len(PROBES)
+        self.outputSum = 0
+        self.outputCount = 0
+        self.statusSeconds = [{} for probe in PROBES]
+
+    def add(self, snapshot):
+        self.samples += 1
+        for i, field in enumerate(TEMPERATURE_FIELDS):
+            value = getattr(snapshot, field)
+            if value is None:
+                continue
+            if self.counts[i] == 0:
+                self.minimums[i] = value
+                self.maximums[i] = value
+            elif value < self.minimums[i]:
+                self.minimums[i] = value
+            elif value > self.maximums[i]:
+                self.maximums[i] = value
+            self.sums[i] += value
+            self.counts[i] += 1
+        if snapshot.OUTPUT_PERCENT is not None:
+            self.outputSum += snapshot.OUTPUT_PERCENT
+            self.outputCount += 1
+
+    def addStatusTime(self, snapshot, seconds):
+        for i, field in enumerate(STATUS_FIELDS):
+            code = getattr(snapshot, field)
+            if code is None:
+                continue
+            histogram = self.statusSeconds[i]
+            histogram[code] = histogram.get(code, 0) + seconds
+
+    def row(self, host, resolution):
+        means = []
+        for i in range(len(PROBES)):
+            if self.counts[i]:
+                means.append(float(self.sums[i]) / self.counts[i])
+            else:
+                means.append(None)
+        outputPercent = None
+        if self.outputCount:
+            outputPercent = float(self.outputSum) / self.outputCount
+        return RollupRow(host, resolution, self.start, self.samples,
+                         tuple(self.minimums), tuple(self.maximums),
+                         tuple(means), outputPercent,
+                         tuple(self.statusSeconds))
+
+
+class Rollup:
+    """
+    Incrementally aggregate snapshots into fixed-period rows.
+    """
+
+    def __init__(self, resolutions=(MINUTE, HOUR), sink=None, maxGap=60):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<tuple>** Bucket sizes in seconds
+        * (optional) **<callable>** Called with each completed RollupRow
+        * (optional) **<int>** Longest gap in seconds credited to the previous
+          status when computing time-in-status. Longer gaps are treated as
+          missing data.
+
+        **Example Usage:**
+        .. code-block:: python
+        rollup = Rollup(sink=database.insert)
+        rollup.add(decodeSnapshot(cqi.getStatus(), cqi.host))
+        """
+        self.resolutions = tuple(resolutions)
+        self.sink = sink
+        self.maxGap = maxGap
+        self._buckets = {}
+        self._last = {}
+
+    def add(self, snapshot):
+        """
+        Fold a snapshot into the open buckets of its host
+
+        Keyword arguments:
+        <Snapshot> snapshot - decoded snapshot with host and timestamp set
+
+        Returns:
+        <list> RollupRows completed by this snapshot
+        """
+        host = snapshot.host
+        buckets = self._buckets.setdefault(host, {})
+        previous = self._last.get(host)
+        if previous is not None:
+            gap = snapshot.timestamp - previous.timestamp
+            if gap < 0:
+                # Late sample: it belongs to a bucket that is already gone
+                return []
+            if gap <= self.maxGap:
+                for bucket in buckets.values():
+                    bucket.addStatusTime(previous, gap)
+        self._last[host] = snapshot
+
+        completed = []
+        for resolution in self.resolutions:
+            start = int(snapshot.timestamp // resolution) * resolution
+            bucket = buckets.get(resolution)
+            if bucket is None or bucket.start != start:
+                if bucket is not None:
+                    completed.append(bucket.row(host, resolution))
+                bucket = _Bucket(start)
+                buckets[resolution] = bucket
+            bucket.add(snapshot)
+        self._emit(completed)
+        return completed
+
+    def flush(self, host=None):
+        """
+        Close the open buckets of one host, or every host
+
+        Keyword arguments:
+        (optional) <String> host - host to flush, all hosts if None
+
+        Returns:
+        <list> RollupRows for the partially filled buckets
+        """
+        if host is None:
+            hosts = list(self._buckets.keys())
+        else:
+            hosts = [host]
+        completed = []
+        for name in hosts:
+            buckets = self._buckets.pop(name, {})
+            self._last.pop(name, None)
+            for resolution in self.resolutions:
+                if resolution in buckets:
+                    completed.append(buckets[resolution].row(name, resolution))
+        self._emit(completed)
+        return completed
+
+    def _emit(self, rows):
+        if self.sink is not None:
+            for row in rows:
+                self.sink(row)
@@ -0,0 +1,169 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+JSON and msgpack encodings of decoded snapshots.
+
+Both encoders write straight from the Snapshot tuple. The keys of every
+field are encoded once when the module loads, and each value is encoded by
+a function chosen for its field, so no dictionary is built per snapshot.
+Objects have the Snapshot field names as keys, temperatures in tenths of a
+degree F and null for missing values or OPEN probes.
+
+The msgpack encoder is written here, so the msgpack package is only needed
+to read the result.
+"""
+import struct
+from json.encoder import encode_basestring_ascii
+
+from snapshot import SNAPSHOT_FIELDS, NAME_FIELDS
+
+_TEXT_FIELDS = ("host",) + NAME_FIELDS
+
+
+def _jsonText(value):
+    if value is None:
+        return "null"
+    return encode_basestring_ascii(value)
+
+
+def _jsonInt(value):
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _jsonNumber(value):
+    if isinstance(value, float):
+        return repr(value)
+    return _jsonInt(value)
+
+
+_JSON_TEMPLATE = "{%s}" % ",".join('"%s":%%s' % field
+                                   for field in SNAPSHOT_FIELDS)
+_JSON_ENCODERS = tuple(_jsonText if field in _TEXT_FIELDS else
+                       _jsonNumber if field == "timestamp" else _jsonInt
+                       for field in SNAPSHOT_FIELDS)
+
+
+def snapshotToJSON(snapshot):
+    """
+    Encode a Snapshot as a JSON object
+
+    Keyword arguments:
+    <Snapshot> snapshot
+
+    Returns:
+    <String> ASCII JSON
+
+    Example Usage:
+    queue.put(snapshotToJSON(decodeSnapshot(cqi.getStatus(), cqi.host)))
+    """
+    return _JSON_TEMPLATE % tuple([encode(value) for encode, value
+                                   in zip(_JSON_ENCODERS, snapshot)])
+
+
+def snapshotsToJSON(snapshots):
+    """Encode snapshots as a JSON array"""
+    return "[%s]" % ",".join([snapshotToJSON(snapshot)
+                              for snapshot in snapshots])
+
+
+def snapshotsToJSONLines(snapshots):
+    """Encode snapshots as newline delimited JSON objects"""
+    return "".join([snapshotToJSON(snapshot) + "\n"
+                    for snapshot in snapshots])
+
+
+_INT16 = struct.Struct(">h")
+_INT32 = struct.Struct(">i")
+_INT64 = struct.Struct(">q")
+_UINT16 = struct.Struct(">H")
+_UINT32 = struct.Struct(">I")
+_UINT64 = struct.Struct(">Q")
+_DOUBLE = struct.Struct(">d")
+_NIL = "\xc0"
+
+
+def _packInt(value):
+    if value is None:
+        return _NIL
+    if value >= 0:
+        if value < 0x80:
+            return chr(value)
+        if value < 0x100:
+            return "\xcc" + chr(value)
+        if value < 0x10000:
+            return "\xcd" + _UINT16.pack(value)
+        if value < 0x100000000:
+            return "\xce" + _UINT32.pack(value)
+        if value < 0x8000000000000000:
+            return "\xd3" + _INT64.pack(value)
+        return "\xcf" + _UINT64.pack(value)
+    if value >= -32:
+        return chr(value & 0xFF)
+    if value >= -0x80:
+        return "\xd0" + chr(value & 0xFF)
+    if value >= -0x8000:
+        return "\xd1" + _INT16.pack(value)
+    if value >= -0x80000000:
+        return "\xd2" + _INT32.pack(value)
+    return "\xd3" + _INT64.pack(value)
+
+
+def _packNumber(value):
+    if isinstance(value, float):
+        return "\xcb" + _DOUBLE.pack(value)
+    return _packInt(value)
+
+
+def _packText(value):
+    if value is None:
+        return _NIL
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    length = len(value)
+    if length < 32:
+        return chr(0xA0 | length) + value
+    if length < 0x100:
+        return "\xd9" + chr(length) + value
+    if length < 0x10000:
+        return "\xda" + _UINT16.pack(length) + value
+    return "\xdb" + _UINT32.pack(length) + value
+
+
+_MSGPACK_HEADER = "\xde" + _UINT16.pack(len(SNAPSHOT_FIELDS))
+_MSGPACK_KEYS = tuple(_packText(field) for field in SNAPSHOT_FIELDS)
+_MSGPACK_ENCODERS = tuple(_packText if field in _TEXT_FIELDS else
+                          _packNumber if field == "timestamp" else _packInt
+                          for field in SNAPSHOT_FIELDS)
+
+
+def snapshotToMsgpack(snapshot):
+    """
+    Encode a Snapshot as a msgpack map
+
+    Keyword arguments:
+    <Snapshot> snapshot
+
+    Returns:
+    <String> bytes, msgpack.unpackb(data, raw=False) reads them back
+
+    Example Usage:
+    socket.sendall(snapshotToMsgpack(snap))
+    """
+    parts = [_MSGPACK_HEADER]
+    append = parts.append
+    for key, encode, value in zip(_MSGPACK_KEYS, _MSGPACK_ENCODERS,
+                                  snapshot):
+        append(key)
+        append(encode(value))
+    return "".join(parts)
+
+
+def snapshotsToMsgpack(snapshots):
+    """Encode snapshots as a msgpack array of maps"""
+    parts = ["\xdd" + _UINT32.pack(len(snapshots))]
+    parts.extend([snapshotToMsgpack(snapshot) for snapshot in snapshots])
+    return "".join(parts)
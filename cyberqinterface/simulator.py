@@ -0,0 +1,281 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Local stand-in for a CyberQ web server.
+
+SimulatedCyberQ serves status.xml, all.xml and config.xml over HTTP on a
+local port and accepts updates, so clients, transports and fleet tools can
+be exercised without a controller on the network. Latency, jitter and
+failures can be injected to see how they cope with a slow or flaky
+controller.
+"""
+import random
+import threading
+import time
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+STATUS_XML = """<nutcstatus>
+   <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
+   <!--all temperatures sent by browser to unit should be in F.  you can send tenths F with a decimal place, ex: 123.5-->  
+   <OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+   <TIMER_CURR>00:00:00</TIMER_CURR>
+   <COOK_TEMP>3343</COOK_TEMP>
+   <FOOD1_TEMP>823</FOOD1_TEMP>
+   <FOOD2_TEMP>OPEN</FOOD2_TEMP>
+   <FOOD3_TEMP>OPEN</FOOD3_TEMP>
+   <COOK_STATUS>0</COOK_STATUS>
+   <FOOD1_STATUS>0</FOOD1_STATUS>
+   <FOOD2_STATUS>4</FOOD2_STATUS>
+   <FOOD3_STATUS>4</FOOD3_STATUS>
+   <TIMER_STATUS>0</TIMER_STATUS>
+   <DEG_UNITS>1</DEG_UNITS>
+   <COOK_CYCTIME>6</COOK_CYCTIME>
+   <COOK_PROPBAND>500</COOK_PROPBAND>
+   <COOK_RAMP>0</COOK_RAMP>
+</nutcstatus>"""
+
+ALL_XML = """<nutcallstatus>
+    <!--this is similar to status.xml, but with more values-->
+    <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
+    <!--all temperatures sent by browser to unit should be in F.  you can send tenths F with a decimal place, ex: 123.5-->
+    <COOK>
+        <COOK_NAME>Big Green Egg</COOK_NAME>
+        <COOK_TEMP>3216</COOK_TEMP>
+        <COOK_SET>4000</COOK_SET>
+        <COOK_STATUS>0</COOK_STATUS>
+    </COOK>
+    <FOOD1>
+        <FOOD1_NAME>Chicken Quarters</FOOD1_NAME>
+        <FOOD1_TEMP>1482</FOOD1_TEMP>
+        <FOOD1_SET>1750</FOOD1_SET>
+        <FOOD1_STATUS>0</FOOD1_STATUS>
+    </FOOD1>
+    <FOOD2>
+        <FOOD2_NAME>Food2</FOOD2_NAME>
+        <FOOD2_TEMP>OPEN</FOOD2_TEMP>
+        <FOOD2_SET>1000</FOOD2_SET>
+        <FOOD2_STATUS>4</FOOD2_STATUS>
+    </FOOD2>
+    <FOOD3>
+        <FOOD3_NAME>Food3</FOOD3_NAME>
+        <FOOD3_TEMP>OPEN</FOOD3_TEMP>
+        <FOOD3_SET>1000</FOOD3_SET>
+        <FOOD3_STATUS>4</FOOD3_STATUS>
+    </FOOD3>
+    <OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+    <TIMER_CURR>00:00:00</TIMER_CURR>
+    <TIMER_STATUS>0</TIMER_STATUS>
+    <DEG_UNITS>1</DEG_UNITS>
+    <COOK_CYCTIME>6</COOK_CYCTIME>
+    <COOK_PROPBAND>500</COOK_PROPBAND>
+    <COOK_RAMP>0</COOK_RAMP>
+</nutcallstatus>"""
+
+CONFIG_XML = """<nutcallstatus>
+   <!--this is similar to all.xml, but with more values-->
+   <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
+   <!--all temperatures sent by browser to unit should be in F.  you can send tenths F with a decimal place, ex: 123.5-->  
+   <COOK>
+      <COOK_NAME>Big Green Egg</COOK_NAME>
+      <COOK_TEMP>3220</COOK_TEMP>
+      <COOK_SET>4000</COOK_SET>
+      <COOK_STATUS>0</COOK_STATUS>
+   </COOK>
+   <FOOD1>
+      <FOOD1_NAME>Chicken Quarters</FOOD1_NAME>
+      <FOOD1_TEMP>1493</FOOD1_TEMP>
+      <FOOD1_SET>1750</FOOD1_SET>
+      <FOOD1_STATUS>0</FOOD1_STATUS>
+   </FOOD1>
+   <FOOD2>
+      <FOOD2_NAME>Food2</FOOD2_NAME>
+      <FOOD2_TEMP>OPEN</FOOD2_TEMP>
+      <FOOD2_SET>1000</FOOD2_SET>
+      <FOOD2_STATUS>4</FOOD2_STATUS>
+   </FOOD2>
+   <FOOD3>
+      <FOOD3_NAME>Food3</FOOD3_NAME>
+      <FOOD3_TEMP>OPEN</FOOD3_TEMP>
+      <FOOD3_SET>1000</FOOD3_SET>
+      <FOOD3_STATUS>4</FOOD3_STATUS>
+   </FOOD3>
+   <OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+   <TIMER_CURR>00:00:00</TIMER_CURR>   
+   <TIMER_STATUS>0</TIMER_STATUS>
+   <SYSTEM>
+      <MENU_SCROLLING>1</MENU_SCROLLING>
+      <LCD_BACKLIGHT>47</LCD_BACKLIGHT>
+      <LCD_CONTRAST>10</LCD_CONTRAST>
+      <DEG_UNITS>1</DEG_UNITS>
+      <ALARM_BEEPS>0</ALARM_BEEPS>
+      <KEY_BEEPS>0</KEY_BEEPS>
+   </SYSTEM>
+   <CONTROL>
+      <TIMEOUT_ACTION>0</TIMEOUT_ACTION>
+      <COOKHOLD>2000</COOKHOLD>
+      <ALARMDEV>500</ALARMDEV>
+      <COOK_RAMP>0</COOK_RAMP>
+      <OPENDETECT>1</OPENDETECT>
+      <CYCTIME>6</CYCTIME>
+      <PROPBAND>500</PROPBAND>
+   </CONTROL>
+   <WIFI>
+      <IP>10.0.1.30</IP>
+      <NM>255.255.255.0</NM>
+      <GW>10.0.1.1</GW>
+      <DNS>10.0.1.1</DNS>
+      <WIFIMODE>0</WIFIMODE>
+      <DHCP>0</DHCP>
+      <SSID>Wireless Network</SSID>
+      <WIFI_ENC>6</WIFI_ENC>
+      <WIFI_KEY>SecretKey</WIFI_KEY>
+      <HTTP_PORT>80</HTTP_PORT>
+   </WIFI>
+   <SMTP>
+      <SMTP_HOST>smtp.hostname.com</SMTP_HOST>
+      <SMTP_PORT>0</SMTP_PORT>
+      <SMTP_USER></SMTP_USER>
+      <SMTP_PWD></SMTP_PWD>
+      <SMTP_TO>destination@someplace.com</SMTP_TO>
+      <SMTP_FROM>source@someplace.com</SMTP_FROM>
+      <SMTP_SUBJ>Temperature Controller Status E-Mail</SMTP_SUBJ>
+      <SMTP_ALERT>0</SMTP_ALERT>
+   </SMTP>
+</nutcallstatus>"""
+
+DOCUMENTS = {"status.xml": STATUS_XML,
+             "all.xml": ALL_XML,
+             "config.xml": CONFIG_XML}
+
+
+class SimulatedCyberQ:
+    """
+    HTTP server answering like a CyberQ.
+    """
+
+    def __init__(self, port=0, address="127.0.0.1", documents=None,
+                 latency=0.0, jitter=0.0, failureRate=0.0, dropRate=0.0,
+                 seed=None):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<int>** Port to listen on, any free port if 0
+        * (optional) **<String>** Interface to bind
+        * (optional) **<Dictionary>** objectURI: XML bytes to serve,
+          defaults to the samples in this module
+        * (optional) **<float>** Seconds to wait before each response
+        * (optional) **<float>** Most extra seconds added at random to the
+          latency of each response
+        * (optional) **<float>** Fraction of requests answered with a 500
+        * (optional) **<float>** Fraction of requests whose connection is
+          closed without a response
+        * (optional) **<int>** Seed of the injected jitter and failures
+
+        Posted form fields are recorded in self.updates. The failures and
+        dropped connections injected are counted in self.failures and
+        self.drops.
+
+        **Example Usage:**
+        .. code-block:: python
+        simulator = SimulatedCyberQ()
+        simulator.start()
+        cqi = CyberQInterface(simulator.host)
+        """
+        if documents is None:
+            documents = dict(DOCUMENTS)
+        self.documents = documents
+        self.latency = latency
+        self.jitter = jitter
+        self.failureRate = failureRate
+        self.dropRate = dropRate
+        self.updates = []
+        self.requests = 0
+        self.failures = 0
+        self.drops = 0
+        # Guards the counters and the random draws of the handler threads
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.server = _SimulatorServer((address, port), _SimulatorHandler)
+        self.server.simulator = self
+
+    @property
+    def host(self):
+        """host:port to pass to CyberQInterface"""
+        return "%s:%d" % self.server.server_address[:2]
+
+    def start(self):
+        """Serve from a background thread"""
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _SimulatorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment so keep-alive clients are not
+    # held up by delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body):
+        simulator = self.server.simulator
+        with simulator._lock:
+            simulator.requests += 1
+            delay = simulator.latency
+            if simulator.jitter:
+                delay += simulator._random.uniform(0, simulator.jitter)
+            dropped = bool(simulator.dropRate and
+                           simulator._random.random() < simulator.dropRate)
+            failed = bool(not dropped and simulator.failureRate and
+                          simulator._random.random() < simulator.failureRate)
+            if dropped:
+                simulator.drops += 1
+            elif failed:
+                simulator.failures += 1
+        if delay:
+            time.sleep(delay)
+        if dropped:
+            self.close_connection = 1
+            return
+        if failed:
+            status, body = 500, ""
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        document = self.path.split("?")[0].lstrip("/")
+        body = self.server.simulator.documents.get(document)
+        if body is None:
+            self._reply(404, "")
+        else:
+            self._reply(200, body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.simulator.updates.append(
+            dict(urlparse.parse_qsl(body, keep_blank_values=True)))
+        self._reply(200, "")
+
+    def log_message(self, format, *args):
+        pass
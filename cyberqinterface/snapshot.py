@@ -0,0 +1,112 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Compact decoded snapshots of CyberQ documents.
+
+The objectify trees returned by getStatus(), getAll() and getConfig() are
+convenient for one-off lookups but expensive to keep around. A Snapshot is a
+plain namedtuple holding the decoded values of the fields that matter for
+monitoring. Field names match the XML tags so code written against the
+objectify trees reads the same against a Snapshot.
+
+All temperatures are kept as the CyberQ reports them: integers in tenths of a
+degree F. A probe reporting OPEN is decoded as None. TIMER_CURR is decoded
+to seconds.
+"""
+import time
+from collections import namedtuple
+
+from cyberqinterface_exceptions import ResponseValidationException
+from timer import parseTimer
+
+PROBES = ("COOK", "FOOD1", "FOOD2", "FOOD3")
+TEMPERATURE_FIELDS = tuple(probe + "_TEMP" for probe in PROBES)
+SETPOINT_FIELDS = tuple(probe + "_SET" for probe in PROBES)
+STATUS_FIELDS = tuple(probe + "_STATUS" for probe in PROBES)
+NAME_FIELDS = tuple(probe + "_NAME" for probe in PROBES)
+
+SNAPSHOT_FIELDS = (("host", "timestamp") + TEMPERATURE_FIELDS +
+                   SETPOINT_FIELDS + STATUS_FIELDS +
+                   ("OUTPUT_PERCENT", "TIMER_CURR", "TIMER_STATUS",
+                    "DEG_UNITS") + NAME_FIELDS)
+
+Snapshot = namedtuple("Snapshot", SNAPSHOT_FIELDS)
+
+
+def _decodeTemperature(text):
+    """Tenths of a degree F as an int, None for an OPEN probe"""
+    if not text or text == "OPEN":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return int(float(text) * 10)
+
+
+def _decodeInt(text):
+    """Integer codes and percentages, None if missing"""
+    if not text:
+        return None
+    return int(text)
+
+
+def _decodeTimer(text):
+    """
+    HH:MM:SS as seconds, None if missing or not a time, such as the --:--
+    some firmware shows while no timer is set
+    """
+    if not text:
+        return None
+    try:
+        return parseTimer(text)
+    except ResponseValidationException:
+        return None
+
+
+def _decodeText(text):
+    """Names, kept as text"""
+    if text is None:
+        return ""
+    return text
+
+_DECODERS = {"OUTPUT_PERCENT": _decodeInt,
+             "TIMER_CURR": _decodeTimer,
+             "TIMER_STATUS": _decodeInt,
+             "DEG_UNITS": _decodeInt}
+for _field in TEMPERATURE_FIELDS + SETPOINT_FIELDS:
+    _DECODERS[_field] = _decodeTemperature
+for _field in STATUS_FIELDS:
+    _DECODERS[_field] = _decodeInt
+for _field in NAME_FIELDS:
+    _DECODERS[_field] = _decodeText
+
+
+def decodeSnapshot(tree, host=None, timestamp=None):
+    """
+    Decode a status, all or config object into a Snapshot
+
+    Keyword arguments:
+    <object> tree - objectify tree from getStatus(), getAll() or getConfig()
+    (optional) <String> host - the CyberQ the tree was read from
+    (optional) <float> timestamp - time of the read, defaults to now
+
+    Returns:
+    <Snapshot> Fields missing from the document are None
+
+    Example Usage:
+    snap = decodeSnapshot(cqi.getStatus(), cqi.host)
+    print snap.COOK_TEMP
+    """
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values["host"] = host
+    if timestamp is None:
+        timestamp = time.time()
+    values["timestamp"] = timestamp
+    for element in tree.iter():
+        decoder = _DECODERS.get(element.tag)
+        if decoder is not None:
+            values[element.tag] = decoder(element.text)
+    return Snapshot(**values)
+
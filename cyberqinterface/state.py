@@ -0,0 +1,64 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Consistent view of a CyberQ decoded from one config.xml read.
+
+config.xml holds the temperatures, setpoints and status codes of status.xml
+together with the CONTROL and SYSTEM settings, so one request gives values
+that were all true at the same moment. A ControllerState keeps them as
+namedtuples, which cannot be changed once built. Control and setpoint
+temperatures are in tenths of a degree F, as in a Snapshot.
+"""
+from collections import namedtuple
+
+from snapshot import decodeSnapshot, _decodeInt, _decodeTemperature
+
+CONTROL_FIELDS = ("TIMEOUT_ACTION", "COOKHOLD", "ALARMDEV", "COOK_RAMP",
+                  "OPENDETECT", "CYCTIME", "PROPBAND")
+SYSTEM_FIELDS = ("MENU_SCROLLING", "LCD_BACKLIGHT", "LCD_CONTRAST",
+                 "DEG_UNITS", "ALARM_BEEPS", "KEY_BEEPS")
+
+Control = namedtuple("Control", CONTROL_FIELDS)
+System = namedtuple("System", SYSTEM_FIELDS)
+
+# version increases with every read of a controller, so of two states the
+# higher version is the newer one. snapshot is the decoded Snapshot.
+ControllerState = namedtuple("ControllerState", ["version", "snapshot",
+                                                 "control", "system"])
+
+_TEMPERATURES = ("COOKHOLD", "ALARMDEV", "PROPBAND")
+
+
+def _decodeBlock(element, fields, kind):
+    values = dict.fromkeys(fields)
+    if element is not None:
+        for child in element.iterchildren():
+            if child.tag in values:
+                if child.tag in _TEMPERATURES:
+                    values[child.tag] = _decodeTemperature(child.text)
+                else:
+                    values[child.tag] = _decodeInt(child.text)
+    return kind(**values)
+
+
+def decodeState(tree, host=None, version=0, timestamp=None):
+    """
+    Decode a config object into a ControllerState
+
+    Keyword arguments:
+    <object> tree - objectify tree from config.xml
+    (optional) <String> host - the CyberQ the tree was read from
+    (optional) <int> version
+    (optional) <float> timestamp - time of the read, defaults to now
+
+    Returns:
+    <ControllerState> Settings missing from the document are None
+    """
+    return ControllerState(version,
+                           decodeSnapshot(tree, host, timestamp),
+                           _decodeBlock(tree.find("CONTROL"),
+                                        CONTROL_FIELDS, Control),
+                           _decodeBlock(tree.find("SYSTEM"),
+                                        SYSTEM_FIELDS, System))
@@ -0,0 +1,443 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Server-sent events stream of live snapshot changes.
+
+SnapshotStream is a Poller listener. Each snapshot is reduced to the fields
+that changed since the previous one and encoded once for every subscriber.
+A subscriber that falls behind does not queue events: pending changes for a
+host are merged so it only ever holds the latest values of each host.
+
+Every client is served by one thread running a poll loop over non-blocking
+sockets, so thousands of viewers cost file descriptors, not threads. A
+client is handed new events only once its previous write has drained; until
+then its changes keep merging in its Subscriber.
+"""
+import errno
+import fcntl
+import json
+import os
+import select
+import socket
+import threading
+import time
+
+from snapshot import SNAPSHOT_FIELDS
+
+_VALUE_FIELDS = SNAPSHOT_FIELDS[2:]
+
+
+def _delta(snapshot, previous):
+    """Return {field: value} of what changed, None if nothing did"""
+    delta = {}
+    for field in _VALUE_FIELDS:
+        value = getattr(snapshot, field)
+        if previous is None or getattr(previous, field) != value:
+            delta[field] = value
+    if not delta and previous is not None:
+        return None
+    delta["host"] = snapshot.host
+    delta["timestamp"] = snapshot.timestamp
+    return delta
+
+
+def _encode(delta):
+    return "event: snapshot\ndata: %s\n\n" % json.dumps(delta,
+                                                         sort_keys=True)
+
+
+class Subscriber:
+    """
+    Pending changes of one client, at most one merged entry per host.
+    """
+
+    def __init__(self, notify=None):
+        self.dropped = 0
+        self.closed = False
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._notify = notify
+
+    def push(self, host, delta, data=None):
+        """Queue a change, merging it with one not yet taken"""
+        with self._condition:
+            waiting = self._pending.get(host)
+            if waiting is not None:
+                merged = dict(waiting[0])
+                merged.update(delta)
+                self._pending[host] = (merged, None)
+                self.dropped += 1
+            else:
+                self._pending[host] = (delta, data)
+            self._condition.notify()
+        if self._notify is not None:
+            self._notify()
+
+    def take(self, timeout=None):
+        """
+        Wait for and return the pending events
+
+        Keyword arguments:
+        (optional) <float> timeout - seconds to wait for a change
+
+        Returns:
+        <list> Encoded events, empty on timeout or close
+        """
+        with self._condition:
+            if not self._pending and not self.closed:
+                self._condition.wait(timeout)
+            pending = self._pending
+            self._pending = {}
+        events = []
+        for delta, data in pending.values():
+            events.append(data if data is not None else _encode(delta))
+        return events
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+        if self._notify is not None:
+            self._notify()
+
+
+class SnapshotStream:
+    """
+    Fan snapshot changes out to server-sent event subscribers.
+    """
+
+    def __init__(self, keepalive=15.0):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<float>** Seconds of silence before a keepalive comment
+          is sent to a subscriber
+
+        **Example Usage:**
+        .. code-block:: python
+        stream = SnapshotStream()
+        poller.addListener(stream.update)
+        stream.start(8081)
+        poller.run()
+        """
+        self.keepalive = keepalive
+        self.latest = {}
+        self.subscribers = set()
+        self.server = None
+        self._lock = threading.Lock()
+
+    def update(self, snapshot, previous=None):
+        """
+        Poller listener: send what changed to every subscriber
+
+        Keyword arguments:
+        <Snapshot> snapshot - latest snapshot of a host
+        (optional) <Snapshot> previous - the snapshot before it
+        """
+        # Pushed under the lock so a subscriber is primed either before
+        # this change or after it, never in between
+        with self._lock:
+            if previous is None:
+                previous = self.latest.get(snapshot.host)
+            self.latest[snapshot.host] = snapshot
+            delta = _delta(snapshot, previous)
+            if delta is None:
+                return
+            data = _encode(delta)
+            for subscriber in self.subscribers:
+                subscriber.push(snapshot.host, delta, data)
+
+    def subscribe(self, notify=None):
+        """
+        Register a new subscriber primed with the latest snapshot of every
+        host
+
+        Keyword arguments:
+        (optional) <callable> notify - called with no arguments after each
+        change is queued or the subscriber is closed
+
+        Returns:
+        <Subscriber>
+        """
+        subscriber = Subscriber(notify)
+        with self._lock:
+            for snapshot in self.latest.values():
+                subscriber.push(snapshot.host, _delta(snapshot, None))
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+        subscriber.close()
+
+    def start(self, port=8081, address=""):
+        """
+        Serve /events to every client from one background thread
+
+        Keyword arguments:
+        (optional) <int> port
+        (optional) <String> address - interface to bind, all if empty
+
+        Returns:
+        <_StreamServer> the running server
+        """
+        self.server = _StreamServer(self, (address, port))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server
+
+    def stop(self):
+        """Stop serving and disconnect every subscriber"""
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            self.unsubscribe(subscriber)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def _nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _wait(readers, writers, timeout):
+    """
+    Wait for file descriptors to become ready
+
+    Keyword arguments:
+    <list> readers - descriptors to watch for input or hang up
+    <list> writers - descriptors to watch for room to write
+    <float> timeout - seconds, None to wait forever
+
+    Returns:
+    <tuple> (readable, writable) sets of descriptors
+    """
+    try:
+        if not hasattr(select, "poll"):
+            readable, writable, _ = select.select(readers, writers, [],
+                                                  timeout)
+            return set(readable), set(writable)
+        # poll() has no FD_SETSIZE limit on the number of clients
+        events = {}
+        for fd in readers:
+            events[fd] = select.POLLIN
+        for fd in writers:
+            events[fd] = events.get(fd, 0) | select.POLLOUT
+        poller = select.poll()
+        for fd, mask in events.items():
+            poller.register(fd, mask)
+        ready = poller.poll(None if timeout is None else timeout * 1000)
+    except (select.error, OSError, IOError) as error:
+        if error.args[0] != errno.EINTR:
+            raise
+        return set(), set()
+    broken = select.POLLHUP | select.POLLERR | select.POLLNVAL
+    readable = set(fd for fd, mask in ready if mask & (select.POLLIN | broken))
+    writable = set(fd for fd, mask in ready if mask & select.POLLOUT)
+    return readable, writable
+
+
+class _StreamServer:
+    """
+    Single threaded event loop serving /events to every client.
+    """
+
+    maxRequest = 8192
+
+    def __init__(self, stream, address):
+        self.stream = stream
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(address)
+        self.socket.listen(128)
+        self.socket.setblocking(0)
+        self.server_address = self.socket.getsockname()
+        self.connections = {}
+        self._ready = set()
+        self._readyLock = threading.Lock()
+        self._wakeRead, self._wakeWrite = os.pipe()
+        _nonblocking(self._wakeRead)
+        _nonblocking(self._wakeWrite)
+        self._running = False
+        self._stopped = threading.Event()
+
+    def wake(self, connection=None):
+        """Mark a connection as having events and interrupt the wait"""
+        with self._readyLock:
+            waiting = bool(self._ready)
+            if connection is not None:
+                self._ready.add(connection)
+        if not waiting:
+            try:
+                os.write(self._wakeWrite, "x")
+            except OSError:
+                pass  # The pipe is full, the loop is awake already
+
+    def serve_forever(self):
+        self._running = True
+        self._stopped.clear()
+        try:
+            while self._running:
+                self._step()
+        finally:
+            for connection in self.connections.values():
+                connection.close()
+            self._stopped.set()
+
+    def shutdown(self):
+        """Stop serve_forever() and wait for it to return"""
+        self._running = False
+        self.wake()
+        self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        os.close(self._wakeRead)
+        os.close(self._wakeWrite)
+
+    def _step(self):
+        with self._readyLock:
+            ready = self._ready
+            self._ready = set()
+        for connection in ready:
+            connection.fill()
+        now = time.time()
+        keepalive = self.stream.keepalive
+        timeout = None
+        writers = []
+        for fd, connection in self.connections.items():
+            if connection.subscriber is not None and not connection.out:
+                due = connection.lastWrite + keepalive - now
+                if due <= 0:
+                    connection.out = ": keepalive\n\n"
+                else:
+                    timeout = due if timeout is None else min(timeout, due)
+            if connection.out:
+                writers.append(fd)
+        listener = self.socket.fileno()
+        readers = [listener, self._wakeRead] + self.connections.keys()
+        readable, writable = _wait(readers, writers, timeout)
+        if self._wakeRead in readable:
+            try:
+                os.read(self._wakeRead, 4096)
+            except OSError:
+                pass
+        if listener in readable:
+            self._accept()
+        for fd in writable:
+            connection = self.connections.get(fd)
+            if connection is not None:
+                connection.write()
+        for fd in readable:
+            connection = self.connections.get(fd)
+            if connection is not None:
+                connection.read()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except socket.error as error:
+                if error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                     errno.EINTR, errno.ECONNABORTED):
+                    return
+                raise
+            client.setblocking(0)
+            self.connections[client.fileno()] = _Connection(self, client)
+
+
+class _Connection:
+    """
+    One client of a _StreamServer, touched only by the loop thread.
+    """
+
+    def __init__(self, server, client):
+        self.server = server
+        self.client = client
+        self.request = ""
+        self.out = ""
+        self.subscriber = None
+        self.closing = False
+        self.lastWrite = time.time()
+
+    def read(self):
+        try:
+            data = self.client.recv(4096)
+        except socket.error as error:
+            if error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                 errno.EINTR):
+                return
+            data = ""
+        if not data:
+            self.close()
+        elif self.subscriber is None and not self.closing:
+            # Anything sent after the request line and headers is ignored
+            self.request += data
+            if "\n\r\n" in self.request or "\n\n" in self.request:
+                self._respond()
+            elif len(self.request) > self.server.maxRequest:
+                self._fail("413 Request Entity Too Large")
+
+    def _respond(self):
+        words = self.request.split("\n", 1)[0].split()
+        if len(words) < 2 or words[0] != "GET":
+            self._fail("405 Method Not Allowed")
+        elif words[1].split("?")[0] != "/events":
+            self._fail("404 Not Found")
+        else:
+            self.out = ("HTTP/1.0 200 OK\r\n"
+                        "Content-Type: text/event-stream\r\n"
+                        "Cache-Control: no-cache\r\n\r\n")
+            self.subscriber = self.server.stream.subscribe(
+                lambda: self.server.wake(self))
+
+    def _fail(self, status):
+        self.out = ("HTTP/1.0 %s\r\nContent-Type: text/plain\r\n"
+                    "Content-Length: %d\r\n\r\n%s" %
+                    (status, len(status), status))
+        self.closing = True
+
+    def fill(self):
+        """Take pending events once the previous ones are written"""
+        if self.subscriber is None or self.out or self.client is None:
+            return
+        events = self.subscriber.take(0)
+        if events:
+            self.out = "".join(events)
+        elif self.subscriber.closed:
+            self.close()
+
+    def write(self):
+        try:
+            sent = self.client.send(self.out)
+        except socket.error as error:
+            if error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                 errno.EINTR):
+                return
+            self.close()
+            return
+        self.out = self.out[sent:]
+        self.lastWrite = time.time()
+        if not self.out:
+            if self.closing:
+                self.close()
+            else:
+                self.fill()
+
+    def close(self):
+        if self.client is None:
+            return
+        self.server.connections.pop(self.client.fileno(), None)
+        self.client.close()
+        self.client = None
+        if self.subscriber is not None:
+            self.server.stream.unsubscribe(self.subscriber)
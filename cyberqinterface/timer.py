@@ -0,0 +1,108 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Conversion between CyberQ timer strings and seconds.
+
+The CyberQ reports TIMER_CURR as HH:MM:SS and expects the same format for
+_COOK_TIMER and COOK_TIMER. parseTimer() slices the fixed eight character
+layout directly instead of going through time.strptime().
+"""
+from cyberqinterface_exceptions import *
+
+TIMER_PARAMETERS = ("_COOK_TIMER", "COOK_TIMER")
+
+
+def parseTimer(text):
+    """
+    Convert a timer string to seconds
+
+    Keyword arguments:
+    <String> text - HH:MM:SS, hours may have more than two digits
+
+    Returns:
+    <int> seconds
+
+    Raises: ResponseValidationException
+
+    Example Usage:
+    parseTimer(cqi.getStatus().TIMER_CURR.text)
+    """
+    try:
+        if len(text) == 8 and text[2] == ":" and text[5] == ":":
+            return (int(text[0:2]) * 3600 + int(text[3:5]) * 60 +
+                    int(text[6:8]))
+        hours, minutes, seconds = text.split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    except (TypeError, ValueError):
+        raise ResponseValidationException("Invalid timer from CyberQ", text)
+
+
+def parseTimers(texts):
+    """
+    Convert a column of timer strings to seconds. Repeated values, such as
+    an idle 00:00:00 timer, are only parsed once.
+
+    Keyword arguments:
+    <list> texts - timer strings, None entries stay None
+
+    Returns:
+    <list> seconds
+
+    Example Usage:
+    seconds = parseTimers(column)
+    """
+    cache = {None: None}
+    results = []
+    append = results.append
+    for text in texts:
+        try:
+            append(cache[text])
+        except KeyError:
+            value = cache[text] = parseTimer(text)
+            append(value)
+    return results
+
+
+def encodeTimer(seconds):
+    """
+    Convert seconds to a timer string
+
+    Keyword arguments:
+    <int> seconds - non negative duration
+
+    Returns:
+    <String> HH:MM:SS
+
+    Raises: ParameterValidationException
+
+    Example Usage:
+    encodeTimer(5400)
+    """
+    seconds = int(seconds)
+    if seconds < 0:
+        raise ParameterValidationException("Timer cannot be negative",
+                                           seconds)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d" % (hours, minutes, seconds)
+
+
+def timerParameters(seconds):
+    """
+    Build the sendUpdate parameters that set the countdown timer. Both timer
+    keys are set so the change survives a refresh; sendUpdate urlencodes
+    the colons.
+
+    Keyword arguments:
+    <int> seconds - duration of the countdown
+
+    Returns:
+    <Dictionary> {'_COOK_TIMER': 'HH:MM:SS', 'COOK_TIMER': 'HH:MM:SS'}
+
+    Example Usage:
+    cqi.sendUpdate(timerParameters(90 * 60))
+    """
+    text = encodeTimer(seconds)
+    return dict((key, text) for key in TIMER_PARAMETERS)
@@ -0,0 +1,469 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+HTTP transports used by CyberQInterface.
+
+A transport has two methods, get(url) and post(url, data, headers), and
+returns an object with the status_code, content, text, reason and url
+attributes of a requests.Response. CyberQInterface uses RequestsTransport
+unless another one is passed in:
+
+* RequestsTransport - the requests library, optionally with a pooled
+  keep-alive session
+* SocketTransport - a lean HTTP/1.0 client on a plain socket
+* FakeTransport - serves documents from memory, for tests and benchmarks
+
+AsyncTransport wraps any of them with a pool of worker threads and delivers
+responses to callbacks. ScheduledTransport wraps one to keep each CyberQ to
+a single request at a time at a limited rate.
+"""
+import heapq
+import itertools
+import socket
+import threading
+import time
+import urllib
+import urlparse
+from Queue import Queue
+
+import requests
+import requests.adapters
+
+
+class TransportResponse:
+    """
+    The parts of an HTTP response CyberQInterface uses.
+    """
+
+    def __init__(self, status_code, content, reason="", url=""):
+        self.status_code = status_code
+        self.content = content
+        self.reason = reason
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+
+class Transport:
+    """
+    Interface of a transport.
+    """
+
+    def get(self, url):
+        """
+        Keyword arguments:
+        <String> url - full URL of the document
+
+        Returns:
+        Response with status_code, content, text, reason and url
+        """
+        raise NotImplementedError
+
+    def post(self, url, data, headers=None):
+        """
+        Keyword arguments:
+        <String> url
+        <dictionary> data - form fields, or an already urlencoded string
+        (optional) <dictionary> headers
+
+        Returns:
+        Response with status_code, content, text, reason and url
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections held by the transport"""
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    Transport on top of the requests library.
+    """
+
+    def __init__(self, pooled=False, poolSize=10, timeout=None):
+        """
+        **Keyword arguments:**
+        * (optional) **<Boolean>** Keep connections alive in a Session
+        * (optional) **<int>** Connections kept per host when pooled
+        * (optional) **<float>** Seconds before a request times out
+        """
+        self.timeout = timeout
+        self.session = None
+        if pooled:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=poolSize,
+                                                    pool_maxsize=poolSize)
+            self.session.mount("http://", adapter)
+
+    def get(self, url):
+        if self.session is not None:
+            return self.session.get(url, timeout=self.timeout)
+        if self.timeout is None:
+            return requests.get(url)
+        return requests.get(url, timeout=self.timeout)
+
+    def post(self, url, data, headers=None):
+        if self.session is not None:
+            return self.session.post(url, data=data, headers=headers,
+                                     timeout=self.timeout)
+        if self.timeout is None:
+            return requests.post(url, data=data, headers=headers)
+        return requests.post(url, data=data, headers=headers,
+                             timeout=self.timeout)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+def _splitURL(url):
+    """Return (host, port, path) of an http URL"""
+    if not url.startswith("http://"):
+        raise ValueError("Only http URLs are supported: %s" % url)
+    rest = url[len("http://"):]
+    hostPort, slash, path = rest.partition("/")
+    host, colon, port = hostPort.partition(":")
+    return host, int(port or 80), "/" + path
+
+
+def _parseHead(head, url):
+    """Return (status code, reason, content length or None) of a header"""
+    lines = head.split("\r\n")
+    parts = lines[0].split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise socket.error("Bad HTTP status line from %s" % url)
+    length = None
+    for line in lines[1:]:
+        name, colon, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return int(parts[1]), parts[2] if len(parts) > 2 else "", length
+
+
+_buffers = threading.local()
+
+
+class SocketTransport(Transport):
+    """
+    Minimal HTTP/1.0 client for the CyberQ's embedded web server.
+
+    Requests for each URL are built once and reused. Responses are read with
+    recv_into() into a bytearray kept per thread, and the body is copied out
+    of it exactly once, into the string handed to the XML parser.
+    """
+
+    def __init__(self, timeout=10.0, bufferSize=8192):
+        """
+        **Keyword arguments:**
+        * (optional) **<float>** Seconds before a request times out
+        * (optional) **<int>** Initial size of the receive buffer, it grows
+          if a response does not fit
+        """
+        self.timeout = timeout
+        self.bufferSize = bufferSize
+        # url: ((host, port), request bytes)
+        self._requests = {}
+
+    def _buildRequest(self, method, host, path, body="", headers=None):
+        lines = ["%s %s HTTP/1.0" % (method, path), "Host: %s" % host]
+        if method == "POST":
+            lines.append("Content-Length: %d" % len(body))
+        for name, value in (headers or {}).items():
+            if name.lower() not in ("host", "content-length"):
+                lines.append("%s: %s" % (name, value))
+        return "\r\n".join(lines) + "\r\n\r\n" + body
+
+    def _buffer(self):
+        buf = getattr(_buffers, "buffer", None)
+        if buf is None:
+            buf = _buffers.buffer = bytearray(self.bufferSize)
+        return buf
+
+    def _request(self, url, address, request):
+        connection = socket.create_connection(address, self.timeout)
+        try:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.sendall(request)
+            buf = self._buffer()
+            view = memoryview(buf)
+            length = 0
+            bodyStart = None
+            expected = None
+            while expected is None or length < expected:
+                if length == len(buf):
+                    # A bytearray cannot grow while a view of it exists
+                    del view
+                    buf.extend(bytearray(len(buf)))
+                    view = memoryview(buf)
+                received = connection.recv_into(view[length:])
+                if not received:
+                    break
+                length += received
+                if bodyStart is None:
+                    headEnd = buf.find("\r\n\r\n", 0, length)
+                    if headEnd >= 0:
+                        bodyStart = headEnd + 4
+                        status, reason, contentLength = _parseHead(
+                            str(buf[:headEnd]), url)
+                        if contentLength is not None:
+                            expected = bodyStart + contentLength
+        finally:
+            connection.close()
+        if bodyStart is None:
+            raise socket.error("Incomplete HTTP response from %s" % url)
+        end = length if expected is None else min(length, expected)
+        return TransportResponse(status, view[bodyStart:end].tobytes(),
+                                 reason, url)
+
+    def get(self, url):
+        prepared = self._requests.get(url)
+        if prepared is None:
+            host, port, path = _splitURL(url)
+            prepared = ((host, port), self._buildRequest("GET", host, path))
+            self._requests[url] = prepared
+        return self._request(url, prepared[0], prepared[1])
+
+    def post(self, url, data, headers=None):
+        if isinstance(data, dict):
+            data = urllib.urlencode(data)
+        host, port, path = _splitURL(url)
+        return self._request(url, (host, port),
+                             self._buildRequest("POST", host, path, data,
+                                                headers))
+
+
+class FakeTransport(Transport):
+    """
+    In-memory stand-in for a CyberQ.
+    """
+
+    def __init__(self, documents=None, latency=0.0, status_code=200):
+        """
+        **Keyword arguments:**
+        * (optional) **<Dictionary>** objectURI: XML bytes, for example
+          {"status.xml": "<nutcstatus>...</nutcstatus>"}
+        * (optional) **<float>** Seconds each request sleeps
+        * (optional) **<int>** Status code of every response
+
+        Posted form fields are recorded in self.posts.
+        """
+        self.documents = documents or {}
+        self.latency = latency
+        self.status_code = status_code
+        self.posts = []
+
+    def _respond(self, url, content):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.status_code != 200:
+            return TransportResponse(self.status_code, "", "Error", url)
+        return TransportResponse(200, content, "OK", url)
+
+    def get(self, url):
+        document = url.rsplit("/", 1)[-1]
+        if document not in self.documents:
+            return TransportResponse(404, "", "Not Found", url)
+        return self._respond(url, self.documents[document])
+
+    def post(self, url, data, headers=None):
+        self.posts.append(data)
+        return self._respond(url, "")
+
+
+class AsyncTransport:
+    """
+    Run the requests of a transport on worker threads.
+    """
+
+    def __init__(self, transport, workers=8):
+        """
+        **Keyword arguments:**
+        * **<Transport>** Transport doing the actual requests
+        * (optional) **<int>** Number of worker threads
+
+        **Example Usage:**
+        .. code-block:: python
+        transport = AsyncTransport(RequestsTransport(pooled=True))
+        transport.get(cqi.url + "status.xml", handleResponse)
+
+        A callback that raises does not stop its worker. The failures are
+        counted in self.metrics["callbackErrors"] and the latest exception
+        is kept in self.callbackError.
+        """
+        self.transport = transport
+        self.metrics = {"callbackErrors": 0}
+        self.callbackError = None
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._closed = False
+        self._workers = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def _work(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            method, args, callback = work
+            try:
+                response, error = method(*args), None
+            except Exception as e:
+                response, error = None, e
+            try:
+                callback(response, error)
+            except Exception as e:
+                with self._lock:
+                    self.metrics["callbackErrors"] += 1
+                    self.callbackError = e
+
+    def _put(self, work):
+        if self._closed:
+            raise ValueError("AsyncTransport is closed")
+        self._queue.put(work)
+
+    def get(self, url, callback):
+        """Fetch url and call callback(response, error) when done"""
+        self._put((self.transport.get, (url,), callback))
+
+    def post(self, url, data, headers, callback):
+        """Post data to url and call callback(response, error) when done"""
+        self._put((self.transport.post, (url, data, headers), callback))
+
+    def close(self):
+        """
+        Stop the workers once the queued requests are done and close the
+        wrapped transport
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for thread in self._workers:
+            self._queue.put(None)
+        for thread in self._workers:
+            thread.join()
+        self.transport.close()
+
+
+# Order of waiting requests to one CyberQ, lowest first. Other documents
+# come after config.xml.
+PRIORITIES = {"POST": 0, "status.xml": 1, "all.xml": 2, "config.xml": 3}
+
+
+class _HostSchedule:
+    """Token bucket and waiting requests of one CyberQ"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.busy = False
+        # heap of (priority, sequence) tickets
+        self.waiting = []
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class ScheduledTransport(Transport):
+    """
+    Keep every CyberQ to one request at a time at a limited rate.
+
+    Requests to the same host wait in the calling thread until the previous
+    one has finished and the host's token bucket allows another. Waiting
+    updates go first, then status.xml, all.xml and config.xml reads, oldest
+    first within each. Share one instance between every CyberQInterface of
+    a process so they are scheduled together.
+    """
+
+    def __init__(self, transport=None, rate=2.0, burst=2):
+        """
+        **Keyword arguments:**
+        * (optional) **<Transport>** Transport doing the requests, a
+          RequestsTransport if None
+        * (optional) **<float>** Requests per second allowed to each host
+        * (optional) **<int>** Requests a host may receive back to back
+          after being idle
+
+        **Example Usage:**
+        .. code-block:: python
+        transport = ScheduledTransport(RequestsTransport(pooled=True))
+        reader = CyberQInterface("10.0.1.5", transport=transport)
+        writer = CyberQInterface("10.0.1.5", transport=transport)
+        """
+        if transport is None:
+            transport = RequestsTransport()
+        self.transport = transport
+        self.rate = rate
+        self.burst = burst
+        self.metrics = {"requests": 0, "waited": 0.0}
+        self._schedules = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def _schedule(self, url):
+        host = urlparse.urlsplit(url).netloc
+        with self._lock:
+            schedule = self._schedules.get(host)
+            if schedule is None:
+                schedule = self._schedules[host] = _HostSchedule(self.rate,
+                                                                 self.burst)
+            return schedule
+
+    def _acquire(self, schedule, priority):
+        started = time.time()
+        with schedule.condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(schedule.waiting, ticket)
+            while True:
+                if schedule.busy or schedule.waiting[0] != ticket:
+                    schedule.condition.wait()
+                    continue
+                schedule.refill(time.time())
+                if schedule.tokens >= 1:
+                    break
+                schedule.condition.wait((1 - schedule.tokens) /
+                                        schedule.rate)
+            heapq.heappop(schedule.waiting)
+            schedule.tokens -= 1
+            schedule.busy = True
+        with self._lock:
+            self.metrics["requests"] += 1
+            self.metrics["waited"] += time.time() - started
+
+    def _release(self, schedule):
+        with schedule.condition:
+            schedule.busy = False
+            schedule.condition.notify_all()
+
+    def _request(self, url, priority, method, *args):
+        schedule = self._schedule(url)
+        self._acquire(schedule, priority)
+        try:
+            return method(url, *args)
+        finally:
+            self._release(schedule)
+
+    def get(self, url):
+        document = urlparse.urlsplit(url).path.rsplit("/", 1)[-1]
+        priority = PRIORITIES.get(document, len(PRIORITIES))
+        return self._request(url, priority, self.transport.get)
+
+    def post(self, url, data, headers=None):
+        return self._request(url, PRIORITIES["POST"], self.transport.post,
+                             data, headers)
+
+    def close(self):
+        self.transport.close()
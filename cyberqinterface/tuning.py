@@ -0,0 +1,277 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Step response and fan duty analysis for tuning PROPBAND and CYCTIME.
+
+A cook is split at every COOK_SET change into step responses. Each step is
+measured for overshoot past the setpoint, the time until the pit stays
+within tolerance of it, and the period of any oscillation around it. The
+fan is measured for mean duty, how often it is pinned at 0% or 100%, and
+how often it switches on and off.
+
+The recommendation is a starting point, not a controller model: a pit that
+oscillates or overshoots gets a wider PROPBAND, a sluggish one a narrower
+PROPBAND, and a fan that chatters on and off a longer CYCTIME. The PROPBAND
+in use is passed in tenths of a degree, as config.xml and
+ControllerState.control report it. The recommended parameters are in the
+units of sendUpdate, whole degrees, and can be passed straight to sendUpdate
+or fleet.pushConfig.
+
+analyzeCook() works on recorded columns, TuningMonitor collects them from a
+Poller. status.xml carries no COOK_SET, so that Poller must read the all or
+config document.
+"""
+import math
+from collections import namedtuple, deque
+
+# One COOK_SET step. start is when the setpoint took effect, setpoint and
+# overshoot are in degrees, settlingTime and period in seconds or None if
+# the pit never settled or did not oscillate.
+StepResponse = namedtuple("StepResponse", ["start", "setpoint", "overshoot",
+                                           "settlingTime", "period"])
+
+# Result of analyzeCook(). steps holds StepResponse tuples, the duty figures
+# are percentages, toggles is fan on/off switches per hour and parameters
+# the recommended sendUpdate values, empty if nothing should change.
+CookAnalysis = namedtuple("CookAnalysis", ["steps", "overshoot",
+                                           "settlingTime", "period",
+                                           "meanOutput", "outputDeviation",
+                                           "saturated", "idle", "toggles",
+                                           "parameters"])
+
+# Seconds a pit must stay within tolerance to count as settled
+SETTLE_HOLD = 600
+# Degrees, as sent by sendUpdate
+PROPBAND_RANGE = (5, 100)
+CYCTIME_RANGE = (4, 10)
+
+
+def _step(timestamps, temperatures, setpoint, tolerance):
+    """Measure one step, temperatures and tolerance in tenths"""
+    start = temperatures[0]
+    rising = setpoint >= start
+    overshoot = 0
+    crossed = False
+    crossings = []
+    settled = None
+    above = start > setpoint
+    for i in range(len(timestamps)):
+        temperature = temperatures[i]
+        if temperature is None:
+            continue
+        if abs(temperature - setpoint) > tolerance:
+            settled = None
+        elif settled is None:
+            settled = timestamps[i]
+        nowAbove = temperature > setpoint
+        if nowAbove != above:
+            crossed = True
+            if nowAbove:
+                crossings.append(timestamps[i])
+            above = nowAbove
+        if crossed:
+            if rising:
+                overshoot = max(overshoot, temperature - setpoint)
+            else:
+                overshoot = max(overshoot, setpoint - temperature)
+    period = None
+    if len(crossings) >= 2:
+        period = (crossings[-1] - crossings[0]) / float(len(crossings) - 1)
+    settlingTime = None
+    if settled is not None and timestamps[-1] - settled >= SETTLE_HOLD:
+        settlingTime = settled - timestamps[0]
+    return overshoot / 10.0, settlingTime, period
+
+
+def _clamp(value, limits):
+    return max(limits[0], min(limits[1], value))
+
+
+def _recommend(overshoot, settlingTime, period, toggles, propband, cyctime,
+               tolerance):
+    parameters = {}
+    if propband is not None:
+        # In tenths as the controller reports it, recommended in degrees
+        degrees = int(round(propband / 10.0))
+        if period is not None or overshoot > 2 * tolerance:
+            suggested = int(round(degrees * 1.25))
+        elif (overshoot < tolerance / 2.0 and settlingTime is not None and
+              settlingTime > 1800):
+            suggested = int(round(degrees * 0.8))
+        else:
+            suggested = degrees
+        suggested = _clamp(suggested, PROPBAND_RANGE)
+        if suggested != degrees:
+            parameters["PROPBAND"] = str(suggested)
+    if cyctime is not None and toggles is not None:
+        # More than one on/off switch a minute wears the fan for no gain
+        if toggles > 60:
+            suggested = _clamp(cyctime + 2, CYCTIME_RANGE)
+        elif toggles < 6:
+            suggested = _clamp(cyctime - 1, CYCTIME_RANGE)
+        else:
+            suggested = cyctime
+        if suggested != cyctime:
+            parameters["CYCTIME"] = str(suggested)
+    return parameters
+
+
+def analyzeCook(timestamps, cookTemps, cookSets, outputs, propband=None,
+                cyctime=None, tolerance=5.0):
+    """
+    Analyze one recorded cook
+
+    Keyword arguments:
+    <list> timestamps - seconds, ascending
+    <list> cookTemps - COOK_TEMP in tenths of a degree, None if OPEN
+    <list> cookSets - COOK_SET in tenths of a degree
+    <list> outputs - OUTPUT_PERCENT
+    (optional) <int> propband - PROPBAND in use in tenths of a degree, as
+    config.xml reports it, needed for a PROPBAND recommendation
+    (optional) <int> cyctime - CYCTIME in use, needed for a CYCTIME
+    recommendation
+    (optional) <float> tolerance - degrees from the setpoint that count as
+    settled, once the pit stays there for SETTLE_HOLD seconds
+
+    Returns:
+    <CookAnalysis>
+
+    Example Usage:
+    analysis = analyzeCook(times, temps, sets, outputs, 250, 6)
+    cqi.sendUpdate(analysis.parameters)
+    """
+    steps = []
+    begin = 0
+    for i in range(1, len(timestamps) + 1):
+        if i < len(timestamps) and cookSets[i] == cookSets[begin]:
+            continue
+        if cookSets[begin] is not None and cookTemps[begin] is not None:
+            overshoot, settlingTime, period = _step(
+                timestamps[begin:i], cookTemps[begin:i], cookSets[begin],
+                tolerance * 10)
+            steps.append(StepResponse(timestamps[begin],
+                                      cookSets[begin] / 10.0, overshoot,
+                                      settlingTime, period))
+        begin = i
+
+    overshoot = max([step.overshoot for step in steps] or [0.0])
+    settling = [step.settlingTime for step in steps
+                if step.settlingTime is not None]
+    settlingTime = max(settling) if settling else None
+    periods = [step.period for step in steps if step.period is not None]
+    period = sum(periods) / len(periods) if periods else None
+
+    samples = [output for output in outputs if output is not None]
+    meanOutput = outputDeviation = saturated = idle = toggles = None
+    if samples:
+        count = float(len(samples))
+        meanOutput = sum(samples) / count
+        outputDeviation = math.sqrt(sum((output - meanOutput) ** 2
+                                        for output in samples) / count)
+        saturated = 100 * samples.count(100) / count
+        idle = 100 * samples.count(0) / count
+        switches = sum(1 for a, b in zip(samples, samples[1:])
+                       if (a == 0) != (b == 0))
+        hours = (timestamps[-1] - timestamps[0]) / 3600.0
+        if hours > 0:
+            toggles = switches / hours
+
+    parameters = _recommend(overshoot, settlingTime, period, toggles,
+                            propband, cyctime, tolerance)
+    return CookAnalysis(steps, overshoot, settlingTime, period, meanOutput,
+                        outputDeviation, saturated, idle, toggles,
+                        parameters)
+
+
+def snapshotColumns(snapshots):
+    """
+    Split snapshots into the analyzeCook columns
+
+    Returns:
+    (timestamps, cookTemps, cookSets, outputs)
+    """
+    return ([snapshot.timestamp for snapshot in snapshots],
+            [snapshot.COOK_TEMP for snapshot in snapshots],
+            [snapshot.COOK_SET for snapshot in snapshots],
+            [snapshot.OUTPUT_PERCENT for snapshot in snapshots])
+
+
+def analyzeCooks(cooks, propband=None, cyctime=None, tolerance=5.0):
+    """
+    Analyze many recorded cooks
+
+    Keyword arguments:
+    <Dictionary> cooks - name: list of snapshots of one cook
+    (optional) <int> propband, cyctime, tolerance - as for analyzeCook
+
+    Returns:
+    <Dictionary> name: CookAnalysis
+    """
+    results = {}
+    for name, snapshots in cooks.items():
+        columns = snapshotColumns(snapshots)
+        results[name] = analyzeCook(*columns, propband=propband,
+                                    cyctime=cyctime, tolerance=tolerance)
+    return results
+
+
+class TuningMonitor:
+    """
+    Keep a bounded recent history of each controller for online analysis.
+
+    Steps are found from COOK_SET, which only all.xml and config.xml
+    report. Feed it from a Poller with document="all" or "config".
+    """
+
+    def __init__(self, maxSamples=17280, tolerance=5.0):
+        """
+        **Description:**
+        Initializer
+
+        **Keyword arguments:**
+        * (optional) **<int>** Snapshots kept per controller, a day at 5s
+        * (optional) **<float>** Degrees from the setpoint counted as settled
+
+        **Example Usage:**
+        .. code-block:: python
+        monitor = TuningMonitor()
+        poller = Poller(hosts, interval=5, document="all")
+        poller.addListener(monitor.update)
+        ...
+        control = cqi.getState().control
+        print monitor.analyze("10.0.1.5", control.PROPBAND,
+                              control.CYCTIME).parameters
+        """
+        self.maxSamples = maxSamples
+        self.tolerance = tolerance
+        self.history = {}
+
+    def update(self, snapshot, previous=None):
+        """Poller listener: record a snapshot"""
+        history = self.history.get(snapshot.host)
+        if history is None:
+            history = self.history[snapshot.host] = deque(
+                maxlen=self.maxSamples)
+        history.append(snapshot)
+
+    def analyze(self, host, propband=None, cyctime=None):
+        """
+        Analyze the recorded history of one controller
+
+        Returns:
+        <CookAnalysis> or None if nothing was recorded for host
+
+        Raises: ValueError if no snapshot of host had a COOK_SET, as when
+        the Poller reads status.xml
+        """
+        history = self.history.get(host)
+        if not history:
+            return None
+        if all(snapshot.COOK_SET is None for snapshot in history):
+            raise ValueError("No COOK_SET recorded for %s, poll the all or "
+                             "config document" % host)
+        return analyzeCook(*snapshotColumns(list(history)),
+                           propband=propband, cyctime=cyctime,
+                           tolerance=self.tolerance)
@@ -38,11 +38,16 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import time
 import unittest
 import requests
 from mock import patch
 from cyberqinterface.cyberqinterface import CyberQInterface
 from cyberqinterface.cyberqinterface_exceptions import *
+from cyberqinterface.history import SnapshotHistory
+from cyberqinterface.profiling import Profiler
+from cyberqinterface.simulator import STATUS_XML, ALL_XML, CONFIG_XML
+from cyberqinterface.transport import FakeTransport
 TestCyberQInterfaceSuite = unittest.TestLoader()
 
 class TestCyberQInterfaceInit(unittest.TestCase):
@@ -146,7 +151,7 @@ class TestCyberQInterfaceRequests(unittest.TestCase):
         with patch.object(requests, 'get') as mockMethod:
             with self.assertRaises(ResponseValidationException):
                 mockMethod.return_value.status_code = 200
-                mockMethod.return_value.text = """
+                mockMethod.return_value.content = """
 <nutcstatus>
 <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
 <!--all temperatures sent by browser to unit should be in F.  you can send-->
@@ -173,7 +178,7 @@ class TestCyberQInterfaceRequests(unittest.TestCase):
         """Test that the correct Object is returned"""
         with patch.object(requests, 'get') as mockMethod:
             mockMethod.return_value.status_code = 200
-            mockMethod.return_value.text = """
+            mockMethod.return_value.content = """
 <nutcstatus>
 <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
 <!--all temperatures sent by browser to unit should be in F.  you can send-->
@@ -202,7 +207,7 @@ class TestCyberQInterfaceRequests(unittest.TestCase):
         with patch.object(requests, 'get') as mockMethod:
             with self.assertRaises(AttributeError):
                 mockMethod.return_value.status_code = 200
-                mockMethod.return_value.text = """
+                mockMethod.return_value.content = """
 <nutcallstatus>
 <!--this is similar to status.xml, but with more values-->
 <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
@@ -248,7 +253,7 @@ class TestCyberQInterfaceRequests(unittest.TestCase):
         """Test that the config Object is returned"""
         with patch.object(requests, 'get') as mockMethod:
             mockMethod.return_value.status_code = 200
-            mockMethod.return_value.text = """
+            mockMethod.return_value.content = """
 <nutcallstatus>
 <!--this is similar to all.xml, but with more values-->
 <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
@@ -410,7 +415,7 @@ class TestCyberQInterfaceLookups(unittest.TestCase):
         """Test that the code from an actual status object works properly"""
         with patch.object(requests, 'get') as mockMethod:
             mockMethod.return_value.status_code = 200
-            mockMethod.return_value.text = """
+            mockMethod.return_value.content = """
 <nutcstatus>
 <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
 <!--all temperatures sent by browser to unit should be in F.  you can send-->
@@ -437,6 +442,294 @@ class TestCyberQInterfaceLookups(unittest.TestCase):
   
 TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceLookups)
 
+class TestCyberQInterfaceDocumentCache(unittest.TestCase):
+    """Test reuse of unchanged documents and the slow refresh cache"""
+    statusXML = """
+<nutcstatus>
+<OUTPUT_PERCENT>40</OUTPUT_PERCENT>
+<COOK_TEMP>2500</COOK_TEMP>
+<FOOD1_TEMP>OPEN</FOOD1_TEMP>
+<COOK_STATUS>2</COOK_STATUS>
+</nutcstatus>"""
+    allXML = """
+<nutcallstatus>
+<COOK>
+  <COOK_NAME>Big Green Egg</COOK_NAME>
+  <COOK_TEMP>3216</COOK_TEMP>
+  <COOK_SET>4000</COOK_SET>
+  <COOK_STATUS>0</COOK_STATUS>
+</COOK>
+<FOOD1>
+  <FOOD1_NAME>Chicken Quarters</FOOD1_NAME>
+  <FOOD1_TEMP>1482</FOOD1_TEMP>
+  <FOOD1_SET>1750</FOOD1_SET>
+  <FOOD1_STATUS>0</FOOD1_STATUS>
+</FOOD1>
+<OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+</nutcallstatus>"""
+
+    @classmethod
+    def transport(cls):
+        return FakeTransport({"status.xml": cls.statusXML,
+                              "all.xml": cls.allXML,
+                              "config.xml": CONFIG_XML})
+
+    def testIdenticalPayloadIsNotReparsed(self):
+        """Test an unchanged XML is copied instead of parsed again"""
+        cqi = CyberQInterface("127.0.0.1", transport=self.transport())
+        first = cqi.getStatus()
+        first.COOK_TEMP._setText("0")
+        second = cqi.getStatus()
+        self.assertFalse(first is second)
+        self.assertEqual(second.COOK_TEMP, 2500)
+        self.assertEqual(cqi.metrics["parsesSkipped"], 1)
+        self.assertEqual(cqi.metrics["requests"], 2)
+
+    def testSlowRefreshMergesStatus(self):
+        """Test getAll() only downloads status.xml inside the window"""
+        cqi = CyberQInterface("127.0.0.1", slowRefresh=60,
+                              transport=self.transport())
+        cqi.getAll()
+        merged = cqi.getAll()
+        self.assertEqual(merged.COOK.COOK_NAME, "Big Green Egg")
+        self.assertEqual(merged.COOK.COOK_SET, 4000)
+        self.assertEqual(merged.COOK.COOK_TEMP, 2500)
+        self.assertEqual(merged.FOOD1.FOOD1_TEMP, "OPEN")
+        self.assertEqual(merged.OUTPUT_PERCENT, 40)
+        self.assertEqual(cqi.metrics["bytesSaved"],
+                         len(self.allXML) - len(self.statusXML))
+
+    def testSlowRefreshMapsStatusNames(self):
+        """Test COOK_CYCTIME and COOK_PROPBAND refresh CYCTIME and PROPBAND"""
+        transport = self.transport()
+        cqi = CyberQInterface("127.0.0.1", slowRefresh=60,
+                              transport=transport)
+        cqi.getConfig()
+        transport.documents["status.xml"] = STATUS_XML.replace(
+            "<COOK_PROPBAND>500", "<COOK_PROPBAND>300")
+        merged = cqi.getConfig()
+        self.assertEqual(merged.CONTROL.PROPBAND, 300)
+        self.assertEqual(merged.CONTROL.CYCTIME, 6)
+        self.assertEqual(merged.COOK.COOK_TEMP, 3343)
+        self.assertFalse(hasattr(merged.CONTROL, "COOK_PROPBAND"))
+
+    def testSendUpdateClearsCache(self):
+        """Test a successful update forces the next full download"""
+        cqi = CyberQInterface("127.0.0.1", slowRefresh=60,
+                              transport=self.transport())
+        cqi.getAll()
+        cqi.sendUpdate({'COOK_SET': '300'})
+        cqi.getAll()
+        self.assertEqual(cqi.metrics["bytesSaved"], 0)
+        self.assertEqual(cqi.metrics["parsesSkipped"], 0)
+
+TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceDocumentCache)
+
+class TestCyberQInterfaceHistory(unittest.TestCase):
+    """Test the opt-in snapshot history"""
+
+    def testReadsAreRecorded(self):
+        """Test every read adds a decoded snapshot"""
+        cqi = CyberQInterface(
+            "127.0.0.1", history=SnapshotHistory(10),
+            transport=TestCyberQInterfaceDocumentCache.transport())
+        cqi.getStatus()
+        cqi.getStatus()
+        cqi.getAll()
+        self.assertEqual(len(cqi.history), 3)
+        self.assertEqual(cqi.history.latest().COOK_NAME, "Big Green Egg")
+        self.assertEqual(cqi.history.latest().host, "127.0.0.1")
+        self.assertEqual(cqi.history.maximum("COOK_TEMP"), 3216)
+        self.assertEqual(cqi.history.minimum("FOOD1_TEMP"), 1482)
+
+    def testLateSnapshotIsDropped(self):
+        """Test a read older than the newest recorded one still succeeds"""
+        cqi = CyberQInterface(
+            "127.0.0.1", history=SnapshotHistory(10),
+            transport=TestCyberQInterfaceDocumentCache.transport())
+        cqi.getStatus()
+        future = cqi.history.latest()._replace(timestamp=time.time() + 3600)
+        cqi.history.add(future)
+        self.assertEqual(cqi.getStatus().COOK_TEMP, 2500)
+        self.assertEqual(len(cqi.history), 2)
+        self.assertTrue(cqi.history.latest() is future)
+
+    def testNoHistoryByDefault(self):
+        """Test nothing is recorded unless a history is passed"""
+        cqi = CyberQInterface(
+            "127.0.0.1",
+            transport=TestCyberQInterfaceDocumentCache.transport())
+        cqi.getStatus()
+        self.assertEqual(cqi.history, None)
+
+TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceHistory)
+
+class TestCyberQInterfaceState(unittest.TestCase):
+    """Test the combined state read from config.xml"""
+
+    def setUp(self):
+        self.gets = []
+
+    def fakeGet(self, url):
+        self.gets.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = CONFIG_XML
+        return response
+
+    def testState(self):
+        """Test temperatures and settings come from one read"""
+        with patch.object(requests, 'get', self.fakeGet):
+            cqi = CyberQInterface("127.0.0.1")
+            state = cqi.getState()
+        self.assertEqual(self.gets, ["http://127.0.0.1/config.xml"])
+        self.assertEqual(state.version, 1)
+        self.assertEqual(state.snapshot.COOK_TEMP, 3220)
+        self.assertEqual(state.snapshot.COOK_SET, 4000)
+        self.assertEqual(state.control.PROPBAND, 500)
+        self.assertEqual(state.control.CYCTIME, 6)
+        self.assertEqual(state.system.DEG_UNITS, 1)
+        with self.assertRaises(AttributeError):
+            state.control.CYCTIME = 4
+
+    def testReuseAndInvalidation(self):
+        """Test maxAge reuses a state until an update succeeds"""
+        with patch.object(requests, 'get', self.fakeGet):
+            with patch.object(requests, 'post') as mockMethod:
+                mockMethod.return_value.status_code = 200
+                cqi = CyberQInterface("127.0.0.1")
+                first = cqi.getState()
+                self.assertTrue(cqi.getState(maxAge=60) is first)
+                self.assertEqual(cqi.getState().version, 2)
+                cqi.sendUpdate({'COOK_SET': '300'})
+                self.assertEqual(cqi.getState(maxAge=60).version, 3)
+        self.assertEqual(len(self.gets), 3)
+
+TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceState)
+
+class LaggingTransport(FakeTransport):
+    """Serves new documents only after a few reads following a post"""
+
+    def __init__(self, documents, updated, lag):
+        FakeTransport.__init__(self, dict(documents))
+        self.updated = updated
+        self.lag = lag
+        self.gets = []
+        self.pending = None
+
+    def get(self, url):
+        self.gets.append(url.rsplit("/", 1)[-1])
+        if self.pending is not None:
+            self.pending -= 1
+            if self.pending < 0:
+                self.documents.update(self.updated)
+                self.pending = None
+        return FakeTransport.get(self, url)
+
+    def post(self, url, data, headers=None):
+        self.pending = self.lag
+        return FakeTransport.post(self, url, data, headers)
+
+class TestCyberQInterfaceConfirm(unittest.TestCase):
+    """Test sendUpdate(confirm=True)"""
+
+    def interface(self, objectURI, old, new, lag):
+        transport = LaggingTransport({objectURI: old},
+                                     {objectURI: old.replace(*new)}, lag)
+        return CyberQInterface("127.0.0.1", transport=transport), transport
+
+    def testConfirmFromAll(self):
+        """Test setpoints are confirmed from all.xml after a few reads"""
+        cqi, transport = self.interface(
+            "all.xml", ALL_XML, ("<COOK_SET>4000", "<COOK_SET>2500"), 2)
+        snapshot = cqi.sendUpdate({'COOK_SET': '250'}, confirm=True)
+        self.assertEqual(snapshot.COOK_SET, 2500)
+        self.assertEqual(transport.gets, ["all.xml"] * 3)
+        self.assertEqual(cqi.getAll().COOK.COOK_SET, 2500)
+        self.assertEqual(len(transport.gets), 3)
+        cqi.getAll()
+        self.assertEqual(len(transport.gets), 4)
+
+    def testConfirmFromStatus(self):
+        """Test PROPBAND is confirmed from COOK_PROPBAND in status.xml"""
+        cqi, transport = self.interface(
+            "status.xml", STATUS_XML,
+            ("<COOK_PROPBAND>500", "<COOK_PROPBAND>300"), 0)
+        cqi.sendUpdate({'PROPBAND': '30'}, confirm=True)
+        self.assertEqual(transport.gets, ["status.xml"])
+
+    def testConfirmFromConfigUpdatesState(self):
+        """Test a config.xml confirmation becomes the current state"""
+        cqi, transport = self.interface(
+            "config.xml", CONFIG_XML, ("<COOKHOLD>2000", "<COOKHOLD>1800"),
+            0)
+        cqi.sendUpdate({'COOKHOLD': '180'}, confirm=True)
+        self.assertEqual(cqi.getState(maxAge=60).control.COOKHOLD, 1800)
+        self.assertEqual(len(transport.gets), 1)
+
+    def testCelsius(self):
+        """Test whole degree C storage still confirms"""
+        celsius = CONFIG_XML.replace("<DEG_UNITS>1", "<DEG_UNITS>0")
+        cqi, transport = self.interface(
+            "config.xml", celsius, ("<COOKHOLD>2000", "<COOKHOLD>1796"), 0)
+        cqi.sendUpdate({'COOKHOLD': '180', 'OPENDETECT': '1'}, confirm=True)
+
+    def testConfirmingReadRecordedOnce(self):
+        """Test the confirming read is not recorded again by the next read"""
+        cqi, transport = self.interface(
+            "status.xml", STATUS_XML,
+            ("<COOK_PROPBAND>500", "<COOK_PROPBAND>300"), 0)
+        cqi.history = SnapshotHistory(10)
+        snapshot = cqi.sendUpdate({'PROPBAND': '30'}, confirm=True)
+        cqi.getStatus()
+        self.assertEqual(len(transport.gets), 1)
+        self.assertEqual(cqi.history.snapshots(), [snapshot])
+        cqi.getStatus()
+        self.assertEqual(len(cqi.history), 2)
+
+    def testNotConfirmed(self):
+        """Test an update that never shows up raises"""
+        cqi, transport = self.interface(
+            "all.xml", ALL_XML, ("<COOK_SET>4000", "<COOK_SET>4000"), 0)
+        with self.assertRaises(ResponseValidationException) as context:
+            cqi.sendUpdate({'COOK_SET': '250'}, confirm=True, timeout=0.3)
+        self.assertEqual(context.exception.errors,
+                         {'COOK_SET': ('2500', '4000')})
+
+TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceConfirm)
+
+class TestCyberQInterfaceProfiler(unittest.TestCase):
+    """Test the phases timed by a profiler"""
+
+    def testPhases(self):
+        """Test polls, requests, parses and lookups are timed"""
+        profiler = Profiler()
+        cqi = CyberQInterface("127.0.0.1", profiler=profiler,
+                              transport=FakeTransport({
+                                  "status.xml": STATUS_XML,
+                                  "config.xml": CONFIG_XML}))
+        status = cqi.getStatus()
+        cqi.statusLookup(status.COOK_STATUS)
+        cqi.getState()
+        cqi.getConfigXML()
+        phases = profiler.phases
+        self.assertEqual(phases["poll"].count, 3)
+        self.assertEqual(phases["request"].count, 3)
+        self.assertEqual(phases["parse"].count, 2)
+        self.assertEqual(phases["lookup"].count, 1)
+        self.assertEqual(profiler.hosts[("poll", "127.0.0.1")][0], 3)
+
+    def testFailedRequest(self):
+        """Test a request that fails is still timed"""
+        profiler = Profiler()
+        cqi = CyberQInterface("127.0.0.1", profiler=profiler,
+                              transport=FakeTransport())
+        self.assertRaises(ResponseHTTPException, cqi.getStatus)
+        self.assertEqual(profiler.phases["poll"].errors, 1)
+        self.assertEqual(profiler.phases["request"].errors, 0)
+
+TestCyberQInterfaceSuite.loadTestsFromTestCase(TestCyberQInterfaceProfiler)
+
 if __name__ == '__main__':
     import nose
     nose.main()
@@ -0,0 +1,86 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for probe anomaly detection
+"""
+
+import unittest
+from cyberqinterface.anomaly import AnomalyDetector, Thresholds, Anomaly
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+
+def makeSnapshot(timestamp, food1, host="pit"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, FOOD1_TEMP=food1)
+    return Snapshot(**values)
+
+def warming(start=0, count=20, host="pit"):
+    """A food probe rising 0.5 degrees with a little noise every 5s"""
+    return [makeSnapshot(start + i * 5, 1000 + i * 5 + (i % 3), host)
+            for i in range(count)]
+
+class TestAnomalyDetector(unittest.TestCase):
+    """Test each kind of anomaly and per host settings"""
+
+    def setUp(self):
+        self.detector = AnomalyDetector(probes=("FOOD1",))
+
+    def kinds(self, snapshots, detector=None):
+        detector = detector or self.detector
+        return [(a.timestamp, a.kind) for a in detector.evaluate(snapshots)]
+
+    def testQuiet(self):
+        """Test a normal cook raises nothing"""
+        self.assertEqual(self.kinds(warming(count=200)), [])
+
+    def testSpike(self):
+        """Test a single wild reading is a spike"""
+        history = warming()
+        history.append(makeSnapshot(100, 1400))
+        self.assertEqual(self.kinds(history), [(100, "spike")])
+
+    def testRate(self):
+        """Test an impossible rate of change"""
+        history = warming()
+        history.append(makeSnapshot(96, 1400))
+        self.assertEqual(self.kinds(history), [(96, "rate")])
+
+    def testOpen(self):
+        """Test OPEN is reported once and the probe can come back"""
+        history = warming()
+        history += [makeSnapshot(100, None), makeSnapshot(105, None)]
+        history += warming(110)
+        self.assertEqual(self.kinds(history), [(100, "open")])
+
+    def testOpenFromTheStart(self):
+        """Test a probe that was never connected is not reported"""
+        history = [makeSnapshot(i * 5, None) for i in range(5)]
+        history += warming(25) + [makeSnapshot(200, None)]
+        self.assertEqual(self.kinds(history), [(200, "open")])
+
+    def testFlatline(self):
+        """Test an unchanged reading is reported once"""
+        history = [makeSnapshot(i * 60, 1500) for i in range(30)]
+        self.assertEqual(self.kinds(history), [(900, "flatline")])
+
+    def testPerHostThresholds(self):
+        """Test configure() changes the settings of one controller"""
+        self.detector.configure("fast", Thresholds(maxRate=100.0,
+                                                   minDeviation=100.0))
+        history = warming() + [makeSnapshot(96, 1400)]
+        fast = warming(host="fast") + [makeSnapshot(96, 1400, "fast")]
+        self.assertEqual(self.kinds(history + fast), [(96, "rate")])
+
+    def testSink(self):
+        """Test the live listener passes anomalies to the sink"""
+        found = []
+        detector = AnomalyDetector(sink=found.append, probes=("FOOD1",))
+        for snapshot in warming():
+            detector.update(snapshot)
+        self.assertEqual(detector.update(makeSnapshot(100, None)),
+                         [Anomaly("pit", "FOOD1", "open", 100, None)])
+        self.assertEqual(len(found), 1)
+
+if __name__ == '__main__':
+    unittest.main()
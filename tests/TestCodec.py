@@ -0,0 +1,80 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the snapshot column codec
+"""
+
+import io
+import random
+import unittest
+from lxml import objectify
+from cyberqinterface.codec import (encodeSnapshots, decodeSnapshots,
+                                   writeBlock, readBlocks)
+from cyberqinterface.simulator import STATUS_XML, ALL_XML
+from cyberqinterface.snapshot import decodeSnapshot
+
+def recording(hosts=("pit1", "pit2", "pit3"), rounds=200, seed=1):
+    """Interleaved snapshots of a few hosts drifting slowly"""
+    rng = random.Random(seed)
+    base = decodeSnapshot(objectify.fromstring(ALL_XML), None, 0)
+    snapshots = []
+    for i in range(rounds):
+        for number, host in enumerate(hosts):
+            snapshots.append(base._replace(
+                host=host,
+                timestamp=1350000000 + i * 5 + number * 0.125,
+                COOK_TEMP=2250 + rng.randint(-20, 20),
+                FOOD1_TEMP=900 + i + number,
+                FOOD2_TEMP=None if i % 50 < 10 else 700 - i,
+                OUTPUT_PERCENT=rng.choice((0, 0, 0, 35, 100)),
+                TIMER_CURR=max(0, 3600 - i * 5),
+                FOOD1_NAME=u"Brisket \xe9" if host == "pit2" else
+                           base.FOOD1_NAME))
+    return snapshots
+
+class TestCodec(unittest.TestCase):
+    """Test blocks decode to the snapshots they were made from"""
+
+    def testRoundTrip(self):
+        """Test interleaved hosts, OPEN probes and names survive"""
+        snapshots = recording()
+        self.assertEqual(decodeSnapshots(encodeSnapshots(snapshots)),
+                         snapshots)
+
+    def testDocuments(self):
+        """Test snapshots of the sample documents survive"""
+        snapshots = [decodeSnapshot(objectify.fromstring(STATUS_XML),
+                                    "10.0.1.5", 1.5),
+                     decodeSnapshot(objectify.fromstring(ALL_XML), None, -2)]
+        self.assertEqual(decodeSnapshots(encodeSnapshots(snapshots)),
+                         snapshots)
+
+    def testEmpty(self):
+        """Test an empty block"""
+        self.assertEqual(decodeSnapshots(encodeSnapshots([])), [])
+
+    def testCompression(self):
+        """Test a block is far smaller than a block per snapshot"""
+        snapshots = recording()
+        single = sum(len(encodeSnapshots([snapshot]))
+                     for snapshot in snapshots)
+        self.assertTrue(len(encodeSnapshots(snapshots)) * 5 < single)
+
+    def testBadBlock(self):
+        """Test data that is not a block is refused"""
+        with self.assertRaises(ValueError):
+            decodeSnapshots("<nutcstatus/>")
+
+    def testFile(self):
+        """Test framed blocks read back in order"""
+        snapshots = recording()
+        stream = io.BytesIO()
+        writeBlock(stream, snapshots[:100])
+        writeBlock(stream, snapshots[100:])
+        stream.seek(0)
+        self.assertEqual(list(readBlocks(stream)), snapshots)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for client-side cook programs
+"""
+
+import threading
+import time
+import unittest
+from cyberqinterface.cyberqinterface import CyberQInterface
+from cyberqinterface.cyberqinterface_exceptions import *
+from cyberqinterface.cookprogram import Stage, CookProgram, ProgramRunner
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface.transport import FakeTransport
+
+def makeSnapshot(timestamp, food1, cookSet=2250, host="pit"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=2250,
+                  FOOD1_TEMP=food1, COOK_SET=cookSet)
+    return Snapshot(**values)
+
+def brisket(host="pit"):
+    return CookProgram(host, [Stage(225, probe="FOOD1", target=160),
+                              Stage(275, probe="FOOD1", target=203,
+                                    ramp=1),
+                              Stage(275, cookHold=170)])
+
+class TestCookProgram(unittest.TestCase):
+    """Test stage transitions and the writes they need"""
+
+    def testStages(self):
+        """Test only changed settings are returned"""
+        program = brisket()
+        # The controller already runs at 225
+        self.assertEqual(program.evaluate(makeSnapshot(0, 1000)), {})
+        self.assertEqual(program.evaluate(makeSnapshot(5, 1500)), {})
+        self.assertEqual(program.evaluate(makeSnapshot(10, 1600)),
+                         {"COOK_SET": "275", "COOK_RAMP": "1"})
+        self.assertEqual(program.index, 1)
+        self.assertEqual(program.evaluate(makeSnapshot(15, 1700, 2750)), {})
+        self.assertEqual(program.evaluate(makeSnapshot(20, 2030, 2750)),
+                         {"COOKHOLD": "170"})
+        self.assertEqual(program.evaluate(makeSnapshot(25, 2100, 2750)), {})
+        self.assertEqual(program.index, 2)
+
+    def testDuration(self):
+        """Test a stage ends after its duration"""
+        program = CookProgram("pit", [Stage(225, duration=3600),
+                                      Stage(250)])
+        self.assertEqual(program.evaluate(makeSnapshot(100, 1000)), {})
+        self.assertEqual(program.evaluate(makeSnapshot(3699, 1000)), {})
+        self.assertEqual(program.evaluate(makeSnapshot(3700, 1000)),
+                         {"COOK_SET": "250"})
+
+    def testSkipsSeveralStages(self):
+        """Test a late snapshot can complete several stages at once"""
+        program = brisket()
+        self.assertEqual(program.evaluate(makeSnapshot(0, 2100, 0)),
+                         {"COOK_SET": "275", "COOKHOLD": "170"})
+        self.assertEqual(program.index, 2)
+
+    def testInvalidStages(self):
+        """Test stages are validated"""
+        with self.assertRaises(ParameterValidationException):
+            CookProgram("pit", [])
+        with self.assertRaises(ParameterValidationException):
+            CookProgram("pit", [Stage(225, probe="COOK", target=200)])
+        with self.assertRaises(ParameterValidationException):
+            CookProgram("pit", [Stage(225, probe="FOOD1")])
+
+class TestProgramRunner(unittest.TestCase):
+    """Test writes are queued, merged and sent"""
+
+    def setUp(self):
+        self.fake = FakeTransport()
+        self.runner = ProgramRunner(
+            {"pit": CyberQInterface("pit", transport=self.fake)})
+        self.runner.addProgram(brisket())
+
+    def testFlush(self):
+        """Test pending writes for a host are merged into one update"""
+        self.runner.update(makeSnapshot(0, 1000, 0))
+        self.runner.update(makeSnapshot(5, 1600, 0))
+        self.runner.update(makeSnapshot(6, 1600, 0, host="other"))
+        self.assertEqual(self.fake.posts, [])
+        self.runner.flush()
+        self.assertEqual(self.fake.posts,
+                         [{"COOK_SET": "275", "COOK_RAMP": "1"}])
+        self.assertEqual(self.runner.writes, 1)
+        self.runner.update(makeSnapshot(10, 1700, 0))
+        self.runner.flush()
+        self.assertEqual(len(self.fake.posts), 1)
+
+    def testFailedWriteIsRetried(self):
+        """Test a failed write is sent again on the next snapshot"""
+        self.fake.status_code = 500
+        self.runner.update(makeSnapshot(0, 1000, 0))
+        self.runner.flush()
+        self.assertTrue(isinstance(self.runner.errors["pit"],
+                                   ResponseHTTPException))
+        self.fake.status_code = 200
+        self.runner.update(makeSnapshot(5, 1000, 0))
+        self.runner.flush()
+        self.assertEqual(self.fake.posts[-1], {"COOK_SET": "225"})
+        self.assertEqual(self.runner.errors, {})
+
+    def testWorkers(self):
+        """Test worker threads send queued writes"""
+        self.runner.start(workers=2)
+        try:
+            self.runner.update(makeSnapshot(0, 1000, 0))
+            deadline = time.time() + 5
+            while not self.fake.posts and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            self.runner.stop()
+        self.assertEqual(self.fake.posts, [{"COOK_SET": "225"}])
+
+class CountingTransport(FakeTransport):
+    """Slow transport recording how many posts overlap"""
+
+    def __init__(self):
+        FakeTransport.__init__(self, latency=0.1)
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.mostInFlight = 0
+
+    def post(self, url, data, headers=None):
+        with self.lock:
+            self.inFlight += 1
+            self.mostInFlight = max(self.mostInFlight, self.inFlight)
+        try:
+            return FakeTransport.post(self, url, data, headers)
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+
+class TestProgramRunnerOrdering(unittest.TestCase):
+    """Test one host never has two writes in flight"""
+
+    def testWritesToOneHostAreSerial(self):
+        """Test a newer write waits for the one in flight and lands last"""
+        fake = CountingTransport()
+        runner = ProgramRunner({"pit": CyberQInterface("pit",
+                                                       transport=fake)})
+        runner.addProgram(brisket())
+        runner.start(workers=4)
+        try:
+            runner.update(makeSnapshot(0, 1000, 0))
+            time.sleep(0.03)
+            runner.update(makeSnapshot(5, 1600, 0))
+            runner.update(makeSnapshot(6, 2100, 0))
+            deadline = time.time() + 5
+            while runner.writes < 2 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            runner.stop()
+        self.assertEqual(fake.mostInFlight, 1)
+        self.assertEqual(fake.posts, [{"COOK_SET": "225"},
+                                      {"COOK_SET": "275", "COOK_RAMP": "1",
+                                       "COOKHOLD": "170"}])
+        self.assertEqual(runner.pending, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the Parquet/Arrow export
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface import export
+
+def makeSnapshot(timestamp, cook, food1=None, host="pit1"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=cook,
+                  FOOD1_TEMP=food1, COOK_SET=2250, COOK_STATUS=0,
+                  OUTPUT_PERCENT=55, TIMER_CURR=600,
+                  COOK_NAME="Big Green Egg", FOOD1_NAME="Brisket")
+    return Snapshot(**values)
+
+@unittest.skipIf(export.pyarrow is None, "pyarrow is not installed")
+class TestSnapshotWriter(unittest.TestCase):
+    """Test streaming snapshots to columnar files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testParquetRowGroups(self):
+        """Test rows are written in row groups with decoded columns"""
+        import pyarrow.parquet
+        path = os.path.join(self.directory, "cooks.parquet")
+        with export.SnapshotWriter(path, rowGroupSize=4) as writer:
+            for second in range(10):
+                writer.add(makeSnapshot(second, 2000 + second,
+                                        None if second % 2 else 1500))
+        parquetFile = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquetFile.metadata.num_row_groups, 3)
+        table = parquetFile.read().to_pydict()
+        self.assertAlmostEqual(table["COOK_TEMP"][3], 200.3, 3)
+        self.assertEqual(table["FOOD1_TEMP"][:2], [150.0, None])
+        self.assertEqual(table["FOOD1_NAME"][0], "Brisket")
+        self.assertEqual(table["OUTPUT_PERCENT"][9], 55)
+
+    def testArrowFile(self):
+        """Test the Arrow IPC file holds every batch"""
+        import pyarrow
+        path = os.path.join(self.directory, "cooks.arrow")
+        writer = export.SnapshotWriter(path, format="arrow", rowGroupSize=4)
+        writer.extend(makeSnapshot(second, 2000, host="pit%d" % (second % 2))
+                      for second in range(6))
+        writer.close()
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+        self.assertEqual(table.num_rows, 6)
+        self.assertEqual(table.column("host").to_pylist(),
+                         ["pit0", "pit1"] * 3)
+        self.assertEqual(table.column("COOK_NAME").to_pylist()[5],
+                         "Big Green Egg")
+
+    def testBadFormat(self):
+        """Test unknown formats are rejected"""
+        with self.assertRaises(ValueError):
+            export.SnapshotWriter(os.path.join(self.directory, "x"), "csv")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the metrics exporter
+"""
+
+import unittest
+import urllib2
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface.exporter import MetricsExporter
+
+def makeSnapshot(host, cook=2250, food1=1400, output=30):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=0, COOK_TEMP=cook, FOOD1_TEMP=food1,
+                  COOK_STATUS=0, FOOD1_STATUS=0, OUTPUT_PERCENT=output)
+    return Snapshot(**values)
+
+class TestMetricsExporter(unittest.TestCase):
+    """Test rendering and serving of cached samples"""
+
+    def testRender(self):
+        """Test samples are grouped by family with labels"""
+        exporter = MetricsExporter()
+        exporter.update(makeSnapshot("pit1"))
+        exporter.update(makeSnapshot("pit2", cook=3000))
+        body = exporter.render()
+        self.assertTrue('cyberq_cook_temp{host="pit1"} 225.0\n' in body)
+        self.assertTrue('cyberq_cook_temp{host="pit2"} 300.0\n' in body)
+        self.assertTrue(
+            'cyberq_food_temp{host="pit1",probe="FOOD1"} 140.0\n' in body)
+        self.assertTrue('cyberq_status{host="pit1",probe="COOK"} 0\n' in body)
+        self.assertTrue(body.index("pit2\"} 300.0") <
+                        body.index("# TYPE cyberq_food_temp"))
+
+    def testBodyIsCachedUntilChange(self):
+        """Test unchanged snapshots keep the rendered body"""
+        exporter = MetricsExporter()
+        exporter.update(makeSnapshot("pit1"))
+        body = exporter.render()
+        exporter.update(makeSnapshot("pit1"))
+        self.assertTrue(exporter.render() is body)
+        exporter.update(makeSnapshot("pit1", food1=None))
+        self.assertFalse("FOOD1" in exporter.render().split("cyberq_status")[0])
+
+    def testOnlyChangedLinesAreFormatted(self):
+        """Test unchanged lines are kept and hosts stay in sorted order"""
+        exporter = MetricsExporter()
+        exporter.update(makeSnapshot("pit2"))
+        exporter.update(makeSnapshot("pit1"))
+        food = exporter._samples["cyberq_food_temp"][("pit1", "FOOD1")][1]
+        exporter.update(makeSnapshot("pit1", cook=2300))
+        self.assertTrue(
+            exporter._samples["cyberq_food_temp"][("pit1", "FOOD1")][1]
+            is food)
+        body = exporter.render()
+        self.assertTrue('cyberq_cook_temp{host="pit1"} 230.0\n' in body)
+        self.assertTrue(body.index('{host="pit1"} 230.0') <
+                        body.index('{host="pit2"} 225.0'))
+
+    def testRemoveHost(self):
+        """Test removing a host drops its samples"""
+        exporter = MetricsExporter()
+        exporter.update(makeSnapshot("pit1"))
+        exporter.removeHost("pit1")
+        self.assertFalse("pit1" in exporter.render())
+
+    def testServe(self):
+        """Test the body is served over HTTP"""
+        exporter = MetricsExporter()
+        exporter.update(makeSnapshot("pit1"))
+        server = exporter.start(0, "127.0.0.1")
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+            self.assertEqual(urllib2.urlopen(url).read(), exporter.render())
+        finally:
+            exporter.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for fleet operations
+"""
+
+import threading
+import time
+import unittest
+import requests
+from mock import patch
+from cyberqinterface.fleet import pushConfig
+from cyberqinterface.cyberqinterface_exceptions import *
+
+CONFIG_XML = """
+<nutcallstatus>
+<COOK>
+  <COOK_NAME>Big Green Egg</COOK_NAME>
+  <COOK_TEMP>3220</COOK_TEMP>
+  <COOK_SET>%s</COOK_SET>
+  <COOK_STATUS>0</COOK_STATUS>
+</COOK>
+<CONTROL>
+  <COOKHOLD>2000</COOKHOLD>
+  <CYCTIME>6</CYCTIME>
+  <PROPBAND>%s</PROPBAND>
+</CONTROL>
+</nutcallstatus>"""
+
+class FakeFleet:
+    """Stand-in for requests that records concurrency per call"""
+    def __init__(self, delay=0.05, broken=()):
+        self.delay = delay
+        self.broken = broken
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.settings = {}
+
+    def _enter(self):
+        with self.lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.inFlight -= 1
+
+    def _response(self, url, status):
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        return response
+
+    def post(self, url, data=None, headers=None):
+        self._enter()
+        host = url.split("/")[2]
+        if host in self.broken:
+            return self._response(url, 500)
+        self.settings[host] = data
+        return self._response(url, 200)
+
+    def get(self, url):
+        self._enter()
+        host = url.split("/")[2]
+        data = self.settings.get(host, {})
+        response = self._response(url, 200)
+        response._content = CONFIG_XML % (
+            int(float(data.get("COOK_SET", 400)) * 10),
+            int(float(data.get("PROPBAND", 50)) * 10))
+        return response
+
+class TestPushConfig(unittest.TestCase):
+    """Test the concurrent fleet configuration push"""
+
+    def testPushAndVerify(self):
+        """Test every host is updated, verified and concurrency is bounded"""
+        fake = FakeFleet()
+        hosts = ["pit%d" % i for i in range(20)]
+        with patch.object(requests, 'post', fake.post):
+            with patch.object(requests, 'get', fake.get):
+                results = pushConfig(hosts, {"PROPBAND": "40",
+                                             "COOK_SET": "225.5"},
+                                     concurrency=5, hostInterval=0)
+        self.assertEqual([r.host for r in results], hosts)
+        self.assertTrue(all(r.confirmed for r in results))
+        self.assertTrue(fake.maxInFlight <= 5)
+
+    def testFailuresAreReported(self):
+        """Test a failing host does not stop the others"""
+        fake = FakeFleet(delay=0, broken=("pit1",))
+        with patch.object(requests, 'post', fake.post):
+            with patch.object(requests, 'get', fake.get):
+                results = pushConfig(["pit0", "pit1"], {"CYCTIME": "6"},
+                                     hostInterval=0)
+        self.assertTrue(results[0].confirmed)
+        self.assertFalse(results[1].sent)
+        self.assertTrue(isinstance(results[1].error, ResponseHTTPException))
+
+    def testMismatchIsReported(self):
+        """Test values the controller did not apply are listed"""
+        fake = FakeFleet(delay=0)
+        fake.post = lambda url, data=None, headers=None: fake._response(url,
+                                                                        200)
+        with patch.object(requests, 'post', fake.post):
+            with patch.object(requests, 'get', fake.get):
+                result = pushConfig(["pit0"], {"PROPBAND": "40"},
+                                    hostInterval=0, verifyTimeout=0.2)[0]
+        self.assertTrue(result.sent)
+        self.assertFalse(result.confirmed)
+        self.assertEqual(result.mismatches, {"PROPBAND": ("400", "500")})
+
+    def testSlowHostIsConfirmed(self):
+        """Test the read back is retried until the host applies the update"""
+        fake = FakeFleet(delay=0)
+        pending = []
+        reads = []
+        def slowPost(url, data=None, headers=None):
+            pending.append(data)
+            return fake._response(url, 200)
+        def slowGet(url):
+            # The update shows up only from the third read back
+            reads.append(url)
+            if len(reads) == 3:
+                fake.settings[url.split("/")[2]] = pending.pop()
+            return fake.get(url)
+        with patch.object(requests, 'post', slowPost):
+            with patch.object(requests, 'get', slowGet):
+                result = pushConfig(["pit0"], {"PROPBAND": "40"},
+                                    hostInterval=0)[0]
+        self.assertTrue(result.confirmed)
+        self.assertEqual(len(reads), 3)
+
+    def testWholeNumbersWithDecimals(self):
+        """Test a value such as 6.0 is compared with the 6 reported"""
+        fake = FakeFleet(delay=0)
+        with patch.object(requests, 'post', fake.post):
+            with patch.object(requests, 'get', fake.get):
+                result = pushConfig(["pit0"], {"CYCTIME": "6.0"},
+                                    hostInterval=0, verifyTimeout=0)[0]
+        self.assertEqual(result.error, None)
+        self.assertTrue(result.confirmed)
+
+    def testValidatesBeforeSending(self):
+        """Test bad parameters raise before any request"""
+        fake = FakeFleet(delay=0)
+        with patch.object(requests, 'post', fake.post):
+            with self.assertRaises(ParameterValidationException):
+                pushConfig(["pit0"], {"PROPBND": "40"})
+        self.assertEqual(fake.settings, {})
+
+    def testHostSpacing(self):
+        """Test the post and verify to one host are spaced apart"""
+        fake = FakeFleet(delay=0)
+        started = time.time()
+        with patch.object(requests, 'post', fake.post):
+            with patch.object(requests, 'get', fake.get):
+                pushConfig(["pit0"], {"CYCTIME": "6"}, hostInterval=0.2)
+        self.assertTrue(time.time() - started >= 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the caching gateway
+"""
+
+import time
+import unittest
+import requests
+from cyberqinterface.cyberqinterface import CyberQInterface
+from cyberqinterface.cyberqinterface_exceptions import *
+from cyberqinterface.gateway import Gateway, spliceStatus
+from cyberqinterface.simulator import ALL_XML, CONFIG_XML
+
+STATUS_XML = """<nutcstatus>
+   <!--all temperatures are displayed in tenths F, regardless of setting of unit-->
+   <COOK_TEMP>3343</COOK_TEMP>
+   <FOOD1_TEMP>823</FOOD1_TEMP>
+</nutcstatus>"""
+
+class FakeController:
+    """Counts the requests a controller would see"""
+    def __init__(self, documents=None, delay=0.0):
+        self.documents = documents
+        self.delay = delay
+        self.failing = False
+        self.reads = []
+        self.writes = []
+
+    def read(self, objectURI):
+        self.reads.append(objectURI)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.failing:
+            raise ResponseHTTPException("500 Error", None)
+        if self.documents is not None:
+            return self.documents[objectURI]
+        return STATUS_XML
+
+    def write(self, parameters):
+        self.writes.append(parameters)
+        return True
+
+class TestGateway(unittest.TestCase):
+    """Test serving cached documents and forwarding updates"""
+
+    def setUp(self):
+        self.controllers = {"pit1": FakeController(),
+                            "pit2": FakeController()}
+        self.gateway = Gateway({"pit1": "10.0.0.1", "pit2": "10.0.0.2"},
+                               interval=60)
+        for name, fake in self.controllers.items():
+            upstream = self.gateway.upstreams[name]
+            upstream.cqi._getResponseBytes = fake.read
+            upstream.cqi._postUpdate = fake.write
+        server = self.gateway.start(0, "127.0.0.1")
+        self.address = "127.0.0.1:%d" % server.server_address[1]
+
+    def tearDown(self):
+        self.gateway.stop()
+
+    def testDocumentsAreByteIdentical(self):
+        """Test a client sees the controller's bytes from the cache"""
+        client = CyberQInterface(self.address + "/pit1")
+        for i in range(5):
+            self.assertEqual(client.getStatusXML(), STATUS_XML)
+        self.assertEqual(client.getStatus().COOK_TEMP, 3343)
+        self.assertEqual(self.controllers["pit1"].reads.count("status.xml"),
+                         1)
+
+    def testUpdateIsForwarded(self):
+        """Test updates reach the controller and refresh every document"""
+        client = CyberQInterface(self.address + "/pit2")
+        client.getConfigXML()
+        client.getStatusXML()
+        self.assertTrue(client.sendUpdate({"COOK_SET": "250"}))
+        self.assertEqual(self.controllers["pit2"].writes, ["COOK_SET=250"])
+        client.getConfigXML()
+        client.getStatusXML()
+        self.assertEqual(self.controllers["pit2"].reads.count("config.xml"),
+                         2)
+        self.assertEqual(self.controllers["pit2"].reads.count("status.xml"),
+                         2)
+        self.assertEqual(self.controllers["pit1"].writes, [])
+
+    def testUnknownController(self):
+        """Test unknown paths are rejected"""
+        with self.assertRaises(ResponseHTTPException):
+            CyberQInterface(self.address + "/pit9").getStatusXML()
+
+    def testStaleHeaders(self):
+        """Test responses carry their age and a warning when stale"""
+        url = "http://%s/pit1/status.xml" % self.address
+        response = requests.get(url)
+        self.assertTrue("age" in response.headers)
+        self.assertFalse("warning" in response.headers)
+        self.controllers["pit1"].failing = True
+        self.gateway.upstreams["pit1"].refresh("status.xml")
+        response = requests.get(url)
+        self.assertEqual(response.content, STATUS_XML)
+        self.assertTrue(response.headers["warning"].startswith("110"))
+
+class TestGatewayRefresh(unittest.TestCase):
+    """Test how cached documents are refreshed and expire"""
+
+    def makeGateway(self, controllers, **options):
+        gateway = Gateway(dict((name, name) for name in controllers),
+                          **options)
+        for name, fake in controllers.items():
+            gateway.upstreams[name].cqi._getResponseBytes = fake.read
+        return gateway
+
+    def testStatusIsSpliced(self):
+        """Test all.xml and config.xml carry the latest status values"""
+        status = STATUS_XML.replace("3343", "2999").replace(
+            "</nutcstatus>", "<COOK_PROPBAND>400</COOK_PROPBAND></nutcstatus>")
+        fake = FakeController({"status.xml": status, "all.xml": ALL_XML,
+                               "config.xml": CONFIG_XML})
+        gateway = self.makeGateway({"pit1": fake}, slowInterval=60,
+                                   splice=True)
+        gateway.pollOnce()
+        gateway.upstreams["pit1"].refresh("status.xml")
+        all = gateway.getDocument("pit1", "all.xml")
+        self.assertTrue("<COOK_TEMP>2999</COOK_TEMP>" in all)
+        self.assertTrue("<COOK_PROPBAND>400</COOK_PROPBAND>" in all)
+        self.assertEqual(all, ALL_XML.replace("3216", "2999").replace(
+            "1482", "823").replace("<COOK_PROPBAND>500",
+                                   "<COOK_PROPBAND>400"))
+        config = gateway.getDocument("pit1", "config.xml")
+        self.assertTrue("<PROPBAND>400</PROPBAND>" in config)
+        self.assertTrue("<SSID>Wireless Network</SSID>" in config)
+        self.assertEqual(fake.reads.count("all.xml"), 1)
+
+    def testUnchangedByDefault(self):
+        """Test all.xml and config.xml are the controller's bytes"""
+        status = STATUS_XML.replace("3343", "2999")
+        fake = FakeController({"status.xml": status, "all.xml": ALL_XML,
+                               "config.xml": CONFIG_XML})
+        gateway = self.makeGateway({"pit1": fake}, slowInterval=60)
+        gateway.pollOnce()
+        gateway.upstreams["pit1"].refresh("status.xml")
+        self.assertEqual(gateway.getDocument("pit1", "all.xml"), ALL_XML)
+        self.assertEqual(gateway.getDocument("pit1", "config.xml"),
+                         CONFIG_XML)
+
+    def testSplicedNames(self):
+        """Test values only replace elements of the same name"""
+        self.assertEqual(spliceStatus("<a><B>1</B><C>2</C></a>",
+                                      "<s><C>3</C><D>4</D></s>"),
+                         "<a><B>1</B><C>3</C></a>")
+
+    def testExpiry(self):
+        """Test a document is not served long after its last refresh"""
+        fake = FakeController()
+        gateway = self.makeGateway({"pit1": fake}, interval=1,
+                                   expireIntervals=3)
+        self.assertEqual(gateway.getDocument("pit1", "status.xml"),
+                         STATUS_XML)
+        fake.failing = True
+        upstream = gateway.upstreams["pit1"]
+        upstream.documents["status.xml"] = (STATUS_XML, time.time() - 2)
+        self.assertEqual(gateway.getCached("pit1", "status.xml")[2], False)
+        gateway.pollOnce()
+        self.assertEqual(gateway.getCached("pit1", "status.xml")[2], True)
+        upstream.documents["status.xml"] = (STATUS_XML, time.time() - 4)
+        self.assertEqual(gateway.getDocument("pit1", "status.xml"), None)
+
+    def testConcurrentRefresh(self):
+        """Test a slow controller does not hold up the others"""
+        controllers = dict(("pit%d" % i, FakeController(delay=0.2))
+                           for i in range(5))
+        gateway = self.makeGateway(controllers)
+        started = time.time()
+        gateway.pollOnce()
+        self.assertTrue(time.time() - started < 2.0)
+        for fake in controllers.values():
+            self.assertEqual(len(fake.reads), 3)
+        self.assertEqual(
+            gateway.upstreams["pit1"].cqi.transport.timeout, 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
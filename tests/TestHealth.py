@@ -0,0 +1,65 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the fleet health index
+"""
+
+import unittest
+from cyberqinterface.health import HealthIndex
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+
+def makeSnapshot(host, cook=2250, food1=1400, status=0, units=1):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=0, COOK_TEMP=cook, FOOD1_TEMP=food1,
+                  FOOD2_TEMP=700, FOOD3_TEMP=700, COOK_STATUS=0,
+                  FOOD1_STATUS=status, DEG_UNITS=units)
+    return Snapshot(**values)
+
+class TestHealthIndex(unittest.TestCase):
+    """Test hosts are filed and refiled under the right keys"""
+
+    def setUp(self):
+        self.health = HealthIndex()
+        self.health.update(makeSnapshot("pit1"))
+        self.health.update(makeSnapshot("pit2", food1=None, status=6))
+        self.health.update(makeSnapshot("pit3", cook=3100, units=0))
+
+    def testQueries(self):
+        """Test status, OPEN and unit queries"""
+        self.assertEqual(self.health.withStatus("ALARM"), set(["pit2"]))
+        self.assertEqual(self.health.withStatus("ALARM", "COOK"), set())
+        self.assertEqual(self.health.withStatus("OK", "COOK"),
+                         set(["pit1", "pit2", "pit3"]))
+        self.assertEqual(self.health.withOpenProbe(), set(["pit2"]))
+        self.assertEqual(self.health.withOpenProbe("FOOD1"), set(["pit2"]))
+        self.assertEqual(self.health.withUnits("CELSIUS"), set(["pit3"]))
+
+    def testInBand(self):
+        """Test band queries check the edges exactly"""
+        self.assertEqual(self.health.inBand(200, 250),
+                         set(["pit1", "pit2"]))
+        self.assertEqual(self.health.inBand(225, 225),
+                         set(["pit1", "pit2"]))
+        self.assertEqual(self.health.inBand(226, 400), set(["pit3"]))
+        self.assertEqual(self.health.inBand(100, 150, "FOOD1"),
+                         set(["pit1", "pit3"]))
+
+    def testIncrementalUpdate(self):
+        """Test a new snapshot moves a host between keys"""
+        self.health.update(makeSnapshot("pit2"))
+        self.assertEqual(self.health.withStatus("ALARM"), set())
+        self.assertEqual(self.health.withOpenProbe(), set())
+        self.assertFalse(("open",) in self.health.counts())
+        self.assertEqual(self.health.counts()[("status", "OK", "FOOD1")], 3)
+
+    def testRemoveHost(self):
+        """Test a removed host leaves every key"""
+        self.health.removeHost("pit2")
+        self.health.removeHost("missing")
+        self.assertEqual(self.health.withStatus("ALARM"), set())
+        self.assertEqual(self.health.inBand(0, 1000), set(["pit1", "pit3"]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the bounded snapshot history
+"""
+
+import random
+import unittest
+from cyberqinterface.history import SnapshotHistory
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+
+def makeSnapshot(timestamp, cook, food1=None):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host="pit", timestamp=timestamp, COOK_TEMP=cook,
+                  FOOD1_TEMP=food1)
+    return Snapshot(**values)
+
+class TestSnapshotHistory(unittest.TestCase):
+    """Test eviction, slicing and running extremes"""
+
+    def testCapacity(self):
+        """Test the oldest snapshots are evicted past capacity"""
+        history = SnapshotHistory(capacity=3)
+        for second in range(10):
+            history.add(makeSnapshot(second, 2000 + second))
+        self.assertEqual(len(history), 3)
+        self.assertEqual([s.timestamp for s in history.snapshots()],
+                         [7, 8, 9])
+        self.assertEqual([s.timestamp for s in history.last(2)], [8, 9])
+        self.assertEqual(history.minimum("COOK_TEMP"), 2007)
+        self.assertEqual(history.maximum("COOK_TEMP"), 2009)
+
+    def testMaxAge(self):
+        """Test snapshots older than maxAge are evicted"""
+        history = SnapshotHistory(capacity=100, maxAge=30)
+        for second in range(0, 100, 10):
+            history.add(makeSnapshot(second, 2000))
+        self.assertEqual([s.timestamp for s in history.snapshots()],
+                         [60, 70, 80, 90])
+        history.expire(125)
+        self.assertEqual(len(history), 0)
+        self.assertEqual(history.latest(), None)
+        self.assertEqual(history.minimum("COOK_TEMP"), None)
+
+    def testQueriesExpire(self):
+        """Test queries given now evict what aged out since the last add"""
+        history = SnapshotHistory(maxAge=30)
+        history.add(makeSnapshot(50, 3000))
+        history.add(makeSnapshot(80, 2000))
+        self.assertEqual(history.maximum("COOK_TEMP"), 3000)
+        self.assertEqual(history.maximum("COOK_TEMP", 100), 2000)
+        self.assertEqual(len(history), 1)
+        history.add(makeSnapshot(90, 2500))
+        self.assertEqual(history.minimum("COOK_TEMP", 100), 2000)
+        self.assertEqual(len(history.since(60, 100)), 2)
+        self.assertEqual(history.minimum("COOK_TEMP", 115), 2500)
+
+    def testRecordedHistoryIsKept(self):
+        """Test queries without now keep a recorded past cook"""
+        history = SnapshotHistory(maxAge=30)
+        for second in range(0, 100, 10):
+            history.add(makeSnapshot(second, 2000 + second))
+        self.assertEqual(history.maximum("COOK_TEMP"), 2090)
+        self.assertEqual(history.minimum("COOK_TEMP"), 2060)
+        self.assertEqual(len(history.since(10)), 2)
+
+    def testOutOfOrder(self):
+        """Test a snapshot older than the newest is refused"""
+        history = SnapshotHistory()
+        history.add(makeSnapshot(10, 2000))
+        history.add(makeSnapshot(10, 2100))
+        self.assertRaises(ValueError, history.add, makeSnapshot(9, 1000))
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.minimum("COOK_TEMP"), 2000)
+
+    def testSince(self):
+        """Test the last N seconds are sliced by time"""
+        history = SnapshotHistory(capacity=100)
+        for second in range(0, 100, 5):
+            history.add(makeSnapshot(second, 2000))
+        self.assertEqual([s.timestamp for s in history.since(10)],
+                         [85, 90, 95])
+        self.assertEqual([s.timestamp for s in history.since(10, 50)],
+                         [40, 45, 50])
+        self.assertEqual(SnapshotHistory().since(10), [])
+
+    def testExtremesMatchScan(self):
+        """Test running extremes match a scan of what is kept"""
+        rng = random.Random(4)
+        history = SnapshotHistory(capacity=50)
+        for second in range(1000):
+            food = None if rng.random() < 0.1 else rng.randint(0, 2000)
+            history.add(makeSnapshot(second, rng.randint(0, 4000), food))
+            kept = history.snapshots()
+            cooks = [s.COOK_TEMP for s in kept]
+            foods = [s.FOOD1_TEMP for s in kept if s.FOOD1_TEMP is not None]
+            self.assertEqual(history.minimum("COOK_TEMP"), min(cooks))
+            self.assertEqual(history.maximum("COOK_TEMP"), max(cooks))
+            self.assertEqual(history.maximum("FOOD1_TEMP"),
+                             max(foods) if foods else None)
+        self.assertTrue(len(history._snapshots) < 200)
+
+    def testClear(self):
+        """Test clear() forgets everything"""
+        history = SnapshotHistory()
+        history.add(makeSnapshot(0, 2000))
+        history.clear()
+        history.add(makeSnapshot(1, 1000))
+        self.assertEqual(history.maximum("COOK_TEMP"), 1000)
+        self.assertEqual(len(history), 1)
+
+if __name__ == '__main__':
+    unittest.main()
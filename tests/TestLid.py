@@ -0,0 +1,73 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for lid-open detection
+"""
+
+import unittest
+from cyberqinterface.lid import LidDetector, LidEvent
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+
+def makeSnapshot(timestamp, cook, output=30, host="pit"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=cook,
+                  OUTPUT_PERCENT=output)
+    return Snapshot(**values)
+
+def trace(temperatures, outputs=None, interval=5, host="pit"):
+    outputs = outputs or [30] * len(temperatures)
+    return [makeSnapshot(i * interval, temperature, output, host)
+            for i, (temperature, output) in
+            enumerate(zip(temperatures, outputs))]
+
+class TestLidDetector(unittest.TestCase):
+    """Test episodes are found, measured and ignored when they should be"""
+
+    def setUp(self):
+        self.events = []
+        self.detector = LidDetector(sink=self.events.append)
+
+    def feed(self, snapshots):
+        for snapshot in snapshots:
+            self.detector.update(snapshot)
+
+    def testLidOpening(self):
+        """Test a drop and recovery produce one event"""
+        temperatures = ([2250] * 4 + [2100, 1900, 1800, 1850, 1950, 2050,
+                                      2150, 2210, 2250])
+        outputs = [30] * 4 + [0, 0, 0, 100, 100, 100, 100, 60, 30]
+        self.feed(trace(temperatures, outputs))
+        self.assertEqual(self.events, [
+            LidEvent("pit", 15, 55, 40, 225.0, 180.0, 45.0, 100, True)])
+        self.assertFalse(self.detector.isOpen("pit"))
+
+    def testSlowCooling(self):
+        """Test lowering the setpoint is not a lid opening"""
+        self.feed(trace(range(2750, 2250, -20), [0] * 25))
+        self.assertEqual(self.events, [])
+
+    def testShortDip(self):
+        """Test a dip that stops before minDrop is ignored"""
+        self.feed(trace([2250, 2250, 2180, 2200, 2250, 2250]))
+        self.assertEqual(self.events, [])
+
+    def testNoRecovery(self):
+        """Test an episode is closed after maxDuration"""
+        self.detector.maxDuration = 60
+        self.feed(trace([2250, 2250, 2000] + [1900] * 20))
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0].recovered, False)
+        self.assertEqual(self.events[0].duration, 60)
+
+    def testHostsAreIndependent(self):
+        """Test interleaved controllers keep their own state"""
+        opened = trace([2250, 2250, 2000, 2000, 2250], host="a")
+        steady = trace([2250] * 5, host="b")
+        for pair in zip(opened, steady):
+            self.feed(pair)
+        self.assertEqual([event.host for event in self.events], ["a"])
+
+if __name__ == '__main__':
+    unittest.main()
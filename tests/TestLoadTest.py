@@ -0,0 +1,116 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the load test harness and simulator failure injection
+"""
+
+import threading
+import time
+import unittest
+from StringIO import StringIO
+from cyberqinterface.cyberqinterface import CyberQInterface
+from cyberqinterface.cyberqinterface_exceptions import *
+from cyberqinterface.loadtest import SimulatedFleet, runLoad, report
+from cyberqinterface.simulator import SimulatedCyberQ
+from cyberqinterface.transport import SocketTransport
+
+class TestFailureInjection(unittest.TestCase):
+    """Test the simulator injects latency and failures"""
+
+    def checkSimulator(self, **options):
+        simulator = SimulatedCyberQ(**options).start()
+        self.addCleanup(simulator.stop)
+        return simulator, CyberQInterface(simulator.host,
+                                          transport=SocketTransport(2.0))
+
+    def testFailures(self):
+        """Test failed requests are answered with a 500"""
+        simulator, cqi = self.checkSimulator(failureRate=1.0)
+        with self.assertRaises(ResponseHTTPException):
+            cqi.getStatus()
+        self.assertEqual(simulator.failures, 1)
+
+    def testDrops(self):
+        """Test dropped connections get no response"""
+        simulator, cqi = self.checkSimulator(dropRate=1.0)
+        self.assertRaises(Exception, cqi.getStatus)
+        self.assertEqual(simulator.drops, 1)
+
+    def testJitter(self):
+        """Test jitter adds to the latency"""
+        simulator, cqi = self.checkSimulator(latency=0.02, jitter=0.02,
+                                             seed=1)
+        started = time.time()
+        cqi.getStatus()
+        elapsed = time.time() - started
+        self.assertTrue(0.02 <= elapsed < 0.5, elapsed)
+
+    def testConcurrentCounters(self):
+        """Test requests from many threads are all counted"""
+        simulator, cqi = self.checkSimulator(failureRate=1.0, latency=0.01)
+        def read():
+            self.assertRaises(ResponseHTTPException, cqi.getStatus)
+        threads = [threading.Thread(target=read) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((simulator.requests, simulator.failures), (20, 20))
+
+class TestLoadTest(unittest.TestCase):
+    """Test the modes of runLoad() against a simulated fleet"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fleet = SimulatedFleet(3).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fleet.stop()
+
+    def testClient(self):
+        """Test controllers are read at the target rate"""
+        result = runLoad("client", self.fleet.hosts, rate=4, duration=0.5,
+                         workers=2)
+        self.assertEqual(result.controllers, 3)
+        self.assertEqual(result.reads, 6)
+        self.assertEqual(result.errors, 0)
+        self.assertTrue(result.p50 <= result.p99 <= result.maximum)
+        self.assertTrue(result.cpu >= 0)
+
+    def testPollerAndPush(self):
+        """Test the Poller and pushConfig modes"""
+        result = runLoad("poller", self.fleet.hosts, rate=5, duration=0.4)
+        self.assertEqual((result.reads, result.errors), (6, 0))
+        result = runLoad("push", self.fleet.hosts, rate=5, duration=0.2,
+                         workers=3)
+        self.assertEqual((result.reads, result.errors), (3, 0))
+        output = StringIO()
+        report([result], output)
+        self.assertTrue(output.getvalue().splitlines()[1].startswith("push"))
+
+    def testPollerAndPushUseTransport(self):
+        """Test the chosen transport and its timeout reach Poller and push"""
+        with SimulatedFleet(2, latency=0.3) as fleet:
+            for mode in ("poller", "push"):
+                for transport in ("requests", "socket"):
+                    result = runLoad(mode, fleet.hosts, rate=10,
+                                     duration=0.1, workers=2,
+                                     transport=transport, timeout=0.05)
+                    self.assertEqual(result.errors, result.reads)
+                    self.assertTrue(result.maximum < 0.3, (mode, transport))
+
+    def testFailingFleet(self):
+        """Test failures are counted as errors"""
+        with SimulatedFleet(2, failureRate=1.0) as fleet:
+            result = runLoad("client", fleet.hosts, rate=10, duration=0.2)
+        self.assertEqual(result.errors, result.reads)
+
+    def testUnknownMode(self):
+        """Test unknown modes are refused"""
+        self.assertRaises(ValueError, runLoad, "sharded", [])
+
+if __name__ == '__main__':
+    unittest.main()
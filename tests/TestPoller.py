@@ -0,0 +1,188 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the fleet pollers
+"""
+
+import unittest
+import requests
+from mock import patch
+from cyberqinterface.poller import Poller, ShardedPoller, HashRing
+from cyberqinterface.profiling import Profiler
+from cyberqinterface.transport import RequestsTransport, TransportResponse
+
+STATUS_XML = """
+<nutcstatus>
+<OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+<TIMER_CURR>00:00:00</TIMER_CURR>
+<COOK_TEMP>3343</COOK_TEMP>
+<FOOD1_TEMP>823</FOOD1_TEMP>
+<FOOD2_TEMP>OPEN</FOOD2_TEMP>
+<FOOD3_TEMP>OPEN</FOOD3_TEMP>
+<COOK_STATUS>0</COOK_STATUS>
+<FOOD1_STATUS>0</FOOD1_STATUS>
+<FOOD2_STATUS>4</FOOD2_STATUS>
+<FOOD3_STATUS>4</FOOD3_STATUS>
+<TIMER_STATUS>0</TIMER_STATUS>
+<DEG_UNITS>1</DEG_UNITS>
+</nutcstatus>"""
+
+class TestPoller(unittest.TestCase):
+    """Test the single process poller"""
+
+    def testPollOnce(self):
+        """Test every host is read and listeners see the previous snapshot"""
+        seen = []
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            poller = Poller(["pit1", "pit2"])
+            poller.addListener(lambda snap, prev: seen.append((snap, prev)))
+            poller.run(rounds=2)
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(poller.latest["pit1"].COOK_TEMP, 3343)
+        self.assertEqual(seen[0][1], None)
+        self.assertEqual(seen[2][1].host, seen[2][0].host)
+
+    def testErrorsAreKept(self):
+        """Test a failing host does not stop the round"""
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 500
+            poller = Poller(["pit1"])
+            self.assertEqual(poller.pollOnce(), [])
+        self.assertTrue("pit1" in poller.errors)
+
+    def testBadValueFromOneHost(self):
+        """Test a host sending a value that cannot be decoded is skipped"""
+        def fakeGet(url):
+            content = STATUS_XML
+            if "pit2" in url:
+                content = STATUS_XML.replace("3343", "hot")
+            return TransportResponse(200, content, "OK", url)
+        with patch.object(RequestsTransport, 'get', lambda self, url:
+                          fakeGet(url)):
+            poller = Poller(["pit1", "pit2", "pit3"])
+            snapshots = poller.pollOnce()
+        self.assertEqual(sorted(s.host for s in snapshots), ["pit1", "pit3"])
+        self.assertTrue(isinstance(poller.errors["pit2"], ValueError))
+        self.assertFalse("pit2" in poller.latest)
+
+    def testFailingListener(self):
+        """Test a raising listener does not fail the read or skip others"""
+        seen = []
+        def broken(snapshot, previous):
+            raise KeyError(snapshot.host)
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            poller = Poller(["pit1", "pit2"])
+            poller.addListener(broken)
+            poller.addListener(lambda snap, prev: seen.append(snap.host))
+            snapshots = poller.pollOnce()
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(sorted(seen), ["pit1", "pit2"])
+        self.assertEqual(poller.errors, {})
+        self.assertEqual(poller.metrics["listenerErrors"], 2)
+        self.assertTrue(isinstance(poller.listenerError, KeyError))
+
+    def testBadDocument(self):
+        """Test an unknown document is rejected"""
+        with self.assertRaises(ValueError):
+            Poller(["pit1"], document="bogus")
+
+class TestHashRing(unittest.TestCase):
+    """Test consistent hashing of hosts to workers"""
+
+    def testRemovingNodeOnlyMovesItsHosts(self):
+        """Test hosts of surviving workers stay put"""
+        hosts = ["10.0.%d.%d" % (i / 250, i % 250) for i in range(1000)]
+        ring = HashRing(["a", "b", "c", "d"])
+        before = dict((host, ring.getNode(host)) for host in hosts)
+        self.assertEqual(len(set(before.values())), 4)
+        ring.removeNode("b")
+        for host in hosts:
+            if before[host] != "b":
+                self.assertEqual(ring.getNode(host), before[host])
+            else:
+                self.assertNotEqual(ring.getNode(host), "b")
+
+class TestShardedPoller(unittest.TestCase):
+    """Test the multi-process poller"""
+
+    def testSnapshotsReachParent(self):
+        """Test workers ship snapshots and dead workers are respawned"""
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            poller = ShardedPoller(["pit%d" % i for i in range(6)],
+                                   processes=2, interval=0.1)
+            poller.start()
+            try:
+                victim = poller.workers.keys()[0]
+                poller.workers[victim][0].terminate()
+                poller.workers[victim][0].join()
+                self.assertEqual(poller.rebalance(), [victim])
+                self.assertTrue(poller.workers[victim][0].is_alive())
+                poller.run(duration=1.0)
+                self.assertEqual(len(poller.latest), 6)
+                self.assertEqual(poller.latest["pit0"].COOK_TEMP, 3343)
+            finally:
+                poller.stop()
+
+    def testEveryWorkerDies(self):
+        """Test hosts are still polled after the only worker died"""
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            poller = ShardedPoller(["pit0", "pit1"], processes=1,
+                                   interval=0.1)
+            poller.start()
+            try:
+                process = poller.workers["worker-0"][0]
+                process.terminate()
+                process.join()
+                self.assertEqual(poller.rebalance(), ["worker-0"])
+                self.assertEqual(poller.metrics["respawns"], 1)
+                poller.run(duration=1.0)
+                self.assertEqual(sorted(poller.latest), ["pit0", "pit1"])
+            finally:
+                poller.stop()
+
+    def testRestart(self):
+        """Test start() after stop() builds the ring once"""
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            poller = ShardedPoller(["pit0"], processes=2, interval=0.1)
+            for attempt in range(2):
+                poller.start()
+                try:
+                    self.assertEqual(len(poller.ring._keys),
+                                     2 * poller.ring.replicas)
+                    self.assertEqual(len(poller.workers), 2)
+                finally:
+                    poller.stop()
+
+    def testProfilesAreMerged(self):
+        """Test the profiles of the workers are merged into the parent's"""
+        with patch.object(requests, 'get') as mockMethod:
+            mockMethod.return_value.status_code = 200
+            mockMethod.return_value.content = STATUS_XML
+            profiler = Profiler(sampleRate=1.0)
+            poller = ShardedPoller(["pit%d" % i for i in range(4)],
+                                   processes=2, interval=0.1,
+                                   profiler=profiler)
+            try:
+                poller.run(duration=0.5)
+            finally:
+                poller.stop()
+        self.assertTrue(profiler.phases["poll"].count >= 4)
+        self.assertEqual(profiler.phases["poll"].count, profiler.sampled)
+        self.assertEqual(set(host for name, host in profiler.hosts),
+                         set(["pit%d" % i for i in range(4)]))
+        self.assertTrue(profiler.stats() is not None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the phase profiler
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from cyberqinterface import profiling
+from cyberqinterface.poller import Poller
+from cyberqinterface.profiling import Profiler
+
+def work():
+    return sum(range(1000))
+
+class TestProfiler(unittest.TestCase):
+    """Test phases are timed, sampled and reported"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testPhases(self):
+        """Test nested phases are each counted"""
+        profiler = Profiler()
+        for i in range(3):
+            with profiler.phase("poll", "pit"):
+                with profiler.phase("request", "pit"):
+                    work()
+                with profiler.phase("parse", "pit"):
+                    work()
+        self.assertEqual(profiler.phases["poll"].count, 3)
+        self.assertEqual(profiler.phases["parse"].count, 3)
+        self.assertEqual(profiler.hosts[("request", "pit")][0], 3)
+        self.assertTrue(profiler.phases["poll"].total >=
+                        profiler.phases["request"].total)
+        self.assertEqual(profiler.sampled, 0)
+        self.assertEqual(profiler.stats(), None)
+        self.assertEqual(profiler.phases["poll"].allocationSamples, 0)
+
+    def testErrors(self):
+        """Test a phase that raises is counted as an error"""
+        profiler = Profiler()
+        with self.assertRaises(KeyError):
+            with profiler.phase("lookup"):
+                {}["missing"]
+        self.assertEqual(profiler.phases["lookup"].errors, 1)
+
+    def testSampling(self):
+        """Test sampled polls are profiled once, with their phases"""
+        profiler = Profiler(sampleRate=1.0)
+        for i in range(2):
+            with profiler.phase("poll", "pit"):
+                with profiler.phase("parse", "pit"):
+                    work()
+        self.assertEqual(profiler.sampled, 2)
+        self.assertEqual(profiler.phases["parse"].allocationSamples, 2)
+        self.assertEqual(profiler.unit, "objects")
+        functions = [key[2] for key in profiler.stats().stats]
+        self.assertTrue("work" in functions)
+
+    def testOnlyPollsAreSampled(self):
+        """Test phases outside a poll are timed but not profiled"""
+        profiler = Profiler(sampleRate=1.0)
+        with profiler.phase("lookup", "pit"):
+            work()
+        self.assertEqual(profiler.sampled, 0)
+        self.assertEqual(profiler.phases["lookup"].allocationSamples, 0)
+        with profiler.phase("poll", "pit"):
+            with profiler.phase("lookup", "pit"):
+                work()
+        self.assertEqual(profiler.sampled, 1)
+        self.assertEqual(profiler.phases["lookup"].allocationSamples, 1)
+
+    def testPercentiles(self):
+        """Test percentiles of the recent durations"""
+        profiler = Profiler(window=100)
+        for milliseconds in range(200):
+            profiler.record("poll", "pit", milliseconds / 1000.0)
+        stats = profiler.phases["poll"]
+        self.assertEqual(stats.count, 200)
+        self.assertAlmostEqual(stats.percentile(0.5), 0.15)
+        self.assertAlmostEqual(stats.percentile(0.99), 0.199)
+        self.assertAlmostEqual(stats.maximum, 0.199)
+
+    def testDumpAndReport(self):
+        """Test dumps of several processes merge into one report"""
+        paths = []
+        for host in ("pit1", "pit2"):
+            profiler = Profiler(sampleRate=1.0)
+            with profiler.phase("poll", host):
+                work()
+            path = os.path.join(self.directory, host + ".prof")
+            profiler.dump(path)
+            paths.append(path)
+        merged = Profiler()
+        for path in paths:
+            merged.merge(profiling.load(path))
+        self.assertEqual(merged.phases["poll"].count, 2)
+        self.assertEqual(merged.sampled, 2)
+        output = StringIO()
+        merged.report(output)
+        report = output.getvalue()
+        self.assertTrue("pit1" in report and "pit2" in report)
+        self.assertTrue("work" in report)
+
+    def testPollerPassesProfiler(self):
+        """Test a Poller gives its profiler to each interface"""
+        profiler = Profiler()
+        poller = Poller(["10.0.1.5"], profiler=profiler)
+        self.assertTrue(poller.interfaces["10.0.1.5"].profiler is profiler)
+
+if __name__ == '__main__':
+    unittest.main()
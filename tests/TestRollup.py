@@ -0,0 +1,62 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the snapshot rollup
+"""
+
+import unittest
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface.rollup import Rollup, MINUTE, HOUR
+
+def makeSnapshot(timestamp, cook, output=50, status=0, host="pit"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=cook,
+                  COOK_STATUS=status, OUTPUT_PERCENT=output)
+    return Snapshot(**values)
+
+class TestRollup(unittest.TestCase):
+    """Test minute and hour aggregation"""
+
+    def testMinuteRow(self):
+        """Test a minute bucket closes when the next minute starts"""
+        rollup = Rollup(resolutions=(MINUTE,))
+        self.assertEqual(rollup.add(makeSnapshot(0, 2000, 40)), [])
+        rollup.add(makeSnapshot(30, 2200, 60, status=1))
+        rows = rollup.add(makeSnapshot(60, 2100))
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row.start, 0)
+        self.assertEqual(row.samples, 2)
+        self.assertEqual(row.minimums[0], 2000)
+        self.assertEqual(row.maximums[0], 2200)
+        self.assertEqual(row.means[0], 2100.0)
+        self.assertEqual(row.means[1], None)
+        self.assertEqual(row.outputPercent, 50.0)
+        self.assertEqual(row.statusSeconds[0], {0: 30, 1: 30})
+
+    def testHourAndSink(self):
+        """Test hour buckets accumulate while minutes are emitted"""
+        rows = []
+        rollup = Rollup(sink=rows.append)
+        for second in range(0, 3600, 10):
+            rollup.add(makeSnapshot(second, 2000 + second))
+        self.assertEqual(len(rows), 59)
+        self.assertTrue(all(row.resolution == MINUTE for row in rows))
+        rollup.flush()
+        hours = [row for row in rows if row.resolution == HOUR]
+        self.assertEqual(len(hours), 1)
+        self.assertEqual(hours[0].samples, 360)
+        self.assertEqual(hours[0].maximums[0], 2000 + 3590)
+
+    def testGapsAreNotCredited(self):
+        """Test long gaps do not count towards time in status"""
+        rollup = Rollup(resolutions=(HOUR,), maxGap=60)
+        rollup.add(makeSnapshot(0, 2000))
+        rollup.add(makeSnapshot(600, 2000))
+        row = rollup.flush("pit")[0]
+        self.assertEqual(row.statusSeconds[0], {})
+
+if __name__ == '__main__':
+    unittest.main()
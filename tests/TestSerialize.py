@@ -0,0 +1,93 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the JSON and msgpack snapshot encoders
+"""
+
+import json
+import unittest
+from lxml import objectify
+from cyberqinterface.simulator import CONFIG_XML
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS, decodeSnapshot
+from cyberqinterface.serialize import (snapshotToJSON, snapshotsToJSON,
+                                       snapshotsToJSONLines,
+                                       snapshotToMsgpack, snapshotsToMsgpack,
+                                       _packInt)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def makeSnapshot(timestamp, cook, food1=None, host="pit1"):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=cook,
+                  FOOD1_TEMP=food1, COOK_SET=2250, COOK_STATUS=0,
+                  OUTPUT_PERCENT=55, TIMER_CURR=600,
+                  COOK_NAME=u"Cr\xe8me \"Egg\"", FOOD1_NAME="Brisket")
+    return Snapshot(**values)
+
+def sample():
+    return [decodeSnapshot(objectify.fromstring(CONFIG_XML), "10.0.1.5",
+                           1350000000.25),
+            makeSnapshot(1350000005, -40, 1751),
+            makeSnapshot(1350000010.5, 100000, None, host=None)]
+
+class TestJSON(unittest.TestCase):
+    """Test snapshots encode to the JSON of their fields"""
+
+    def testRoundTrip(self):
+        """Test each object decodes to the snapshot's fields"""
+        for snapshot in sample():
+            text = snapshotToJSON(snapshot)
+            self.assertTrue(isinstance(text, str))
+            self.assertEqual(json.loads(text), snapshot._asdict())
+
+    def testSequences(self):
+        """Test arrays and newline delimited objects"""
+        snapshots = sample()
+        expected = [snapshot._asdict() for snapshot in snapshots]
+        self.assertEqual(json.loads(snapshotsToJSON(snapshots)), expected)
+        lines = snapshotsToJSONLines(snapshots).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+        self.assertEqual(snapshotsToJSON([]), "[]")
+
+class TestMsgpack(unittest.TestCase):
+    """Test the msgpack encoding"""
+
+    def testIntegers(self):
+        """Test integers use the smallest msgpack encoding"""
+        self.assertEqual(_packInt(None), "\xc0")
+        self.assertEqual(_packInt(5), "\x05")
+        self.assertEqual(_packInt(-1), "\xff")
+        self.assertEqual(_packInt(-40), "\xd0\xd8")
+        self.assertEqual(_packInt(200), "\xcc\xc8")
+        self.assertEqual(_packInt(-200), "\xd1\xff\x38")
+        self.assertEqual(_packInt(2250), "\xcd\x08\xca")
+        self.assertEqual(_packInt(100000), "\xce\x00\x01\x86\xa0")
+        self.assertEqual(_packInt(-100000), "\xd2\xff\xfe\x79\x60")
+        self.assertEqual(_packInt(2 ** 40), "\xd3" + "\x00\x00\x01" +
+                         "\x00" * 5)
+        self.assertEqual(_packInt(2 ** 63), "\xcf\x80" + "\x00" * 7)
+
+    def testMapHeader(self):
+        """Test a snapshot is a map of every field"""
+        data = snapshotToMsgpack(sample()[0])
+        self.assertEqual(data[:3], "\xde\x00" + chr(len(SNAPSHOT_FIELDS)))
+        self.assertEqual(data[3:8], "\xa4host")
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def testRoundTrip(self):
+        """Test msgpack reads back the snapshot's fields"""
+        snapshots = sample()
+        for snapshot in snapshots:
+            self.assertEqual(msgpack.unpackb(snapshotToMsgpack(snapshot),
+                                             raw=False),
+                             snapshot._asdict())
+        self.assertEqual(msgpack.unpackb(snapshotsToMsgpack(snapshots),
+                                         raw=False),
+                         [snapshot._asdict() for snapshot in snapshots])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for decoded snapshots
+"""
+
+import unittest
+from lxml import objectify
+from cyberqinterface.snapshot import decodeSnapshot
+
+STATUS_XML = """
+<nutcstatus>
+<!--all temperatures are displayed in tenths F, regardless of setting of unit-->
+<OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+<TIMER_CURR>00:00:00</TIMER_CURR>
+<COOK_TEMP>3343</COOK_TEMP>
+<FOOD1_TEMP>823</FOOD1_TEMP>
+<FOOD2_TEMP>OPEN</FOOD2_TEMP>
+<FOOD3_TEMP>OPEN</FOOD3_TEMP>
+<COOK_STATUS>0</COOK_STATUS>
+<FOOD1_STATUS>0</FOOD1_STATUS>
+<FOOD2_STATUS>4</FOOD2_STATUS>
+<FOOD3_STATUS>4</FOOD3_STATUS>
+<TIMER_STATUS>0</TIMER_STATUS>
+<DEG_UNITS>1</DEG_UNITS>
+<COOK_CYCTIME>6</COOK_CYCTIME>
+<COOK_PROPBAND>500</COOK_PROPBAND>
+<COOK_RAMP>0</COOK_RAMP>
+</nutcstatus>"""
+
+ALL_XML = """
+<nutcallstatus>
+<COOK>
+  <COOK_NAME>Big Green Egg</COOK_NAME>
+  <COOK_TEMP>3216</COOK_TEMP>
+  <COOK_SET>4000</COOK_SET>
+  <COOK_STATUS>0</COOK_STATUS>
+</COOK>
+<FOOD1>
+  <FOOD1_NAME>Chicken Quarters</FOOD1_NAME>
+  <FOOD1_TEMP>1482</FOOD1_TEMP>
+  <FOOD1_SET>1750</FOOD1_SET>
+  <FOOD1_STATUS>0</FOOD1_STATUS>
+</FOOD1>
+<OUTPUT_PERCENT>100</OUTPUT_PERCENT>
+<TIMER_CURR>00:00:00</TIMER_CURR>
+</nutcallstatus>"""
+
+class TestDecodeSnapshot(unittest.TestCase):
+    """Test decoding objectify trees into snapshots"""
+
+    def testDecodeStatus(self):
+        """Test the flat status document decodes with OPEN probes as None"""
+        snap = decodeSnapshot(objectify.fromstring(STATUS_XML), "pit", 10.0)
+        self.assertEqual(snap.host, "pit")
+        self.assertEqual(snap.timestamp, 10.0)
+        self.assertEqual(snap.COOK_TEMP, 3343)
+        self.assertEqual(snap.FOOD2_TEMP, None)
+        self.assertEqual(snap.FOOD2_STATUS, 4)
+        self.assertEqual(snap.OUTPUT_PERCENT, 100)
+        self.assertEqual(snap.COOK_SET, None)
+        self.assertEqual(snap.TIMER_CURR, 0)
+
+    def testDecodeAll(self):
+        """Test the nested all document decodes names and setpoints"""
+        snap = decodeSnapshot(objectify.fromstring(ALL_XML))
+        self.assertEqual(snap.COOK_NAME, "Big Green Egg")
+        self.assertEqual(snap.FOOD1_SET, 1750)
+        self.assertEqual(snap.FOOD1_TEMP, 1482)
+        self.assertNotEqual(snap.timestamp, None)
+
+    def testUnparsableTimer(self):
+        """Test a timer display that is not a time decodes as None"""
+        xml = STATUS_XML.replace("00:00:00", "--:--")
+        snap = decodeSnapshot(objectify.fromstring(xml), "pit", 10.0)
+        self.assertEqual(snap.TIMER_CURR, None)
+        self.assertEqual(snap.COOK_TEMP, 3343)
+
+if __name__ == '__main__':
+    unittest.main()
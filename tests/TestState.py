@@ -0,0 +1,37 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for decoded controller states
+"""
+
+import unittest
+from lxml import objectify
+from cyberqinterface.simulator import CONFIG_XML, STATUS_XML
+from cyberqinterface.state import decodeState, Control
+
+class TestDecodeState(unittest.TestCase):
+    """Test config.xml decodes into one consistent state"""
+
+    def testConfig(self):
+        """Test the CONTROL and SYSTEM blocks are decoded"""
+        state = decodeState(objectify.fromstring(CONFIG_XML), "pit", 4, 1.0)
+        self.assertEqual(state.version, 4)
+        self.assertEqual(state.snapshot.host, "pit")
+        self.assertEqual(state.snapshot.FOOD1_SET, 1750)
+        self.assertEqual(state.control,
+                         Control(TIMEOUT_ACTION=0, COOKHOLD=2000,
+                                 ALARMDEV=500, COOK_RAMP=0, OPENDETECT=1,
+                                 CYCTIME=6, PROPBAND=500))
+        self.assertEqual(state.system.LCD_BACKLIGHT, 47)
+
+    def testMissingBlocks(self):
+        """Test a document without settings leaves them None"""
+        state = decodeState(objectify.fromstring(STATUS_XML))
+        self.assertEqual(state.control.PROPBAND, None)
+        self.assertEqual(state.system.KEY_BEEPS, None)
+        self.assertEqual(state.snapshot.COOK_TEMP, 3343)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the server-sent events stream
+"""
+
+import json
+import threading
+import unittest
+import httplib
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface.stream import SnapshotStream
+
+def makeSnapshot(host, cook, timestamp=0):
+    values = dict.fromkeys(SNAPSHOT_FIELDS)
+    values.update(host=host, timestamp=timestamp, COOK_TEMP=cook,
+                  COOK_STATUS=0)
+    return Snapshot(**values)
+
+def decode(events):
+    return [json.loads(event.split("data: ")[1]) for event in events]
+
+class TestSnapshotStream(unittest.TestCase):
+    """Test deltas, coalescing and serving"""
+
+    def testDeltasOnlyCarryChanges(self):
+        """Test subscribers receive the changed fields"""
+        stream = SnapshotStream()
+        stream.update(makeSnapshot("pit1", 2000))
+        subscriber = stream.subscribe()
+        first = decode(subscriber.take(0))[0]
+        self.assertEqual(first["COOK_TEMP"], 2000)
+        self.assertEqual(first["COOK_STATUS"], 0)
+        stream.update(makeSnapshot("pit1", 2010, 1))
+        delta = decode(subscriber.take(0))[0]
+        self.assertEqual(delta["COOK_TEMP"], 2010)
+        self.assertFalse("COOK_STATUS" in delta)
+        stream.update(makeSnapshot("pit1", 2010, 2))
+        self.assertEqual(subscriber.take(0), [])
+
+    def testSlowSubscriberKeepsLatest(self):
+        """Test pending changes for a host are merged, not queued"""
+        stream = SnapshotStream()
+        subscriber = stream.subscribe()
+        for i in range(100):
+            stream.update(makeSnapshot("pit1", 2000 + i, i))
+        stream.update(makeSnapshot("pit2", 3000))
+        events = decode(subscriber.take(0))
+        self.assertEqual(len(events), 2)
+        latest = dict((event["host"], event) for event in events)
+        self.assertEqual(latest["pit1"]["COOK_TEMP"], 2099)
+        self.assertEqual(subscriber.dropped, 99)
+
+    def testServe(self):
+        """Test events reach an HTTP client"""
+        stream = SnapshotStream()
+        stream.update(makeSnapshot("pit1", 2000))
+        server = stream.start(0, "127.0.0.1")
+        try:
+            connection = httplib.HTTPConnection("127.0.0.1",
+                                                server.server_address[1])
+            connection.request("GET", "/events")
+            response = connection.getresponse()
+            self.assertEqual(response.getheader("Content-Type"),
+                             "text/event-stream")
+            self.assertEqual(response.fp.readline(), "event: snapshot\n")
+            data = json.loads(response.fp.readline()[len("data: "):])
+            self.assertEqual(data["host"], "pit1")
+            connection.close()
+        finally:
+            stream.stop()
+
+    def testSubscribeDuringUpdates(self):
+        """Test a subscriber never misses a change made while it joins"""
+        stream = SnapshotStream()
+        done = threading.Event()
+        def updates():
+            for i in range(2000):
+                stream.update(makeSnapshot("pit1", i, i))
+            done.set()
+        thread = threading.Thread(target=updates)
+        thread.start()
+        subscribers = []
+        while not done.is_set() and len(subscribers) < 200:
+            subscribers.append(stream.subscribe())
+        thread.join()
+        for subscriber in subscribers:
+            latest = {}
+            for event in decode(subscriber.take(0)):
+                latest.update(event)
+            self.assertEqual(latest["COOK_TEMP"], 1999)
+
+    def testManyClientsOneThread(self):
+        """Test clients are served without a thread each"""
+        stream = SnapshotStream()
+        stream.update(makeSnapshot("pit1", 2000))
+        server = stream.start(0, "127.0.0.1")
+        threads = threading.active_count()
+        connections = []
+        try:
+            for i in range(50):
+                connection = httplib.HTTPConnection("127.0.0.1",
+                                                    server.server_address[1])
+                connection.request("GET", "/events")
+                connections.append(connection.getresponse())
+            for response in connections:
+                self.assertEqual(response.fp.readline(), "event: snapshot\n")
+                response.fp.readline()
+                response.fp.readline()
+            self.assertEqual(threading.active_count(), threads)
+            stream.update(makeSnapshot("pit1", 2010, 1))
+            for response in connections:
+                self.assertEqual(response.fp.readline(), "event: snapshot\n")
+                data = json.loads(response.fp.readline()[len("data: "):])
+                self.assertEqual(data["COOK_TEMP"], 2010)
+        finally:
+            stream.stop()
+        self.assertEqual(stream.subscribers, set())
+
+    def testUnknownPath(self):
+        """Test other paths are answered with 404"""
+        stream = SnapshotStream()
+        server = stream.start(0, "127.0.0.1")
+        try:
+            connection = httplib.HTTPConnection("127.0.0.1",
+                                                server.server_address[1])
+            connection.request("GET", "/status")
+            response = connection.getresponse()
+            self.assertEqual(response.status, 404)
+            response.read()
+            connection.close()
+        finally:
+            stream.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the timer codec
+"""
+
+import unittest
+from cyberqinterface.timer import (parseTimer, parseTimers, encodeTimer,
+                                   timerParameters)
+from cyberqinterface.cyberqinterface_exceptions import *
+
+class TestTimer(unittest.TestCase):
+    """Test parsing and encoding of HH:MM:SS timers"""
+
+    def testParse(self):
+        """Test the fixed layout and long hours"""
+        self.assertEqual(parseTimer("00:00:00"), 0)
+        self.assertEqual(parseTimer("01:30:15"), 5415)
+        self.assertEqual(parseTimer("100:00:01"), 360001)
+
+    def testParseInvalid(self):
+        """Test malformed timers raise a validation error"""
+        for text in ("", "1:2", "aa:bb:cc", None):
+            with self.assertRaises(ResponseValidationException):
+                parseTimer(text)
+
+    def testParseColumn(self):
+        """Test the bulk parser keeps order and missing values"""
+        self.assertEqual(parseTimers(["00:00:10", None, "00:00:10",
+                                      "12:00:00"]),
+                         [10, None, 10, 43200])
+
+    def testEncode(self):
+        """Test durations round trip through both timer keys"""
+        self.assertEqual(encodeTimer(5415), "01:30:15")
+        self.assertEqual(parseTimer(encodeTimer(123456)), 123456)
+        self.assertEqual(timerParameters(90 * 60),
+                         {"_COOK_TIMER": "01:30:00",
+                          "COOK_TIMER": "01:30:00"})
+        with self.assertRaises(ParameterValidationException):
+            encodeTimer(-1)
+
+if __name__ == '__main__':
+    unittest.main()
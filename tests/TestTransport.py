@@ -0,0 +1,207 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the HTTP transports
+"""
+
+import threading
+import time
+import unittest
+from cyberqinterface.cyberqinterface import CyberQInterface
+from cyberqinterface.cyberqinterface_exceptions import *
+from cyberqinterface.simulator import SimulatedCyberQ, STATUS_XML
+from cyberqinterface.transport import (RequestsTransport, SocketTransport,
+                                       FakeTransport, AsyncTransport,
+                                       ScheduledTransport)
+
+class TestNetworkTransports(unittest.TestCase):
+    """Test the real transports against the local simulator"""
+
+    def setUp(self):
+        self.simulator = SimulatedCyberQ().start()
+
+    def tearDown(self):
+        self.simulator.stop()
+
+    def checkTransport(self, transport):
+        cqi = CyberQInterface(self.simulator.host, transport=transport)
+        self.assertEqual(cqi.getStatusXML(), STATUS_XML)
+        self.assertEqual(cqi.getStatus().COOK_TEMP, 3343)
+        self.assertEqual(cqi.getConfig().CONTROL.OPENDETECT, 1)
+        self.assertTrue(cqi.sendUpdate({"COOK_SET": "250",
+                                        "COOK_TIMER": "01:00:00"}))
+        self.assertEqual(self.simulator.updates[-1],
+                         {"COOK_SET": "250", "COOK_TIMER": "01:00:00"})
+        with self.assertRaises(ResponseHTTPException):
+            cqi._getResponseXML("missing.xml")
+        transport.close()
+
+    def testRequests(self):
+        """Test the default requests transport"""
+        self.checkTransport(RequestsTransport())
+
+    def testPooledRequests(self):
+        """Test the keep-alive session transport"""
+        self.checkTransport(RequestsTransport(pooled=True))
+
+    def testSocket(self):
+        """Test the raw socket transport"""
+        self.checkTransport(SocketTransport())
+
+    def testSocketPreparedRequests(self):
+        """Test GET requests are built once per URL"""
+        transport = SocketTransport()
+        url = "http://%s/status.xml" % self.simulator.host
+        first = transport.get(url)
+        request = transport._requests[url]
+        second = transport.get(url)
+        self.assertTrue(transport._requests[url] is request)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(transport._requests), 1)
+
+    def testSocketLargeResponse(self):
+        """Test the receive buffer grows for documents larger than it"""
+        document = STATUS_XML.replace("</nutcstatus>",
+                                      "<!-- %s --></nutcstatus>" %
+                                      ("x" * 100000))
+        self.simulator.documents["status.xml"] = document
+        results = []
+
+        def fetch():
+            transport = SocketTransport(bufferSize=256)
+            url = "http://%s/status.xml" % self.simulator.host
+            results.append(transport.get(url).content)
+            results.append(transport.get(
+                "http://%s/config.xml" % self.simulator.host).content)
+
+        # A new thread starts with a fresh, small buffer
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        thread.join()
+        self.assertEqual(results[0], document)
+        self.assertEqual(results[1], self.simulator.documents["config.xml"])
+
+class TestFakeTransport(unittest.TestCase):
+    """Test the in-memory transport"""
+
+    def testServesDocuments(self):
+        """Test documents and posts stay in memory"""
+        fake = FakeTransport({"status.xml": STATUS_XML})
+        cqi = CyberQInterface("pit1", transport=fake)
+        self.assertEqual(cqi.getStatus().FOOD1_TEMP, 823)
+        cqi.sendUpdate({"COOK_SET": "250"})
+        self.assertEqual(fake.posts, [{"COOK_SET": "250"}])
+        with self.assertRaises(ResponseHTTPException):
+            cqi.getConfig()
+
+class TestAsyncTransport(unittest.TestCase):
+    """Test callbacks from the threaded wrapper"""
+
+    def testCallbacks(self):
+        """Test responses and errors reach the callback"""
+        results = []
+        done = threading.Event()
+        def callback(response, error):
+            results.append((response, error))
+            if len(results) == 2:
+                done.set()
+        fake = AsyncTransport(FakeTransport({"status.xml": STATUS_XML}))
+        fake.get("http://pit1/status.xml", callback)
+        sockets = AsyncTransport(SocketTransport(), workers=1)
+        sockets.get("ftp://pit1/status.xml", callback)
+        done.wait(5)
+        responses = [response for response, error in results if response]
+        errors = [error for response, error in results if error]
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertTrue(isinstance(errors[0], ValueError))
+
+    def testFailingCallback(self):
+        """Test a callback that raises does not stop its worker"""
+        results = []
+        def callback(response, error):
+            results.append(response)
+            if len(results) == 1:
+                raise RuntimeError("listener bug")
+        transport = AsyncTransport(FakeTransport({"status.xml": STATUS_XML}),
+                                   workers=1)
+        transport.get("http://pit1/status.xml", callback)
+        transport.get("http://pit1/status.xml", callback)
+        transport.close()
+        self.assertEqual(len(results), 2)
+        self.assertEqual(transport.metrics["callbackErrors"], 1)
+        self.assertTrue(isinstance(transport.callbackError, RuntimeError))
+        self.assertRaises(ValueError, transport.get,
+                          "http://pit1/status.xml", callback)
+
+class RecordingTransport(FakeTransport):
+    """Records the order requests run in and how many overlap"""
+
+    def __init__(self, latency):
+        FakeTransport.__init__(self, {"status.xml": STATUS_XML,
+                                      "config.xml": STATUS_XML},
+                               latency=latency)
+        self.order = []
+        self.active = 0
+        self.overlap = 0
+        self.lock = threading.Lock()
+
+    def _respond(self, url, content):
+        with self.lock:
+            self.order.append(url)
+            self.active += 1
+            self.overlap = max(self.overlap, self.active)
+        try:
+            return FakeTransport._respond(self, url, content)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+class TestScheduledTransport(unittest.TestCase):
+    """Test per host serialization, rate limiting and priorities"""
+
+    def start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        time.sleep(0.05)
+        return thread
+
+    def testPriorities(self):
+        """Test waiting writes go first, then status, then config"""
+        fake = RecordingTransport(latency=0.2)
+        transport = ScheduledTransport(fake, rate=100, burst=10)
+        threads = [self.start(transport.get, "http://pit1/status.xml"),
+                   self.start(transport.get, "http://pit1/config.xml"),
+                   self.start(transport.get, "http://pit1/status.xml"),
+                   self.start(transport.post, "http://pit1/", {})]
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fake.order, ["http://pit1/status.xml",
+                                      "http://pit1/",
+                                      "http://pit1/status.xml",
+                                      "http://pit1/config.xml"])
+        self.assertEqual(fake.overlap, 1)
+        self.assertEqual(transport.metrics["requests"], 4)
+
+    def testRateLimit(self):
+        """Test requests beyond the burst are spaced by the rate"""
+        transport = ScheduledTransport(RecordingTransport(latency=0),
+                                       rate=20, burst=2)
+        started = time.time()
+        for i in range(6):
+            transport.get("http://pit1/status.xml")
+        self.assertTrue(time.time() - started >= 0.19)
+
+    def testHostsAreIndependent(self):
+        """Test different hosts are served concurrently"""
+        fake = RecordingTransport(latency=0.2)
+        transport = ScheduledTransport(fake)
+        threads = [self.start(transport.get, "http://pit%d/status.xml" % i)
+                   for i in range(3)]
+        for thread in threads:
+            thread.join()
+        self.assertEqual(fake.overlap, 3)
+
+if __name__ == '__main__':
+    unittest.main()
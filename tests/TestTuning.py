@@ -0,0 +1,123 @@
+# CyberQInterface
+# Copyright 2012-2013 The Brilliant Idea
+# See LICENSE for details.
+
+"""
+Test Cases for the tuning analyzer
+"""
+
+import math
+import unittest
+from cyberqinterface.tuning import (analyzeCook, analyzeCooks,
+                                    TuningMonitor)
+from cyberqinterface.snapshot import Snapshot, SNAPSHOT_FIELDS
+from cyberqinterface.simulator import CONFIG_XML
+from cyberqinterface.state import decodeState
+from lxml import objectify
+
+def oscillating(seconds=7200, period=600, amplitude=150):
+    """Pit heating to 225 then swinging +-15 degrees"""
+    times = range(0, seconds, 10)
+    temps = []
+    for t in times:
+        if t < 1200:
+            temps.append(700 + int(1550 * t / 1200.0))
+        else:
+            temps.append(2250 + int(amplitude *
+                                    math.sin(2 * math.pi * (t - 1200) /
+                                             period)))
+    outputs = [100 if temp < 2250 else 0 for temp in temps]
+    return times, temps, [2250] * len(times), outputs
+
+def steady(seconds=7200):
+    """Pit creeping up to 225 without overshoot"""
+    times = range(0, seconds, 10)
+    temps = [2250 - int(1550 * math.exp(-t / 900.0)) for t in times]
+    outputs = [max(10, min(100, (2250 - temp) / 10)) for temp in temps]
+    return times, temps, [2250] * len(times), outputs
+
+class TestAnalyzeCook(unittest.TestCase):
+    """Test step measurements and recommendations"""
+
+    def testOscillation(self):
+        """Test an oscillating pit gets a wider PROPBAND"""
+        analysis = analyzeCook(*oscillating(), propband=200, cyctime=6)
+        self.assertEqual(len(analysis.steps), 1)
+        self.assertAlmostEqual(analysis.overshoot, 15.0, 0)
+        self.assertAlmostEqual(analysis.period, 600, -1)
+        self.assertEqual(analysis.settlingTime, None)
+        self.assertTrue(40 < analysis.idle < 60)
+        self.assertEqual(analysis.parameters, {"PROPBAND": "25"})
+
+    def testSluggish(self):
+        """Test a slow pit without overshoot gets a narrower PROPBAND"""
+        analysis = analyzeCook(*steady(), propband=500, cyctime=6)
+        self.assertEqual(analysis.overshoot, 0.0)
+        self.assertEqual(analysis.period, None)
+        self.assertTrue(3000 < analysis.settlingTime < 3200)
+        self.assertTrue(0 < analysis.saturated < 10)
+        self.assertEqual(analysis.parameters,
+                         {"PROPBAND": "40", "CYCTIME": "5"})
+
+    def testSteps(self):
+        """Test every COOK_SET change starts a new step"""
+        times, temps, sets, outputs = steady()
+        half = len(sets) // 2
+        sets = sets[:half] + [2750] * (len(sets) - half)
+        analysis = analyzeCook(times, temps, sets, outputs)
+        self.assertEqual([step.setpoint for step in analysis.steps],
+                         [225.0, 275.0])
+        self.assertEqual(analysis.parameters, {})
+
+    def testControllerSettings(self):
+        """Test PROPBAND and CYCTIME read from config.xml are accepted"""
+        control = decodeState(objectify.fromstring(CONFIG_XML)).control
+        self.assertEqual(control.PROPBAND, 500)
+        analysis = analyzeCook(*oscillating(), propband=control.PROPBAND,
+                               cyctime=control.CYCTIME)
+        self.assertEqual(analysis.parameters["PROPBAND"], "63")
+
+    def testChatteringFan(self):
+        """Test a fan switching every sample gets a longer CYCTIME"""
+        times, temps, sets, outputs = steady()
+        outputs = [100 * (i % 2) for i in range(len(outputs))]
+        analysis = analyzeCook(times, temps, sets, outputs, cyctime=6)
+        self.assertEqual(analysis.parameters, {"CYCTIME": "8"})
+
+class TestSnapshots(unittest.TestCase):
+    """Test analysis of recorded and live snapshots"""
+
+    def snapshots(self, host="pit"):
+        snapshots = []
+        for t, temp, target, output in zip(*oscillating()):
+            values = dict.fromkeys(SNAPSHOT_FIELDS)
+            values.update(host=host, timestamp=t, COOK_TEMP=temp,
+                          COOK_SET=target, OUTPUT_PERCENT=output)
+            snapshots.append(Snapshot(**values))
+        return snapshots
+
+    def testAnalyzeCooks(self):
+        """Test many cooks are analyzed by name"""
+        results = analyzeCooks({"a": self.snapshots(),
+                                "b": self.snapshots()}, propband=200)
+        self.assertEqual(sorted(results.keys()), ["a", "b"])
+        self.assertEqual(results["a"].parameters, {"PROPBAND": "25"})
+
+    def testMonitor(self):
+        """Test the listener keeps a bounded history"""
+        monitor = TuningMonitor(maxSamples=100)
+        for snapshot in self.snapshots():
+            monitor.update(snapshot)
+        self.assertEqual(len(monitor.history["pit"]), 100)
+        self.assertEqual(monitor.analyze("missing"), None)
+        self.assertEqual(len(monitor.analyze("pit").steps), 1)
+
+    def testMonitorWithoutSetpoints(self):
+        """Test a history without COOK_SET, as read from status.xml, raises"""
+        monitor = TuningMonitor()
+        for snapshot in self.snapshots():
+            monitor.update(snapshot._replace(COOK_SET=None))
+        self.assertRaises(ValueError, monitor.analyze, "pit")
+
+if __name__ == '__main__':
+    unittest.main()